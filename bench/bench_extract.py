@@ -0,0 +1,46 @@
+"""
+Бенчмарк извлечения объявлений со страниц результатов OLX.
+
+Сравнивает скорость (карточек в секунду) двух способов на сохранённых страницах:
+- state — чтение JSON-состояния (window.__PRERENDERED_STATE__);
+- dom   — BeautifulSoup + CSS-селекторы (старый способ).
+
+Запуск:
+    python -m bench.bench_extract saved_page1.html saved_page2.html --repeat 20
+"""
+
+import argparse
+import time
+
+from bot.extract import parse_state_listings, parse_dom_listings
+
+
+def bench(parser, pages, repeat):
+    cards = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            cards += len(parser(html) or [])
+    elapsed = time.perf_counter() - started
+    return cards, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("pages", nargs="+", help="сохранённые HTML-страницы результатов OLX")
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+
+    for name, parser in (("state", parse_state_listings), ("dom", parse_dom_listings)):
+        cards, elapsed = bench(parser, pages, args.repeat)
+        rate = cards / elapsed if elapsed else 0
+        print(f"{name:>5}: {cards} cards in {elapsed:.3f}s -> {rate:.0f} cards/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Бенчмарк сборки коллажа: старый путь против нового (bot.images).
+
+- legacy — полное декодирование Image.open(...).convert('RGB'), затем thumbnail, gc.collect()
+  после коллажа и кодирование JPEG в отдельный буфер (как было в scraper.py);
+- draft  — декодирование JPEG сразу в масштабе миниатюры (draft-режим) и кодирование коллажа
+  в буфер отправки (bot.images.load_thumbnail / create_collage / encode_collage).
+
+Каждый режим запускается в отдельном процессе, чтобы пиковый RSS (ru_maxrss) не смешивался.
+Изображения берутся из переданных файлов; если файлов нет — генерируются JPEG размера --size
+(по умолчанию 600x300 — в этом размере фото запрашиваются у OLX, bot.extract.PHOTO_SIZE).
+Сеть не используется: сравнивается только декодирование, сборка и кодирование.
+
+Запуск:
+    python -m bench.bench_images [photo1.jpg photo2.jpg ...] --collages 20
+    python -m bench.bench_images --size 1200x1600   # крупные оригиналы
+"""
+
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+THUMB_SIZE = (300, 400)
+
+
+def synthetic_images(count=6, size=(600, 300)):
+    images = []
+    for i in range(count):
+        img = Image.linear_gradient("L").resize(size).convert("RGB")
+        img = Image.merge("RGB", (img.getchannel(0), img.getchannel(1).rotate(90 * i), img.getchannel(2)))
+        bio = BytesIO()
+        img.save(bio, "JPEG", quality=90)
+        images.append(bio.getvalue())
+    return images
+
+
+def legacy_collage(blobs):
+    from bot.images import create_collage
+
+    images = []
+    for data in blobs:
+        img = Image.open(BytesIO(data)).convert('RGB')
+        img.thumbnail(THUMB_SIZE)
+        images.append(img)
+    collage = create_collage(images)
+    del images
+    gc.collect()
+    bio = BytesIO()
+    collage.save(bio, 'JPEG')
+    bio.seek(0)
+    return bio
+
+
+def draft_collage(blobs):
+    from bot.images import load_thumbnail, create_collage, encode_collage
+
+    images = [load_thumbnail(data, THUMB_SIZE) for data in blobs]
+    return encode_collage(create_collage(images))
+
+
+def run_mode(mode, blobs, collages):
+    build = legacy_collage if mode == "legacy" else draft_collage
+    started = time.perf_counter()
+    for _ in range(collages):
+        build(blobs).close()
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux — в килобайтах
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"mode": mode, "ms_per_collage": elapsed * 1000 / collages, "peak_rss_mb": peak_rss_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", help="файлы изображений (до 6 штук на коллаж)")
+    parser.add_argument("--collages", type=int, default=20)
+    parser.add_argument("--size", default="600x300", help="размер синтетических изображений, ШxВ")
+    parser.add_argument("--mode", choices=["legacy", "draft"], help="внутренний параметр: запуск одного режима")
+    args = parser.parse_args()
+
+    if args.mode:
+        size = tuple(int(v) for v in args.size.split("x"))
+        blobs = [open(p, "rb").read() for p in args.images[:6]] or synthetic_images(size=size)
+        print(json.dumps(run_mode(args.mode, blobs, args.collages)))
+        return
+
+    for mode in ("legacy", "draft"):
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "bench.bench_images", *args.images,
+                "--collages", str(args.collages), "--size", args.size, "--mode", mode,
+            ],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{mode:>6}: {result['ms_per_collage']:.1f} ms/collage, peak RSS {result['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Офлайн-бенчмарк всего конвейера: обход страниц → разбор карточек → загрузка описаний и коллажи → отправка.
+
+Сеть и настоящая база не используются: olx.ua, CDN изображений и Telegram Bot API подменяет
+локальный сервер (bench.stubs) с корпусом страниц (bench.corpus), база — временный файл SQLite
+(или DATABASE_URL из --database-url, например локальный PostgreSQL).
+Ограничения частоты OLX и Telegram отключаются: замеряется стоимость самого конвейера.
+
+Этапы и метрики:
+- get_links    — карточек в секунду, запросов к базе: старый постраничный обход, только для сравнения;
+- crawl        — карточек в секунду, запросов к базе: рабочий обход scraper.crawl_all по реестру поисков
+                 (один поиск бенчмарка); перед ним база и фильтр Блума очищаются от карточек get_links;
+- parse_card   — карточек в секунду (DOM-разбор, bot.extract.parse_dom_listings);
+- enrich       — страниц объявлений в секунду (update_missing_descriptions_and_images), запросов к базе;
+- collage      — миллисекунд на коллаж (миниатюры + create_collage + encode_collage);
+- send         — сообщений в секунду (outbox → очередь Telegram → локальный Bot API);
+после каждого этапа — пиковый RSS процесса.
+
+С --baseline результаты сравниваются с сохранённым прогоном (--json): при ухудшении больше
+чем на --tolerance процесс завершается с кодом 1, чтобы регрессия была видна до деплоя.
+
+Запуск:
+    python -m bench.bench_pipeline                       # синтетический корпус 5 x 40 объявлений
+    python -m bench.bench_pipeline --corpus bench_corpus --json bench_result.json
+    python -m bench.bench_pipeline --baseline bench_result.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Метрики, которые должны расти (остальные — затраты, которые должны падать)
+HIGHER_IS_BETTER = {
+    "get_links_cards_per_sec", "crawl_cards_per_sec", "parse_card_cards_per_sec", "enrich_pages_per_sec", "send_per_sec",
+}
+# Таблицы, которые заполняет обход; очищаются между get_links и crawl
+CRAWL_TABLES = ("listings", "listing_searches", "listing_history", "crawl_state", "price_stats")
+
+
+def configure_env(origin, database_url, workdir, pages=5):
+    # До импорта bot.*: модули читают настройки при импорте
+    searches_path = os.path.join(workdir, "searches.json")
+    with open(searches_path, "w", encoding="utf-8") as f:
+        # Фильтры и чаты — по умолчанию (FILTERS_PATH, CHAT_ID); обход не зависит от рабочего реестра
+        json.dump({"searches": [{"name": "bench", "url": "/uk/nedvizhimost/kvartiry/kiev/"}]}, f)
+    os.environ.update({
+        "SEARCHES_PATH": searches_path,
+        "CRAWL_MAX_PAGES": str(pages),
+        "OLX_ORIGIN": origin,
+        "DATABASE_URL": database_url,
+        "BOT_TOKEN": "123456:bench",
+        "CHAT_ID": "1", "CHAT_ID_15_20K": "2", "CHAT_ID_20_25K": "3",
+        "TG_GLOBAL_RATE": "100000", "TG_CHAT_INTERVAL": "0",
+        "TTN_BUDGET_SECONDS": "1e9",
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+        # Синтетический корпус собирает фото объявлений из общего небольшого набора
+        "DEDUP_MIN_SHARED_PHOTOS": "0",
+    })
+
+
+class StatementCounter:
+    """
+    Считает запросы к базе: оборачивает execute/executemany курсора SQLite, а для PostgreSQL
+    выдаёт соединениям пула курсор psycopg2 со счётчиком (execute_values — по запросу на страницу).
+    """
+
+    def __init__(self):
+        from bot import db
+
+        self.count = 0
+        if db.is_sqlite():
+            self.count_sqlite(db)
+        else:
+            self.count_psycopg2(db)
+
+    def count_sqlite(self, db):
+        cursor_cls = db.SqliteCursor
+        execute, executemany = cursor_cls.execute, cursor_cls.executemany
+
+        def counted_execute(cursor, query, params=()):
+            if query not in ("BEGIN", "COMMIT", "ROLLBACK"):
+                self.count += 1
+            return execute(cursor, query, params)
+
+        def counted_executemany(cursor, query, seq):
+            self.count += 1
+            return executemany(cursor, query, seq)
+
+        cursor_cls.execute, cursor_cls.executemany = counted_execute, counted_executemany
+
+    def count_psycopg2(self, db):
+        from psycopg2.extensions import cursor as base_cursor
+
+        counter = self
+
+        class CountingCursor(base_cursor):
+            def execute(self, query, vars=None):
+                counter.count += 1
+                return super().execute(query, vars)
+
+            def executemany(self, query, vars_list):
+                counter.count += 1
+                return super().executemany(query, vars_list)
+
+        getconn = db._getconn
+
+        def counted_getconn():
+            conn = getconn()
+            conn.cursor_factory = CountingCursor  # conn.cursor() без аргументов создаёт курсор этого класса
+            return conn
+
+        db._getconn = counted_getconn
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def count_rows(query):
+    from bot import db
+
+    with db.transaction() as cur:
+        cur.execute(query)
+        return cur.fetchone()[0]
+
+
+def clear_crawl_tables():
+    from bot import bloom, db
+
+    with db.transaction() as cur:
+        for table in CRAWL_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+    bloom._seen = None  # загрузится заново, уже без карточек get_links
+
+
+def run(corpus_dir, pages, collages):
+    from bot import db, scraper, outbox, telegram_bot
+    from bot.extract import parse_dom_listings
+    from bot.images import load_thumbnail, create_collage, encode_collage
+
+    results = {}
+    db.init_schema()
+    statements = StatementCounter()
+
+    # get_links: старый постраничный обход — точка отсчёта для crawl
+    started, before = time.perf_counter(), statements.count
+    scraper.get_links(pages)
+    elapsed = time.perf_counter() - started
+    results["get_links_cards_per_sec"] = count_rows("SELECT COUNT(*) FROM listings") / elapsed
+    results["get_links_db_statements"] = statements.count - before
+    results["get_links_peak_rss_mb"] = peak_rss_mb()
+
+    # crawl: рабочий обход с пустой базы — инкрементальный, по реестру поисков, с привязкой карточек к поиску
+    clear_crawl_tables()
+    started, before = time.perf_counter(), statements.count
+    scraper.crawl_all()
+    elapsed = time.perf_counter() - started
+    cards = count_rows("SELECT COUNT(*) FROM listings")
+    results["crawl_cards_per_sec"] = cards / elapsed
+    results["crawl_db_statements"] = statements.count - before
+    results["crawl_peak_rss_mb"] = peak_rss_mb()
+
+    # parse_card: DOM-разбор тех же страниц
+    result_dir = os.path.join(corpus_dir, "results")
+    htmls = []
+    for name in sorted(os.listdir(result_dir))[:pages]:
+        with open(os.path.join(result_dir, name), encoding="utf-8") as f:
+            htmls.append(f.read())
+    started = time.perf_counter()
+    parsed = sum(len(parse_dom_listings(html)) for html in htmls)
+    results["parse_card_cards_per_sec"] = parsed / (time.perf_counter() - started)
+    results["parse_card_peak_rss_mb"] = peak_rss_mb()
+
+    # enrich: страницы объявлений, фильтры по описанию, изображения и коллажи, запись в outbox
+    started, before = time.perf_counter(), statements.count
+    scraper.update_missing_descriptions_and_images()
+    elapsed = time.perf_counter() - started
+    enriched = count_rows("SELECT COUNT(*) FROM listings WHERE description IS NOT NULL")
+    results["enrich_pages_per_sec"] = enriched / elapsed
+    results["enrich_db_statements"] = statements.count - before
+    results["enrich_peak_rss_mb"] = peak_rss_mb()
+
+    # collage: отдельно от сети — миниатюры, сборка и кодирование
+    image_dir = os.path.join(corpus_dir, "images")
+    blobs = []
+    for name in sorted(os.listdir(image_dir))[:6]:
+        with open(os.path.join(image_dir, name), "rb") as f:
+            blobs.append(f.read())
+    started = time.perf_counter()
+    for _ in range(collages):
+        encode_collage(create_collage([load_thumbnail(data, (300, 400)) for data in blobs]))
+    results["collage_ms"] = (time.perf_counter() - started) / collages * 1000
+    results["collage_peak_rss_mb"] = peak_rss_mb()
+
+    # send: outbox → очередь Telegram → локальный Bot API
+    started = time.perf_counter()
+    sent, _ = outbox.drain_outbox()
+    telegram_bot.flush()
+    results["send_per_sec"] = sent / (time.perf_counter() - started) if sent else 0.0
+    results["send_peak_rss_mb"] = peak_rss_mb()
+
+    results.update({"cards": cards, "enriched": enriched, "sent": sent})
+    db.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, base in baseline.items():
+        value = results.get(key)
+        if key not in results or not base or key in ("cards", "enriched", "sent"):
+            continue
+        change = (value - base) / base
+        worse = -change if key in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append(f"{key}: {base:.1f} -> {value:.1f} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--corpus", help="каталог корпуса (bench.corpus); по умолчанию — синтетический")
+    arg_parser.add_argument("--pages", type=int, default=5)
+    arg_parser.add_argument("--per-page", type=int, default=40, help="для синтетического корпуса")
+    arg_parser.add_argument("--collages", type=int, default=20)
+    arg_parser.add_argument("--database-url", help="по умолчанию — временный файл SQLite")
+    arg_parser.add_argument("--json", help="сохранить результаты в файл")
+    arg_parser.add_argument("--baseline", help="сравнить с сохранённым прогоном")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2)
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] %(name)s - %(message)s')
+
+    from bench import corpus, stubs
+
+    workdir = tempfile.mkdtemp(prefix="olx-bench-")
+    corpus_dir = args.corpus
+    if corpus_dir is None:
+        corpus_dir = os.path.join(workdir, "corpus")
+        corpus.synthetic(corpus_dir, args.pages, args.per_page)
+
+    server = stubs.start_server(corpus_dir)
+    configure_env(server.origin, args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}", workdir, args.pages)
+
+    import telebot.apihelper
+    telebot.apihelper.API_URL = server.origin + "/bot{0}/{1}"
+
+    try:
+        results = run(corpus_dir, args.pages, args.collages)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for key, value in results.items():
+        print(f"{key:>26}: {value:.1f}" if isinstance(value, float) else f"{key:>26}: {value}")
+    print(f"{'telegram_calls':>26}: {dict(server.telegram_calls)}")
+    print(f"{'telegram_upload_kb':>26}: {server.telegram_bytes / 1024:.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Корпус страниц OLX для офлайн-бенчмарка (bench.bench_pipeline).
+
+Структура каталога корпуса:
+    results/page_<N>.html  — страницы результатов поиска (JSON-состояние и DOM-карточки);
+    detail/<id>.html       — страницы объявлений;
+    images/<name>.jpg      — фотографии объявлений.
+Вместо адреса локального сервера в файлах стоит {ORIGIN}; сервер (bench.stubs) подставляет его при отдаче.
+
+Корпус можно сгенерировать (synthetic) или записать с живого olx.ua (record):
+    python -m bench.corpus synthetic bench_corpus --pages 5 --per-page 40
+    python -m bench.corpus record bench_corpus --pages 3
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from html import escape
+from io import BytesIO
+
+from PIL import Image
+
+ORIGIN = "{ORIGIN}"
+DISTRICTS = [
+    "Печерський", "Оболонський", "Шевченківський", "Солом'янський", "Голосіївський",
+    "Дарницький", "Деснянський", "Подільський",
+]
+
+
+def results_page(ads):
+    # Страница результатов: JSON-состояние (основной путь) и DOM-карточки (для parse_card)
+    state = {"listing": {"listing": {"ads": ads}}}
+    cards = []
+    for ad in ads:
+        cards.append(
+            f'<div data-cy="l-card" id="{ad["id"]}">'
+            f'<a class="css-1tqlkj0" href="{ad["url"]}"><h4>{escape(ad["title"])}</h4></a>'
+            f'<p data-testid="ad-price">{escape(ad["price"]["displayValue"])}</p>'
+            f'<p data-testid="location-date">Київ, {ad["location"]["districtName"]} - Сьогодні о 10:00</p>'
+            f'<img class="css-8wsg1m" src="{ad["photos"][0] if ad["photos"] else ""}"></div>'
+        )
+    return (
+        "<html><head><script>window.__PRERENDERED_STATE__ = "
+        f"{json.dumps(json.dumps(state, ensure_ascii=False), ensure_ascii=False)};</script></head>"
+        f"<body>{''.join(cards)}</body></html>"
+    )
+
+
+def detail_page(description, img_urls):
+    slides = "".join(f'<div class="swiper-zoom-container"><img src="{url}"></div>' for url in img_urls)
+    return (
+        '<html><body><div data-testid="ad_description">'
+        f'<div class="css-19duwlz">{escape(description)}</div></div>{slides}</body></html>'
+    )
+
+
+def synthetic_image(seed, size=(600, 300)):
+    # Размер, в котором фото запрашиваются у OLX (bot.extract.PHOTO_SIZE)
+    img = Image.linear_gradient("L").resize(size).rotate(seed * 37 % 360)
+    img = Image.merge("RGB", (img, img.transpose(Image.Transpose.FLIP_LEFT_RIGHT), img.point(lambda v: 255 - v)))
+    bio = BytesIO()
+    img.save(bio, "JPEG", quality=85)
+    return bio.getvalue()
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+        f.write(data)
+
+
+def synthetic(out_dir, pages=5, per_page=40, images_per_listing=6, image_pool=12, seed=1):
+    """
+    Генерирует корпус: pages страниц по per_page объявлений, у каждого images_per_listing фото
+    (из общего набора image_pool файлов). Объявления свежие, районы и цены разные,
+    так что часть карточек отсекают фильтры из filters.json.
+    """
+    rng = random.Random(seed)
+    for i in range(image_pool):
+        write(os.path.join(out_dir, "images", f"photo_{i}.jpg"), synthetic_image(i))
+
+    now = datetime.now(timezone.utc)
+    listing_id = 900_000_000
+    for page in range(1, pages + 1):
+        ads = []
+        for _ in range(per_page):
+            listing_id += 1
+            price = rng.randrange(6000, 30000, 500)
+            photos = [f"{ORIGIN}/images/photo_{rng.randrange(image_pool)}.jpg" for _ in range(images_per_listing)]
+            ads.append({
+                "id": listing_id,
+                "title": f"Квартира {rng.randint(1, 3)}-кімнатна, {rng.randint(25, 90)} м²",
+                "url": f"{ORIGIN}/{listing_id}",
+                "price": {"displayValue": f"{price:,} грн.".replace(",", " "), "regularPrice": {"value": price}},
+                "location": {"cityName": "Київ", "districtName": rng.choice(DISTRICTS)},
+                "createdTime": (now - timedelta(minutes=listing_id % 10_000)).isoformat(),
+                "photos": photos,
+                "params": [{"key": "total_area", "normalizedValue": str(rng.randint(25, 90))}],
+            })
+            description = " ".join(rng.choice(("світла", "затишна", "ремонт", "метро", "поруч", "парк")) for _ in range(80))
+            write(os.path.join(out_dir, "detail", f"{listing_id}.html"), detail_page(description, photos))
+        write(os.path.join(out_dir, "results", f"page_{page}.html"), results_page(ads))
+    return pages * per_page
+
+
+def record(out_dir, pages=3, max_images=6):
+    """
+    Записывает корпус с живого olx.ua: страницы результатов поиска по умолчанию, страницы
+    объявлений и их фото. Адреса olx.ua и CDN в сохранённых файлах заменяются на {ORIGIN}.
+    """
+    from bs4 import BeautifulSoup
+
+    from bot.extract import parse_state_listings
+    from bot.http_client import get_client
+    from bot.scraper import build_url
+    from bot.searches import default_search
+    from bot.utils import resize_image_url
+
+    client = get_client()
+    search = default_search()
+    olx = re.compile(r"https://www\.olx\.ua")
+    count = 0
+    for page in range(1, pages + 1):
+        html = client.get(build_url({**search.params, "page": page}, search.url)).text
+        write(os.path.join(out_dir, "results", f"page_{page}.html"), olx.sub(ORIGIN, html))
+        for listing in parse_state_listings(html) or []:
+            detail = client.get(f"https://www.olx.ua/{listing.id}").text
+            slides = BeautifulSoup(detail, "html.parser").select("div.swiper-zoom-container img")
+            for n, src in enumerate([img.get("src") for img in slides if img.get("src")][:max_images]):
+                # Сохраняем фото в том размере, который загружает бот
+                name = f"{listing.id}_{n}.jpg"
+                write(os.path.join(out_dir, "images", name), client.get(resize_image_url(src)).content)
+                detail = detail.replace(src, f"{ORIGIN}/images/{name}")
+            write(os.path.join(out_dir, "detail", f"{listing.id}.html"), olx.sub(ORIGIN, detail))
+            count += 1
+    return count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("mode", choices=("synthetic", "record"))
+    arg_parser.add_argument("out_dir")
+    arg_parser.add_argument("--pages", type=int, default=5)
+    arg_parser.add_argument("--per-page", type=int, default=40)
+    args = arg_parser.parse_args()
+
+    if args.mode == "synthetic":
+        count = synthetic(args.out_dir, args.pages, args.per_page)
+    else:
+        count = record(args.out_dir, args.pages)
+    print(f"Wrote {count} listings to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
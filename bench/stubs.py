@@ -0,0 +1,125 @@
+"""
+Локальный HTTP-сервер для офлайн-бенчмарка: подменяет olx.ua, CDN изображений и Telegram Bot API.
+
+- GET /<путь поиска>?...page=N   — results/page_N.html из корпуса (за последней страницей — пустая выдача);
+- GET /<id>                      — detail/<id>.html;
+- GET /images/<name>             — images/<name>;
+- GET|POST /bot<token>/<method>  — ответ Bot API {"ok": true, ...}; тело запроса читается целиком,
+                                   счётчики запросов по методам — в server.telegram_calls,
+                                   байт в запросах (параметры и файлы) — в server.telegram_bytes. sendPhoto и sendMediaGroup
+                                   возвращают фото с file_id, как настоящий Bot API.
+
+{ORIGIN} в файлах корпуса заменяется адресом сервера. Файлы читаются с диска один раз и кешируются.
+
+Использование:
+    server = start_server(corpus_dir)
+    ... server.origin ...
+    server.shutdown()
+"""
+
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+EMPTY_RESULTS = '<html><head><script>window.__PRERENDERED_STATE__ = "{\\"listing\\": {\\"listing\\": {\\"ads\\": []}}}";</script></head></html>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих серверов
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.strip("/")
+        if path.startswith("bot"):
+            # Методы без файлов (sendMessage, альбом из ссылок) telebot вызывает GET-запросом
+            self.bot_api(b"")
+            return
+        if path.startswith("images/"):
+            body = self.server.load("images", os.path.basename(path))
+            content_type = "image/jpeg"
+        elif path.startswith("uk/"):
+            page = parse_qs(url.query).get("page", ["1"])[0]
+            body = self.server.load("results", f"page_{page}.html")
+            body = EMPTY_RESULTS.encode() if body is None else body
+            content_type = "text/html; charset=utf-8"
+        else:
+            body = self.server.load("detail", f"{path}.html")
+            content_type = "text/html; charset=utf-8"
+
+        if body is None:
+            self.reply(404, b"not found", "text/plain")
+        else:
+            self.reply(200, body, content_type)
+
+    def do_POST(self):
+        self.bot_api(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+
+    def bot_api(self, body):
+        # Bot API: /bot<token>/<method>; параметры telebot передаёт в строке запроса, файлы — в теле
+        url = urlsplit(self.path)
+        method = url.path.rstrip("/").rsplit("/", 1)[-1]
+        with self.server.lock:
+            self.server.telegram_calls[method] += 1
+            self.server.telegram_bytes += len(url.query) + len(body)
+            message_id = sum(self.server.telegram_calls.values())
+        result = {"message_id": message_id, "date": 0, "chat": {"id": 0, "type": "private"}}
+        if method == "sendPhoto":
+            result["photo"] = [self.photo_size(message_id, 0)]
+        elif method == "sendMediaGroup":
+            # media — JSON-список фото альбома
+            media = parse_qs(url.query).get("media", ["[{}]"])[0]
+            result = [
+                {**result, "message_id": message_id * 100 + i, "photo": [self.photo_size(message_id, i)]}
+                for i in range(len(json.loads(media)))
+            ]
+        self.reply(200, json.dumps({"ok": True, "result": result}).encode(), "application/json")
+
+    @staticmethod
+    def photo_size(message_id, index):
+        file_id = f"stub-{message_id}-{index}"
+        return {"file_id": file_id, "file_unique_id": file_id, "width": 960, "height": 820}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, corpus_dir, address=("127.0.0.1", 0)):
+        super().__init__(address, StubHandler)
+        self.corpus_dir = corpus_dir
+        self.origin = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.telegram_calls = Counter()
+        self.telegram_bytes = 0
+
+    def load(self, kind, name):
+        key = (kind, name)
+        if key not in self.cache:
+            path = os.path.join(self.corpus_dir, kind, name)
+            if not os.path.isfile(path):
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            if kind != "images":
+                data = data.replace(b"{ORIGIN}", self.origin.encode())
+            self.cache[key] = data
+        return self.cache[key]
+
+
+def start_server(corpus_dir):
+    server = StubServer(corpus_dir)
+    threading.Thread(target=server.serve_forever, name="bench-stubs", daemon=True).start()
+    return server
@@ -0,0 +1,184 @@
+"""
+Статистика цен по районам: насколько объявление дешевле или дороже рынка.
+
+Распределения цены и цены за м² по каждому району хранятся в таблице price_stats как потоковые
+квантильные скетчи: значения раскладываются по логарифмическим корзинам (как в DDSketch,
+относительная точность STATS_RELATIVE_ACCURACY), в строке — счётчик корзины за месяц появления объявления.
+Скетч обновляется инкрементально при вставке новых объявлений (db.insert_new_listings), без сканирования
+таблицы listings; скользящее окно — сумма последних STATS_WINDOW_MONTHS месяцев.
+
+Функции:
+
+- price_stat_counts(rows, now):
+    Приращения счётчиков для новых объявлений (Listing) — передаются в insert_new_listings.
+- bulk_counts(records):
+    Счётчики по всей выборке (district_key, price_uah, area, upload_dt) за один проход; с NumPy — векторно.
+- rebuild_price_stats():
+    Полностью пересчитывает price_stats по таблице listings (после изменений схемы или параметров скетча).
+    Вручную: python -m bot.analytics
+- price_badge(district_key, district_name, price_uah, area):
+    Строка для подписи сообщения, например «📊 −18% від медіани за м² · Печерський»,
+    или None, если по району недостаточно данных.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from bot import db
+from bot.config import STATS_RELATIVE_ACCURACY, STATS_WINDOW_MONTHS, STATS_MIN_SAMPLES
+
+logger = logging.getLogger(__name__)
+
+GAMMA = (1 + STATS_RELATIVE_ACCURACY) / (1 - STATS_RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Распределение района читается из базы не чаще раза в CACHE_SECONDS
+CACHE_SECONDS = 300
+
+
+def bucket_index(value):
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+
+def bucket_value(index):
+    # Оценка значения корзины (GAMMA^(i-1), GAMMA^i] с относительной ошибкой не больше STATS_RELATIVE_ACCURACY
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def period_of(dt):
+    return f"{dt:%Y-%m}"
+
+
+def metric_values(price_uah, area):
+    # (метрика, значение): цена и, если известна площадь, цена за м²
+    if not price_uah or price_uah <= 0:
+        return []
+    values = [("price", price_uah)]
+    if area and area > 0:
+        values.append(("price_m2", price_uah / area))
+    return values
+
+
+def price_stat_counts(rows, now):
+    counts = Counter()
+    period = period_of(now)
+    for r in rows:
+        if not r.district_key:
+            continue
+        for metric, value in metric_values(r.price_value, r.area):
+            counts[(r.district_key, metric, period, bucket_index(value))] += 1
+    return [(*key, count) for key, count in counts.items()]
+
+
+def bulk_counts(records):
+    # NumPy нужен только для полного пересчёта: импорт здесь, чтобы обход и загрузка описаний его не грузили
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    records = [r for r in records if r[0] and r[1] and r[1] > 0]
+    if np is None:
+        counts = Counter()
+        for district_key, price_uah, area, upload_dt in records:
+            for metric, value in metric_values(price_uah, area):
+                counts[(district_key, metric, period_of(upload_dt), bucket_index(value))] += 1
+        return [(*key, count) for key, count in counts.items()]
+
+    if not records:
+        return []
+    # Ключ группировки — одно целое число (район, месяц, корзина): np.unique по int64 вместо сортировки строк
+    districts, district_codes = np.unique(np.array([r[0] for r in records]), return_inverse=True)
+    months = np.array([r[3].year * 12 + r[3].month - 1 for r in records], dtype=np.int64)
+    prices = np.array([r[1] for r in records], dtype=np.float64)
+    areas = np.array([r[2] or 0 for r in records], dtype=np.float64)
+    first_month = months.min()
+    month_span = months.max() - first_month + 1
+
+    result = []
+    for metric, mask in (("price", np.ones(len(records), dtype=bool)), ("price_m2", areas > 0)):
+        if not mask.any():
+            continue
+        values = prices[mask] / areas[mask] if metric == "price_m2" else prices[mask]
+        buckets = np.ceil(np.log(values) / LOG_GAMMA).astype(np.int64)
+        first_bucket = buckets.min()
+        bucket_span = buckets.max() - first_bucket + 1
+        keys = (district_codes[mask] * month_span + months[mask] - first_month) * bucket_span + buckets - first_bucket
+        unique, counts = np.unique(keys, return_counts=True)
+        for key, count in zip(unique.tolist(), counts.tolist()):
+            rest, bucket = divmod(key, bucket_span)
+            district, month = divmod(rest, month_span)
+            month += first_month
+            result.append((
+                str(districts[district]), metric, f"{month // 12:04d}-{month % 12 + 1:02d}",
+                int(bucket + first_bucket), count,
+            ))
+    return result
+
+
+def rebuild_price_stats():
+    started = time.monotonic()
+    counts = bulk_counts(db.fetch_price_inputs())
+    db.replace_price_stats(counts)
+    _cache.clear()
+    logger.info(f"Rebuilt price stats: {len(counts)} buckets in {time.monotonic() - started:.1f}s")
+    return len(counts)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_distribution(district_key, metric):
+    # Отсортированный список (корзина, счётчик) за окно STATS_WINDOW_MONTHS
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get((district_key, metric))
+        if cached and now - cached[0] < CACHE_SECONDS:
+            return cached[1]
+    today = datetime.now(timezone.utc)
+    first = today.year * 12 + today.month - STATS_WINDOW_MONTHS  # текущий месяц и STATS_WINDOW_MONTHS - 1 предыдущих
+    distribution = db.fetch_price_stats(district_key, metric, f"{first // 12:04d}-{first % 12 + 1:02d}")
+    with _cache_lock:
+        _cache[(district_key, metric)] = (now, distribution)
+    return distribution
+
+
+def quantile(distribution, q):
+    total = sum(count for _, count in distribution)
+    rank = q * (total - 1)
+    seen = 0
+    for bucket, count in distribution:
+        seen += count
+        if seen > rank:
+            return bucket_value(bucket)
+    return None
+
+
+def price_badge(district_key, district_name, price_uah, area):
+    if not district_key:
+        return None
+    # Цена за м² точнее сравнивает квартиры разной площади; без площади — просто цена
+    for metric, value in reversed(metric_values(price_uah, area)):
+        distribution = get_distribution(district_key, metric)
+        if sum(count for _, count in distribution) < STATS_MIN_SAMPLES:
+            continue
+        median = quantile(distribution, 0.5)
+        diff = round((value / median - 1) * 100)
+        sign = "−" if diff < 0 else "+"
+        unit = " за м²" if metric == "price_m2" else ""
+        return f"📊 {sign}{abs(diff)}% від медіани{unit} · {district_name}"
+    return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
+    )
+    db.init_schema()
+    rebuild_price_stats()
+    db.close()
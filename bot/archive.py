@@ -0,0 +1,189 @@
+"""
+Архив исходных страниц OLX на локальном диске (для повторного разбора, bot.replay).
+
+Каждая загруженная страница результатов и страница объявления сохраняется как объект,
+адресуемый содержимым: имя файла — SHA-256 тела страницы, поэтому одинаковые страницы
+хранятся один раз. Объекты сжимаются zstd (пакет zstandard), если он установлен, иначе zlib.
+
+Индекс — отдельный файл SQLite в ARCHIVE_DIR (index.db), не основная база:
+    pages(id, kind, url, digest, codec, fetched_dt)   — каждая загрузка страницы;
+    page_listings(page_id, listing_id)                — какие объявления были на странице.
+Индексы по listing_id и fetched_dt позволяют найти все версии страниц объявления.
+
+Функции:
+
+- store_page(kind, url, body, listing_ids, fetched_dt=None):
+    Сохраняет страницу (kind: "results" или "detail"). Ошибки записи только логируются —
+    архив не должен ломать обход. При ARCHIVE_ENABLED=0 ничего не делает.
+- load_page(digest, codec): тело страницы (bytes).
+- iter_pages(kind, since=None): (page_id, url, digest, codec, fetched_dt, listing_ids) по возрастанию fetched_dt.
+- pages_for_listing(listing_id): все страницы, на которых встречалось объявление.
+- prune(max_age_days=ARCHIVE_MAX_AGE_DAYS):
+    Удаляет из индекса страницы старше max_age_days и объекты, на которые больше не ссылается ни одна
+    страница. Страницы результатов меняются при каждой загрузке, так что без этого архив растёт бесконечно.
+    Вызывается задачей хранения (bot.retention). Возвращает (страниц, объектов) удалено.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from bot.config import ARCHIVE_DIR, ARCHIVE_ENABLED, ARCHIVE_ZSTD_LEVEL, ARCHIVE_MAX_AGE_DAYS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC = "zstd" if zstandard is not None else "zlib"
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _lock:
+        if _index is None:
+            os.makedirs(os.path.join(ARCHIVE_DIR, "objects"), exist_ok=True)
+            _index = sqlite3.connect(
+                os.path.join(ARCHIVE_DIR, "index.db"), check_same_thread=False, isolation_level=None
+            )
+            _index.execute("PRAGMA journal_mode=WAL")
+            _index.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    url TEXT,
+                    digest TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    fetched_dt TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS pages_kind_fetched_idx ON pages (kind, fetched_dt);
+                CREATE INDEX IF NOT EXISTS pages_fetched_idx ON pages (fetched_dt);
+                CREATE INDEX IF NOT EXISTS pages_digest_idx ON pages (digest);
+                CREATE TABLE IF NOT EXISTS page_listings (
+                    page_id INTEGER NOT NULL,
+                    listing_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS page_listings_listing_idx ON page_listings (listing_id);
+                CREATE INDEX IF NOT EXISTS page_listings_page_idx ON page_listings (page_id);
+            """)
+        return _index
+
+
+def object_path(digest, codec):
+    # Два первых символа хеша — подкаталог, чтобы не держать сотни тысяч файлов в одном каталоге
+    return os.path.join(ARCHIVE_DIR, "objects", digest[:2], f"{digest}.{codec}")
+
+
+def compress(body, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(body)
+    return zlib.compress(body, 6)
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def store_page(kind, url, body, listing_ids, fetched_dt=None):
+    if not ARCHIVE_ENABLED:
+        return None
+    try:
+        digest = hashlib.sha256(body).hexdigest()
+        path = object_path(digest, CODEC)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Запись через временный файл: прерванная запись не оставит битый объект
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(compress(body, CODEC))
+            os.replace(tmp_path, path)
+
+        index = get_index()
+        fetched_dt = (fetched_dt or datetime.now(timezone.utc)).isoformat()
+        with _lock:
+            index.execute("BEGIN")
+            cursor = index.execute(
+                "INSERT INTO pages (kind, url, digest, codec, fetched_dt) VALUES (?, ?, ?, ?, ?)",
+                (kind, url, digest, CODEC, fetched_dt)
+            )
+            index.executemany(
+                "INSERT INTO page_listings (page_id, listing_id) VALUES (?, ?)",
+                [(cursor.lastrowid, str(listing_id)) for listing_id in listing_ids]
+            )
+            index.execute("COMMIT")
+        return digest
+    except Exception as e:
+        logger.warning(f"Cannot archive page {url}: {e}")
+        return None
+
+
+def load_page(digest, codec):
+    with open(object_path(digest, codec), "rb") as f:
+        return decompress(f.read(), codec)
+
+
+def iter_pages(kind, since=None):
+    index = get_index()
+    with _lock:
+        rows = index.execute("""
+            SELECT p.id, p.url, p.digest, p.codec, p.fetched_dt, GROUP_CONCAT(l.listing_id)
+            FROM pages p LEFT JOIN page_listings l ON l.page_id = p.id
+            WHERE p.kind = ? AND p.fetched_dt >= ?
+            GROUP BY p.id
+            ORDER BY p.fetched_dt, p.id
+        """, (kind, since.isoformat() if since else "")).fetchall()
+    for page_id, url, digest, codec, fetched_dt, listing_ids in rows:
+        yield page_id, url, digest, codec, fetched_dt, listing_ids.split(",") if listing_ids else []
+
+
+def pages_for_listing(listing_id):
+    index = get_index()
+    with _lock:
+        return index.execute("""
+            SELECT p.kind, p.url, p.digest, p.codec, p.fetched_dt
+            FROM page_listings l JOIN pages p ON p.id = l.page_id
+            WHERE l.listing_id = ?
+            ORDER BY p.fetched_dt
+        """, (str(listing_id),)).fetchall()
+
+
+def prune(max_age_days=None):
+    max_age_days = ARCHIVE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.exists(os.path.join(ARCHIVE_DIR, "index.db")):
+        return 0, 0
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat()
+    index = get_index()
+    with _lock:
+        index.execute("BEGIN")
+        # Объекты, на которые ссылаются только устаревшие страницы (одинаковое тело могло загрузиться и позже)
+        orphans = index.execute("""
+            SELECT DISTINCT p.digest, p.codec FROM pages p
+            WHERE p.fetched_dt < ?
+              AND NOT EXISTS (SELECT 1 FROM pages q WHERE q.digest = p.digest AND q.fetched_dt >= ?)
+        """, (cutoff, cutoff)).fetchall()
+        index.execute(
+            "DELETE FROM page_listings WHERE page_id IN (SELECT id FROM pages WHERE fetched_dt < ?)", (cutoff,)
+        )
+        pages = index.execute("DELETE FROM pages WHERE fetched_dt < ?", (cutoff,)).rowcount
+        index.execute("COMMIT")
+
+    removed = 0
+    for digest, codec in orphans:
+        try:
+            os.remove(object_path(digest, codec))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    logger.info(f"Pruned {pages} archived pages and {removed} objects older than {max_age_days:g} days")
+    return pages, removed
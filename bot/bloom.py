@@ -0,0 +1,92 @@
+"""
+Фильтр Блума для дедупликации карточек без запросов к базе.
+
+Почти все карточки первой страницы уже известны, но раньше каждая проверялась запросом к PostgreSQL.
+Фильтр в памяти отвечает «точно новое» без обращения к базе; в базу уходят только возможные совпадения
+(известные объявления и редкие ложные срабатывания, доля которых не больше error_rate).
+
+- BloomFilter(capacity, error_rate):
+    Битовый массив в bytearray, k хешей по схеме двойного хеширования (blake2b).
+    add(item), update(items), item in filter. Безопасен для нескольких потоков.
+- get_seen_filter():
+    Фильтр id объявлений таблицы listings, встречавшихся за последние RETENTION_DAYS дней; загружается
+    из базы при первом обращении, ёмкость — по числу таких объявлений. Более старые объявления задача
+    хранения (bot.retention) всё равно уносит в архив, и при повторном появлении они снова новые.
+- refresh_seen_filter():
+    Догружает id, добавленные с прошлой загрузки (например, другим процессом, пока этот не был ведущим).
+"""
+
+import hashlib
+import logging
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+
+from bot.config import BLOOM_CAPACITY, BLOOM_ERROR_RATE, RETENTION_DAYS
+from bot.db import count_listings, iter_listing_ids
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        # Оптимальные размер массива и число хешей для заданных capacity и error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def positions(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self.positions(item)
+        with self.lock:
+            for pos in positions:
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(item))
+
+
+_seen = None
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def get_seen_filter():
+    global _seen, _loaded_at
+    with _lock:
+        if _seen is None:
+            started = datetime.now(timezone.utc)
+            cutoff = started - timedelta(days=RETENTION_DAYS)
+            # Запас по ёмкости: фильтр пополняется новыми объявлениями до следующего перезапуска
+            _seen = BloomFilter(max(BLOOM_CAPACITY, 2 * count_listings(cutoff)), BLOOM_ERROR_RATE)
+            _seen.update(iter_listing_ids(seen_since=cutoff))
+            _loaded_at = started
+            logger.info(f"Loaded {_seen.count} listing ids into Bloom filter ({len(_seen.bits) // 1024} KiB)")
+        return _seen
+
+
+def refresh_seen_filter():
+    global _loaded_at
+    seen = get_seen_filter()
+    with _lock:
+        started = datetime.now(timezone.utc)
+        # Небольшое перекрытие окна на случай расхождения часов между процессами
+        since = _loaded_at - timedelta(minutes=5)
+        before = seen.count
+        seen.update(iter_listing_ids(uploaded_since=since))
+        _loaded_at = started
+    logger.info(f"Refreshed Bloom filter with {seen.count - before} listing ids uploaded since {since:%H:%M:%S}")
+    return seen
@@ -0,0 +1,193 @@
+"""
+Командная строка бота: отдельные этапы конвейера вместо одного последовательного запуска.
+
+Каждая подкоманда импортирует только нужные ей модули (в том числе тяжёлые bs4, Pillow и telebot
+загружаются лишь там, где используются), поэтому запуск по cron отдельного этапа быстрее
+доходит до первого запроса.
+
+Подкоманды:
+    python -m bot run                 # всё по очереди: обход → описания → отправка (как bot.run)
+    python -m bot scrape              # обход страниц результатов всех поисков
+    python -m bot enrich [--workers N]  # описания, фото, коллажи и outbox для новых объявлений
+    python -m bot send                # отправка сообщений из outbox в Telegram
+    python -m bot daemon              # долгоживущий режим (bot.daemon)
+    python -m bot retention           # перенос старых объявлений в архив (bot.retention)
+    python -m bot stats               # пересчёт статистики цен по районам (bot.analytics)
+    python -m bot replay ...          # повторный разбор архива страниц (аргументы bot.replay)
+    python -m bot bench ...           # офлайн-бенчмарк (аргументы bench.bench_pipeline)
+    python -m bot importtime scrape   # время импорта модулей подкоманды (python -X importtime)
+"""
+
+import argparse
+import logging
+import re
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Модули, которые импортирует подкоманда, — для отчёта importtime
+COMMAND_MODULES = {
+    "run": ["bot.scraper", "bot.outbox", "bot.telegram_bot"],
+    "scrape": ["bot.scraper"],
+    "enrich": ["bot.scraper"],
+    "send": ["bot.outbox", "bot.telegram_bot"],
+    "daemon": ["bot.daemon"],
+    "retention": ["bot.retention"],
+    "stats": ["bot.analytics"],
+    "replay": ["bot.replay"],
+    "bench": ["bench.bench_pipeline"],
+}
+# Подкоманды со своим разбором аргументов: всё после имени передаётся их main(argv)
+PASSTHROUGH = {"replay": "bot.replay", "bench": "bench.bench_pipeline"}
+
+
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
+    )
+
+
+def log_run_stats():
+    from bot import http_client, metrics
+
+    http_client.log_stats()
+    metrics.log_summary()
+
+
+def scrape(args):
+    from bot import scraper
+
+    logger.info("STARTING | Scraping")
+    scraper.crawl_all()
+    logger.info("FINISHED | Scraping.")
+
+
+def enrich(args):
+    from bot import scraper
+
+    logger.info("STARTING | Updating descriptions and images")
+    scraper.update_missing_descriptions_and_images(workers=args.workers)
+    logger.info("FINISHED | Updating descriptions and images")
+
+
+def send(args):
+    from bot import outbox, telegram_bot
+
+    logger.info("STARTING | Sending Telegram messages")
+    # Отправляем накопленные в outbox сообщения и дожидаемся очереди Telegram
+    outbox.drain_outbox()
+    telegram_bot.flush()
+    logger.info("FINISHED | Sending Telegram messages")
+
+
+def run(args):
+    scrape(args)
+    enrich(args)
+    send(args)
+
+
+def retention(args):
+    from bot.retention import run_retention
+
+    run_retention()
+
+
+def stats(args):
+    from bot.analytics import rebuild_price_stats
+
+    rebuild_price_stats()
+
+
+def importtime(args):
+    """
+    Запускает импорт модулей подкоманды в отдельном интерпретаторе с -X importtime
+    и печатает общее время и самые медленные модули (по времени с учётом вложенных импортов).
+    """
+    modules = COMMAND_MODULES[args.target]
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((int(cumulative), int(own), len(indent) // 2, name))
+    total = sum(cumulative for cumulative, _, depth, _ in rows if depth == 0)
+
+    print(f"{args.target}: {total / 1000:.1f} ms to import {', '.join(modules)}")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative, own, depth, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f} {own / 1000:>8.1f}  {'  ' * depth}{name}")
+
+
+COMMANDS = {
+    "run": run,
+    "scrape": scrape,
+    "enrich": enrich,
+    "send": send,
+    "retention": retention,
+    "stats": stats,
+}
+
+
+def build_parser():
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m bot", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "enrich"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--workers", type=int, help="потоков загрузки описаний (по умолчанию ENRICH_WORKERS)")
+    subparsers.add_parser("scrape")
+    subparsers.add_parser("send")
+    subparsers.add_parser("daemon")
+    subparsers.add_parser("retention")
+    subparsers.add_parser("stats")
+    for name, module in PASSTHROUGH.items():
+        subparsers.add_parser(name, help=f"аргументы {module}, см. python -m bot {name} --help")
+    sub = subparsers.add_parser("importtime")
+    sub.add_argument("target", choices=sorted(COMMAND_MODULES))
+    sub.add_argument("--top", type=int, default=15)
+    return arg_parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in PASSTHROUGH:
+        import importlib
+
+        importlib.import_module(PASSTHROUGH[argv[0]]).main(argv[1:])
+        return
+
+    args = build_parser().parse_args(argv)
+    if args.command == "importtime":
+        importtime(args)
+        return
+
+    configure_logging()
+    if args.command == "daemon":
+        from bot import daemon
+
+        daemon.main()
+        return
+
+    from bot import db
+
+    db.init_schema()
+    try:
+        COMMANDS[args.command](args)
+        log_run_stats()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import socket
 
 load_dotenv()
 
@@ -8,4 +9,99 @@ CHAT_ID = os.getenv("CHAT_ID")
 CHAT_ID_15_20K = os.getenv("CHAT_ID_15_20K")
 CHAT_ID_20_25K = os.getenv("CHAT_ID_20_25K")
 DATABASE_URL = os.getenv("DATABASE_URL")
-OLX_BASE_URL = "https://www.olx.ua/uk/nedvizhimost/kvartiry/kiev/"
+# Адрес OLX можно подменить локальным сервером (офлайн-бенчмарк bench.bench_pipeline)
+OLX_ORIGIN = os.getenv("OLX_ORIGIN", "https://www.olx.ua").rstrip("/")
+OLX_BASE_URL = OLX_ORIGIN + "/uk/nedvizhimost/kvartiry/kiev/"
+
+# Количество потоков для параллельной загрузки страниц объявлений и изображений
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "4"))
+# Ограничение частоты запросов к olx.ua (запросов в секунду)
+OLX_REQUESTS_PER_SEC = float(os.getenv("OLX_REQUESTS_PER_SEC", "2"))
+
+# Инкрементальный обход: максимум страниц за запуск и число страниц, загружаемых параллельно
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "10"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "2"))
+# Общий HTTP-клиент (bot.http_client): число повторов, задержка повтора (сек, растёт экспоненциально до cap),
+# размер пула соединений на хост, HTTP/2 (если установлены httpx и h2)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1"))
+HTTP_BACKOFF_CAP = float(os.getenv("HTTP_BACKOFF_CAP", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+# Количество потоков для параллельной загрузки изображений (общий пул на процесс)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "6"))
+# Ограничения Telegram: сообщений в секунду на бота, интервал между сообщениями в один чат (сек), число повторов
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25"))
+TG_CHAT_INTERVAL = float(os.getenv("TG_CHAT_INTERVAL", "3"))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "4"))
+# Отправка из outbox: размер пачки и число попыток до статуса failed
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Режим демона: границы интервала опроса (сек), целевое число новых объявлений на цикл, ночные часы (Киев).
+# Нижняя граница по умолчанию — 300 с, как у прежнего запуска по cron; опрос чаще включается только явно
+POLL_MIN_SECONDS = float(os.getenv("POLL_MIN_SECONDS", "300"))
+POLL_MAX_SECONDS = float(os.getenv("POLL_MAX_SECONDS", "600"))
+POLL_NIGHT_MIN_SECONDS = float(os.getenv("POLL_NIGHT_MIN_SECONDS", "300"))
+POLL_TARGET_NEW = float(os.getenv("POLL_TARGET_NEW", "1"))
+NIGHT_HOURS = range(0, 7)
+# Файл с правилами фильтрации объявлений (районы, цена, площадь, ключевые слова)
+FILTERS_PATH = os.getenv("FILTERS_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filters.json"))
+# Реестр поисков (город, категория, цена, фильтры, чаты) и общий бюджет страниц OLX на один цикл
+SEARCHES_PATH = os.getenv("SEARCHES_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "searches.json"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "3"))
+OLX_PAGE_BUDGET = int(os.getenv("OLX_PAGE_BUDGET", "30"))
+# Срок уведомления (сек от публикации объявления): не успевающие в срок объявления уходят без коллажа
+TTN_BUDGET_SECONDS = float(os.getenv("TTN_BUDGET_SECONDS", "900"))
+# Очередь загрузки описаний: срок аренды объявления (сек), размер пачки и идентификатор процесса
+ENRICH_LEASE_SECONDS = int(os.getenv("ENRICH_LEASE_SECONDS", "300"))
+ENRICH_CLAIM_BATCH = int(os.getenv("ENRICH_CLAIM_BATCH", "20"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Фильтр Блума для дедупликации карточек: минимальная ёмкость и доля ложных срабатываний
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", "200000"))
+BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", "0.01"))
+# Репосты (bot.dedup): off — не искать, notify — короткое сообщение «опубліковано повторно», suppress — не отправлять
+DEDUP_MODE = os.getenv("DEDUP_MODE", "notify")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+DEDUP_WINDOW_DAYS = int(os.getenv("DEDUP_WINDOW_DAYS", "60"))
+# Текст короче стольких шинглов (например, один шаблонный заголовок) не подписывается и репостом не считается
+DEDUP_MIN_SHINGLES = int(os.getenv("DEDUP_MIN_SHINGLES", "8"))
+# Репост по фото: не меньше стольких общих фото (перцептивный хеш) с другим объявлением; 0 — не проверять
+DEDUP_MIN_SHARED_PHOTOS = int(os.getenv("DEDUP_MIN_SHARED_PHOTOS", "3"))
+# Кеш миниатюр и коллажей на диске (bot.image_cache), вытеснение по LRU сверх IMAGE_CACHE_MAX_MB
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1") == "1"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "image_cache"))
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "512"))
+# Статистика цен по районам (bot.analytics): точность скетча, окно в месяцах, минимум объявлений для бейджа
+STATS_RELATIVE_ACCURACY = float(os.getenv("STATS_RELATIVE_ACCURACY", "0.01"))
+STATS_WINDOW_MONTHS = int(os.getenv("STATS_WINDOW_MONTHS", "3"))
+STATS_MIN_SAMPLES = int(os.getenv("STATS_MIN_SAMPLES", "20"))
+# Коллаж для Telegram: прогрессивный JPEG не больше TG_PHOTO_MAX_BYTES (0 — без ограничения);
+# качество снижается от COLLAGE_QUALITY, но не ниже COLLAGE_MIN_QUALITY
+TG_PHOTO_MAX_BYTES = int(os.getenv("TG_PHOTO_MAX_BYTES", "200000"))
+COLLAGE_QUALITY = int(os.getenv("COLLAGE_QUALITY", "85"))
+COLLAGE_MIN_QUALITY = int(os.getenv("COLLAGE_MIN_QUALITY", "50"))
+# Фото в сообщении: collage — коллаж; album — альбом (send_media_group) из ссылок на фото OLX, которые Telegram
+# загружает сам (без загрузки фото ботом и без поиска репостов по фото); auto — коллаж, а если объявление
+# не успевает в срок уведомления — альбом вместо сообщения без фото. В альбоме не больше TG_ALBUM_SIZE фото
+TG_MEDIA_MODE = os.getenv("TG_MEDIA_MODE", "collage")
+TG_ALBUM_SIZE = int(os.getenv("TG_ALBUM_SIZE", "6"))
+# Хранение: объявления, не встречавшиеся дольше RETENTION_DAYS, уходят в архив (или удаляются при RETENTION_ARCHIVE=0)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+RETENTION_ARCHIVE = os.getenv("RETENTION_ARCHIVE", "1") == "1"
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+# Метрики и трассировка (bot.metrics): файл для Prometheus textfile collector, порт HTTP-эндпоинта демона, спаны
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+
+# Архив исходных страниц (bot.archive) для повторного разбора (bot.replay); страницы старше ARCHIVE_MAX_AGE_DAYS
+# удаляются задачей хранения (bot.retention)
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("ARCHIVE_MAX_AGE_DAYS", "14"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "archive"))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+REPLAY_WORKERS = int(os.getenv("REPLAY_WORKERS", str(os.cpu_count() or 2)))
@@ -0,0 +1,127 @@
+"""
+Долгоживущий режим бота вместо запуска по cron каждые 5 минут.
+
+Процесс один раз импортирует модули, держит открытыми соединение с PostgreSQL и HTTP-сессии
+к OLX и Telegram и сам запускает циклы: инкрементальный обход → обновление описаний → отправка outbox.
+
+Метрики этапов (bot.metrics) пишутся в лог после каждого цикла; при заданном METRICS_PORT
+демон отдаёт их по HTTP: /metrics (Prometheus) и /metrics.json.
+
+Раз в RETENTION_INTERVAL_HOURS между циклами старые объявления переносятся в архив (bot.retention).
+
+Интервал между циклами подстраивается под наблюдаемый поток новых объявлений (AdaptivePoller):
+скорость появления новых объявлений сглаживается экспоненциально, и интервал выбирается так,
+чтобы за один цикл в среднем находилось POLL_TARGET_NEW объявлений, в пределах
+[POLL_MIN_SECONDS, POLL_MAX_SECONDS]. По умолчанию POLL_MIN_SECONDS — 300 с, как у cron, поэтому
+демон опрашивает OLX не чаще прежнего и только реже, когда новых объявлений мало; опрос чаще
+включается уменьшением POLL_MIN_SECONDS. Ночью (по киевскому времени) нижняя граница
+не ниже POLL_NIGHT_MIN_SECONDS.
+
+Запуск:
+    python -m bot.daemon
+"""
+
+import logging
+import signal
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from bot import scraper, telegram_bot, outbox, http_client, retention, metrics
+from bot.config import (
+    POLL_MIN_SECONDS, POLL_MAX_SECONDS, POLL_NIGHT_MIN_SECONDS, POLL_TARGET_NEW, NIGHT_HOURS,
+    RETENTION_INTERVAL_HOURS, METRICS_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
+
+
+class AdaptivePoller:
+    def __init__(self, min_interval=None, max_interval=None, night_min_interval=None, target_new=None, alpha=0.3):
+        self.min_interval = min_interval or POLL_MIN_SECONDS
+        self.max_interval = max_interval or POLL_MAX_SECONDS
+        self.night_min_interval = night_min_interval or POLL_NIGHT_MIN_SECONDS
+        self.target_new = target_new or POLL_TARGET_NEW
+        self.alpha = alpha
+        self.rate = None  # новых объявлений в секунду (сглаженное значение)
+
+    def observe(self, new_count, elapsed):
+        # elapsed — время с начала предыдущего цикла, за которое появились new_count объявлений
+        if elapsed <= 0:
+            return
+        sample = new_count / elapsed
+        self.rate = sample if self.rate is None else self.alpha * sample + (1 - self.alpha) * self.rate
+
+    def next_interval(self, now=None):
+        now = now or datetime.now(KYIV_TZ)
+        low = max(self.night_min_interval, self.min_interval) if now.hour in NIGHT_HOURS else self.min_interval
+        if not self.rate:
+            return self.max_interval if self.rate is not None else low
+        return min(self.max_interval, max(low, self.target_new / self.rate))
+
+
+def run_cycle():
+    new_count = scraper.crawl_all()
+    scraper.update_missing_descriptions_and_images()
+    outbox.drain_outbox()
+    telegram_bot.flush()
+    http_client.log_stats()
+    metrics.log_summary()
+    return new_count
+
+
+def main():
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping after current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    from bot import db
+    db.init_schema()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+
+    poller = AdaptivePoller()
+    last_start = None
+    last_retention = None
+
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            new_count = run_cycle()
+            if last_start is not None:
+                poller.observe(new_count, started - last_start)
+        except Exception as e:
+            logger.error(f"Cycle failed: {e}")
+        last_start = started
+
+        # Архивация старых объявлений — раз в RETENTION_INTERVAL_HOURS, между циклами
+        if last_retention is None or started - last_retention >= RETENTION_INTERVAL_HOURS * 3600:
+            try:
+                retention.run_retention()
+            except Exception as e:
+                logger.error(f"Retention failed: {e}")
+            last_retention = started
+
+        interval = poller.next_interval()
+        logger.info(f"Cycle done in {time.monotonic() - started:.1f}s, next in {interval:.0f}s")
+        stop.wait(max(0, interval - (time.monotonic() - started)))
+
+    telegram_bot.flush()
+    db.close()
+    logger.info("Daemon stopped.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
+    )
+    main()
@@ -1,68 +1,787 @@
 """
-Модуль для работы с базой данных PostgreSQL, содержащей объявления (listings).
-
-- Устанавливает соединение с базой данных по адресу DATABASE_URL.
-- Создает таблицу listings, если она не существует, с полями:
-    id, name, price, district, img_url, description, last_seen_dt, upload_dt, created_at_dt.
-- Функция is_new_listing(listing_id):
-    Проверяет, является ли объявление с данным id новым.
-    Если объявления нет в базе, добавляет его с текущей меткой времени и возвращает True.
-    Если объявление уже есть, обновляет поле last_seen_dt и возвращает False.
+Модуль для работы с базой данных, содержащей объявления (listings).
+
+- Соединение не создаётся при импорте: пул соединений (psycopg2 ThreadedConnectionPool)
+  открывается при первом обращении к базе по адресу DATABASE_URL. Пул не ждёт свободного соединения,
+  а сразу бросает PoolError, поэтому соединения выдаются через семафор на DB_POOL_SIZE мест:
+  при занятом пуле поток ждёт, пока другой вернёт соединение.
+- Кроме PostgreSQL поддерживается SQLite (DATABASE_URL=sqlite:///path/to/file.db или sqlite://:memory:),
+  чтобы конвейер можно было запускать и замерять без сети. Запросы пишутся в стиле psycopg2 (%s),
+  для SQLite плейсхолдеры переводятся автоматически.
+- transaction(): контекстный менеджер, выдающий курсор; при выходе транзакция фиксируется,
+  при исключении — откатывается. Каждая функция модуля работает в своей транзакции.
+- init_schema(): явное применение миграций схемы (bot.migrations), вызывается точками входа.
+- close(): закрывает пул соединений.
+- Функции count_listings(seen_since=None) / iter_listing_ids(uploaded_since=None, seen_since=None):
+    Число объявлений и их id пачками (встречавшихся не раньше seen_since) — для загрузки фильтра Блума (bot.bloom).
+- Функция archive_listings(cutoff, batch_size, archive):
+    Переносит пачку давно не встречавшихся объявлений в listings_archive (секции по месяцам) или удаляет их.
+- Функция fetch_card_state(listing_ids):
+    Одним SELECT читает отпечатки (fingerprint) уже известных объявлений — без записи в базу.
+- Функции update_changed_listings(changes, now) / touch_listings(listing_ids, now):
+    Пишут только карточки с изменившимся отпечатком (изменения цены и заголовка — в listing_history),
+    а last_seen_dt неизменившихся обновляют одним запросом на страницу или на обход поиска.
+- Функция insert_new_listings(rows, now, price_stats=()):
+    Вставляет все новые объявления одной пачкой (execute_values / executemany) и в той же транзакции
+    обновляет скетчи цен по районам (price_stats, bot.analytics).
+- Функции fetch_price_inputs() / replace_price_stats(counts) / fetch_price_stats(district_key, metric, since_period):
+    Полный пересчёт и чтение скетчей цен по районам.
+- Функции replay_card_fields(rows) / replay_detail_fields(rows):
+    Пакетно исправляют поля карточек и описания по повторному разбору архива страниц (bot.replay).
+- Функции get_high_water_mark(search_key) / set_high_water_mark(search_key, dt):
+    Читают и сохраняют в таблице crawl_state дату самого свежего объявления для поиска.
+- Функция mark_listing_unavailable(listing_id, owner):
+    Пометка объявлений, снятых с публикации.
+- Функции claim_listings_to_enrich(since, owner, lease_seconds, limit, expired_before=None) / release_listing_lease(listing_id, owner):
+    Очередь задач на загрузку описаний для нескольких процессов: аренда строк без описания, прошедших
+    фильтры (по частичному индексу), через FOR UPDATE SKIP LOCKED с истечением аренды.
+    Результат загрузки (mark_listing_unavailable, mark_listing_filtered, save_details_with_outbox) пишется,
+    только если аренда всё ещё у owner и описания нет: иначе объявление уже забрал и обработал другой процесс.
+- advisory_lock(name):
+    Выбор ведущего процесса (обход страниц результатов, отправка outbox) через pg_try_advisory_lock.
+- Функция mark_listing_filtered(listing_id, description, rule, owner):
+    Сохраняет описание объявления, отклонённого фильтром по описанию, и имя правила.
+- Функции link_listing_searches(search_name, rows, now) / fetch_listing_searches(listing_ids):
+    Связь объявлений с поисками из реестра (bot.searches): общая дедупликация для всех поисков.
+- Функция save_details_with_outbox(listing_id, owner, description, img_url, messages, photo, ...):
+    В одной транзакции сохраняет описание объявления (с MinHash-подписью текста и ссылкой на оригинал,
+    если это репост) и кладёт готовые сообщения (по одному на чат) в таблицу outbox,
+    так что описание не может сохраниться без сообщения на отправку. Возвращает False, если аренда
+    потеряна (сообщения не добавляются — их уже поставил в outbox другой процесс). Вместо коллажа (photo) сообщение
+    может нести media — список ссылок на фото для альбома (хранится в outbox как JSON).
+- Функции iter_minhashes(since) / fetch_listing_price(listing_id):
+    Подписи для индекса репостов (bot.dedup) и цена оригинала для сообщения о репосте.
+- Функции fetch_pending_outbox_ids() / fetch_outbox_rows(ids), mark_outbox_sent(ids), mark_outbox_failed(outbox_id, error, max_attempts):
+    Очередь pending-сообщений от самых свежих объявлений к старым и обновление статусов (pending → sent / failed).
+- Функции fetch_telegram_file_ids(keys) / save_telegram_file_ids(rows) / forget_telegram_file_ids(keys):
+    file_id уже загруженных в Telegram фото (по хешу коллажа или ссылке на фото) для повторной отправки без загрузки.
 - Логирует важные события, такие как создание таблицы и добавление новых объявлений.
 """
 
+import json
 import os
-import psycopg2
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import logging
 
+from bot import metrics
+
 logger = logging.getLogger(__name__)
 
 # Загружаем переменные из .env (файл должен лежать в корне проекта)
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    logger.error("DATABASE_URL is not set! Please check your .env file.")
-    raise Exception("DATABASE_URL not found in environment variables")
-
-logger.info(f"Using DATABASE_URL: {DATABASE_URL[:30]}...")  # не выводим всю строку из соображений безопасности
-
-try:
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = True
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS listings (
-        id TEXT PRIMARY KEY,
-        name TEXT,
-        price TEXT,
-        district TEXT,
-        img_url TEXT,
-        description TEXT,
-        last_seen_dt TIMESTAMPTZ,
-        upload_dt TIMESTAMPTZ,
-        created_at_dt TIMESTAMPTZ
-    );
-    """)
-    logger.info("Connected to PostgreSQL and ensured table exists.")
-except Exception as e:
-    logger.error(f"Failed to connect to PostgreSQL or create table: {e}")
-    raise
-
-
-def is_new_listing(listing_id):
-    from datetime import datetime, timezone
-
-    cursor.execute("SELECT last_seen_dt FROM listings WHERE id = %s", (listing_id,))
-    row = cursor.fetchone()
-    now = datetime.now(timezone.utc)
+# Соединений PostgreSQL на процесс. Обход держит одно на всё время advisory-блокировки, ещё по одному —
+# каждый из SEARCH_CONCURRENCY потоков поисков; при меньшем пуле потоки просто ждут очереди (минимум 2)
+DB_POOL_SIZE = max(2, int(os.getenv("DB_POOL_SIZE", "4")))
+# Сколько id передаётся в одном IN (...): старые сборки SQLite ограничивают число параметров 999
+TOUCH_BATCH_SIZE = 500
+
+_pool = None
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+_sqlite = None
+_sqlite_lock = threading.RLock()
+_init_lock = threading.Lock()
+
+def is_sqlite():
+    return (DATABASE_URL or "").startswith("sqlite:")
+
+
+def _sqlite_path():
+    path = DATABASE_URL[len("sqlite:"):]
+    return path[2:] if path.startswith("//") else path
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _connect():
+    global _pool, _sqlite
+    if not DATABASE_URL:
+        logger.error("DATABASE_URL is not set! Please check your .env file.")
+        raise Exception("DATABASE_URL not found in environment variables")
+
+    logger.info(f"Using DATABASE_URL: {DATABASE_URL[:30]}...")  # не выводим всю строку из соображений безопасности
+    if is_sqlite():
+        # Даты храним строками ISO 8601 и разбираем обратно по объявленному типу колонки
+        sqlite3.register_adapter(datetime, lambda dt: dt.isoformat())
+        sqlite3.register_converter("TIMESTAMPTZ", _parse_timestamp)
+        _sqlite = sqlite3.connect(
+            _sqlite_path(), detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level=None,
+        )
+    else:
+        from psycopg2.pool import ThreadedConnectionPool
+
+        _pool = ThreadedConnectionPool(1, DB_POOL_SIZE, DATABASE_URL)
+    logger.info("Connected to database.")
+
+
+class SqliteCursor:
+    """Курсор SQLite, принимающий запросы в стиле psycopg2 (%s вместо ?)."""
+
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+
+    def execute(self, query, params=()):
+        return self.cursor.execute(query.replace("%s", "?"), params)
+
+    def executemany(self, query, seq):
+        return self.cursor.executemany(query.replace("%s", "?"), seq)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+def _getconn():
+    # Ждём свободного места, а не PoolError("connection pool exhausted")
+    with metrics.timer("db_pool_wait"):
+        _pool_slots.acquire()
+    try:
+        return _pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def _putconn(conn):
+    try:
+        _pool.putconn(conn)
+    finally:
+        _pool_slots.release()
+
+
+@contextmanager
+def transaction():
+    with _init_lock:
+        if _pool is None and _sqlite is None:
+            _connect()
+
+    if _sqlite is not None:
+        # Одно соединение SQLite на процесс — транзакции сериализуются блокировкой
+        with _sqlite_lock, metrics.timer("db"):
+            cur = SqliteCursor(_sqlite)
+            cur.execute("BEGIN")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+        return
 
-    if row is None:
-        cursor.execute("INSERT INTO listings (id, last_seen_dt) VALUES (%s, %s)", (listing_id, now))
-        logger.info(f"New listing: {listing_id}")
-        return True
+    conn = _getconn()
+    try:
+        with metrics.timer("db"), conn:  # commit при успехе, rollback при исключении
+            with conn.cursor() as cur:
+                yield cur
+    finally:
+        _putconn(conn)
+
+
+def init_schema():
+    # Схема ведётся версионированными миграциями (bot.migrations)
+    from bot.migrations import migrate
+
+    try:
+        migrate()
+        logger.info("Ensured database schema is up to date.")
+    except Exception as e:
+        logger.error(f"Failed to connect to database or migrate schema: {e}")
+        raise
+
+
+def close():
+    global _pool, _sqlite
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+    if _sqlite is not None:
+        _sqlite.close()
+        _sqlite = None
+    logger.info("DB connection closed.")
+
+
+def placeholders(values):
+    # "%s, %s, ..." для IN (...) — работает и в PostgreSQL, и в SQLite
+    return ", ".join(["%s"] * len(values))
+
+
+def insert_many(cur, query, rows, template):
+    # query содержит "VALUES %s"; для PostgreSQL — одна пачка execute_values, для SQLite — executemany
+    if is_sqlite():
+        cur.executemany(query.replace("VALUES %s", "VALUES " + template), rows)
     else:
-        cursor.execute("UPDATE listings SET last_seen_dt = %s WHERE id = %s", (now, listing_id))
-        return False
+        from psycopg2.extras import execute_values
+
+        execute_values(cur, query, rows, template=template)
+
+
+def update_many(cur, query, rows):
+    # Пакетное выполнение одного запроса для многих строк
+    if is_sqlite():
+        cur.executemany(query, rows)
+    else:
+        from psycopg2.extras import execute_batch
+
+        execute_batch(cur, query, rows, page_size=500)
+
+
+def count_listings(seen_since=None):
+    with transaction() as cur:
+        if seen_since is None:
+            cur.execute("SELECT COUNT(*) FROM listings")
+        else:
+            cur.execute("SELECT COUNT(*) FROM listings WHERE last_seen_dt >= %s", (seen_since,))
+        return cur.fetchone()[0]
+
+
+def iter_listing_ids(uploaded_since=None, seen_since=None, batch_size=10000):
+    # id таблицы listings (все, добавленные не раньше uploaded_since или встречавшиеся не раньше seen_since)
+    # пачками по ключу id
+    conditions, params = [], []
+    if uploaded_since is not None:
+        conditions.append("upload_dt >= %s")
+        params.append(uploaded_since)
+    if seen_since is not None:
+        conditions.append("last_seen_dt >= %s")
+        params.append(seen_since)
+    query = f"SELECT id FROM listings WHERE {' AND '.join(conditions + ['id > %s'])} ORDER BY id LIMIT %s"
+    last_id = ""
+    while True:
+        with transaction() as cur:
+            cur.execute(query, (*params, last_id, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
+
+
+def fetch_card_state(listing_ids):
+    """
+    Читает у уже известных объявлений отпечаток карточки и поля, которые он покрывает.
+    Только SELECT — неизменившиеся карточки не порождают записи в WAL.
+    Возвращает {id: (fingerprint, name, price, price_uah)}.
+    """
+    listing_ids = list(listing_ids)
+    if not listing_ids:
+        return {}
+    with transaction() as cur:
+        cur.execute(
+            f"SELECT id, fingerprint, name, price, price_uah FROM listings WHERE id IN ({placeholders(listing_ids)})",
+            listing_ids
+        )
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+def touch_listings(listing_ids, now):
+    # Одно обновление last_seen_dt на всю пачку неизменившихся объявлений (страницу или обход поиска)
+    listing_ids = list(listing_ids)
+    with transaction() as cur:
+        for start in range(0, len(listing_ids), TOUCH_BATCH_SIZE):
+            chunk = listing_ids[start:start + TOUCH_BATCH_SIZE]
+            cur.execute(
+                f"UPDATE listings SET last_seen_dt = %s WHERE id IN ({placeholders(chunk)})",
+                (now, *chunk)
+            )
+
+
+def update_changed_listings(changes, now):
+    """
+    Сохраняет карточки, чей отпечаток изменился. changes — список (Listing, старое состояние из fetch_card_state).
+    Изменения цены и заголовка дописываются в listing_history; прочие поля (место) только обновляют отпечаток.
+    Возвращает число записей истории.
+    """
+    if not changes:
+        return 0
+    history = [
+        (r.id, now, old_name, r.name, old_price, r.price, old_price_uah, r.price_value)
+        for r, (_, old_name, old_price, old_price_uah) in changes
+        if old_name != r.name or old_price_uah != r.price_value
+    ]
+    with transaction() as cur:
+        update_many(cur, """
+            UPDATE listings SET name = %s, price = %s, price_uah = %s, fingerprint = %s, last_seen_dt = %s WHERE id = %s
+        """, [(r.name, r.price, r.price_value, r.fingerprint, now, r.id) for r, _ in changes])
+        if history:
+            insert_many(cur, """
+                INSERT INTO listing_history (
+                    listing_id, changed_dt, old_name, new_name, old_price, new_price, old_price_uah, new_price_uah
+                )
+                VALUES %s
+            """, history, "(%s, %s, %s, %s, %s, %s, %s, %s)")
+    for r, (_, _, old_price, _) in changes:
+        if old_price != r.price:
+            logger.info(f"Price changed for {r.id}: {old_price} -> {r.price}")
+    return len(history)
+
+
+def insert_new_listings(rows, now, price_stats=()):
+    # rows — список объявлений (bot.extract.Listing); вставляем их одной пачкой.
+    # price_stats — приращения скетчей цен (bot.analytics.price_stat_counts) в той же транзакции
+    if not rows:
+        return
+    with transaction() as cur:
+        insert_many(cur, """
+            INSERT INTO listings (
+                id, name, price, district, img_url, description, last_seen_dt, upload_dt, created_at_dt,
+                price_uah, location, district_key, filter_status, fingerprint, area
+            )
+            VALUES %s
+            ON CONFLICT (id) DO NOTHING
+        """, [
+            (
+                r.id, r.name, r.price, r.district, r.img_url, None, now, now, r.created_at_dt,
+                r.price_value, r.location, r.district_key, r.filter_status, r.fingerprint, r.area,
+            )
+            for r in rows
+        ], "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
+        if price_stats:
+            insert_many(cur, """
+                INSERT INTO price_stats (district_key, metric, period, bucket, count)
+                VALUES %s
+                ON CONFLICT (district_key, metric, period, bucket) DO UPDATE SET count = price_stats.count + excluded.count
+            """, list(price_stats), "(%s, %s, %s, %s, %s)")
+    for r in rows:
+        logger.debug(f"New listing: {r.id}")
+
+
+def replay_card_fields(rows):
+    """
+    Обновляет поля карточек по результатам повторного разбора архива (bot.replay).
+    rows — список Listing; пустые извлечённые значения не затирают сохранённые.
+    Объявления, которых уже нет в listings (например, ушли в архив), не создаются заново.
+    """
+    if not rows:
+        return
+    with transaction() as cur:
+        update_many(cur, """
+            UPDATE listings SET
+                name = COALESCE(NULLIF(%s, ''), name),
+                price = COALESCE(NULLIF(%s, ''), price),
+                district = COALESCE(NULLIF(%s, ''), district),
+                img_url = COALESCE(NULLIF(%s, ''), img_url),
+                price_uah = COALESCE(%s, price_uah),
+                area = COALESCE(%s, area),
+                location = COALESCE(NULLIF(%s, ''), location),
+                district_key = COALESCE(NULLIF(%s, ''), district_key),
+                fingerprint = COALESCE(%s, fingerprint)
+            WHERE id = %s
+        """, [
+            (
+                r.name, r.price, r.district, r.img_url, r.price_value, r.area, r.location, r.district_key,
+                r.fingerprint if r.name and r.price else None, r.id,
+            )
+            for r in rows
+        ])
+
+
+def replay_detail_fields(rows, placeholder):
+    """
+    Исправляет описание и первое фото по повторному разбору страниц объявлений (bot.replay).
+    rows — список (listing_id, description, img_url). Обновляются только объявления, у которых описание
+    пустое или равно placeholder (селектор не сработал); ещё не загруженные (NULL) остаются в очереди.
+    """
+    if not rows:
+        return
+    with transaction() as cur:
+        update_many(cur, """
+            UPDATE listings SET description = %s, img_url = COALESCE(%s, img_url)
+            WHERE id = %s AND (description = %s OR description = '')
+        """, [(description, img_url, listing_id, placeholder) for listing_id, description, img_url in rows])
+
+
+def fetch_price_inputs():
+    # Всё, что нужно для пересчёта price_stats, одним запросом: (district_key, price_uah, area, upload_dt)
+    with transaction() as cur:
+        cur.execute("""
+            SELECT district_key, price_uah, area, upload_dt FROM listings
+            WHERE district_key IS NOT NULL AND price_uah > 0 AND upload_dt IS NOT NULL
+        """)
+        return cur.fetchall()
+
+
+def replace_price_stats(counts):
+    # counts — (district_key, metric, period, bucket, count); таблица заменяется целиком в одной транзакции
+    with transaction() as cur:
+        cur.execute("DELETE FROM price_stats")
+        if counts:
+            insert_many(cur, """
+                INSERT INTO price_stats (district_key, metric, period, bucket, count) VALUES %s
+            """, counts, "(%s, %s, %s, %s, %s)")
+
+
+def fetch_price_stats(district_key, metric, since_period):
+    # Скетч района за периоды не раньше since_period ('YYYY-MM'): отсортированные (корзина, счётчик)
+    with transaction() as cur:
+        cur.execute("""
+            SELECT bucket, SUM(count) FROM price_stats
+            WHERE district_key = %s AND metric = %s AND period >= %s
+            GROUP BY bucket ORDER BY bucket
+        """, (district_key, metric, since_period))
+        return [(bucket, int(count)) for bucket, count in cur.fetchall()]
+
+
+def link_listing_searches(search_name, rows, now):
+    """
+    Связывает объявления страницы с поиском. Возвращает множество id, которые этот поиск видит впервые.
+    Если поиск пропускает объявление, его общий filter_status становится 'pass'.
+    """
+    listing_ids = [r.id for r in rows]
+    if not listing_ids:
+        return set()
+    with transaction() as cur:
+        cur.execute(
+            f"SELECT listing_id FROM listing_searches WHERE search_name = %s AND listing_id IN ({placeholders(listing_ids)})",
+            (search_name, *listing_ids)
+        )
+        linked = {row[0] for row in cur.fetchall()}
+        new_links = [r for r in rows if r.id not in linked]
+        if not new_links:
+            return set()
+
+        insert_many(cur, """
+            INSERT INTO listing_searches (listing_id, search_name, filter_status, linked_dt)
+            VALUES %s
+            ON CONFLICT (listing_id, search_name) DO NOTHING
+        """, [(r.id, search_name, r.filter_status, now) for r in new_links], "(%s, %s, %s, %s)")
+
+        passed = [r.id for r in new_links if r.filter_status == "pass"]
+        if passed:
+            cur.execute(
+                f"UPDATE listings SET filter_status = 'pass' WHERE id IN ({placeholders(passed)}) "
+                "AND (filter_status IS NULL OR filter_status <> 'pass')",
+                passed
+            )
+    return {r.id for r in new_links}
+
+
+def fetch_listing_searches(listing_ids):
+    # {id объявления: [имена поисков, чьи фильтры его пропустили]}
+    listing_ids = list(listing_ids)
+    result = {listing_id: [] for listing_id in listing_ids}
+    if not listing_ids:
+        return result
+    with transaction() as cur:
+        cur.execute(
+            f"SELECT listing_id, search_name FROM listing_searches "
+            f"WHERE filter_status = 'pass' AND listing_id IN ({placeholders(listing_ids)}) ORDER BY search_name",
+            listing_ids
+        )
+        for listing_id, search_name in cur.fetchall():
+            result[listing_id].append(search_name)
+    return result
+
+
+def get_high_water_mark(search_key):
+    with transaction() as cur:
+        cur.execute("SELECT high_water_dt FROM crawl_state WHERE search_key = %s", (search_key,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_high_water_mark(search_key, high_water_dt):
+    with transaction() as cur:
+        cur.execute("""
+            INSERT INTO crawl_state (search_key, high_water_dt, updated_dt)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (search_key) DO UPDATE SET
+                high_water_dt = CASE
+                    WHEN crawl_state.high_water_dt IS NULL OR excluded.high_water_dt > crawl_state.high_water_dt
+                    THEN excluded.high_water_dt ELSE crawl_state.high_water_dt
+                END,
+                updated_dt = excluded.updated_dt
+        """, (search_key, high_water_dt, datetime.now(timezone.utc)))
+
+
+def claim_listings_to_enrich(since, owner, lease_seconds, limit, expired_before=None):
+    """
+    Забирает в аренду до limit объявлений без описания. Строки, которые прямо сейчас забирает
+    другой процесс, пропускаются (FOR UPDATE SKIP LOCKED), а брошенные аренды истекают через lease_seconds,
+    поэтому упавший процесс ничего не блокирует. С expired_before берутся только аренды, истёкшие до этого
+    момента: объявления, которые вызывающий уже пробовал в этом проходе, повторно не забираются. Первыми забираются самые свежие объявления (created_at_dt DESC),
+    строки возвращаются в том же порядке: (id, name, district, price, price_uah, created_at_dt, district_key, area).
+    """
+    now = datetime.now(timezone.utc)
+    skip_locked = "" if is_sqlite() else "FOR UPDATE SKIP LOCKED"
+    with transaction() as cur:
+        cur.execute(f"""
+            UPDATE listings SET lease_owner = %s, lease_until = %s
+            WHERE id IN (
+                SELECT id FROM listings
+                WHERE description IS NULL
+                  AND created_at_dt >= %s
+                  AND filter_status = 'pass'
+                  AND (lease_until IS NULL OR lease_until < %s)
+                ORDER BY created_at_dt DESC
+                LIMIT %s
+                {skip_locked}
+            )
+            RETURNING id, name, district, price, price_uah, created_at_dt, district_key, area
+        """, (owner, now + timedelta(seconds=lease_seconds), since, min(now, expired_before or now), limit))
+        rows = cur.fetchall()
+    # RETURNING не гарантирует порядок
+    return sorted(rows, key=lambda row: row[5], reverse=True)
+
+
+def release_listing_lease(listing_id, owner):
+    # Досрочно возвращаем объявление в очередь (например, при остановке процесса посреди пачки)
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE listings SET lease_owner = NULL, lease_until = NULL "
+            "WHERE id = %s AND lease_owner = %s AND description IS NULL",
+            (listing_id, owner)
+        )
+
+
+def lock_key(name):
+    # Стабильный числовой ключ advisory-блокировки по имени
+    import zlib
+
+    return zlib.crc32(name.encode())
+
+
+@contextmanager
+def advisory_lock(name):
+    """
+    Неблокирующая advisory-блокировка PostgreSQL на время блока (выбор ведущего процесса).
+    Отдаёт True, если блокировка получена. Блокировка привязана к соединению, поэтому при падении
+    процесса освобождается сама. Для SQLite (один процесс) всегда True.
+    """
+    if is_sqlite():
+        yield True
+        return
+
+    with _init_lock:
+        if _pool is None:
+            _connect()
+    conn = _getconn()
+    key = lock_key(name)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            acquired = cur.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+    finally:
+        conn.autocommit = False
+        _putconn(conn)
+
+
+def mark_listing_unavailable(listing_id, owner):
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE listings SET description = 'NOT AVAILABLE', img_url = NULL, lease_until = NULL "
+            "WHERE id = %s AND lease_owner = %s AND description IS NULL",
+            (listing_id, owner)
+        )
+
+
+def mark_listing_filtered(listing_id, description, rule, owner):
+    # Описание отклонено фильтром — сохраняем его, но сообщение не отправляем
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE listings SET description = %s, filter_status = %s, lease_until = NULL "
+            "WHERE id = %s AND lease_owner = %s AND description IS NULL",
+            (description, rule, listing_id, owner)
+        )
+
+
+def save_details_with_outbox(
+    listing_id, owner, description, img_url, messages, photo, listing_created_dt=None, minhash=None,
+    duplicate_of=None, media=None
+):
+    # messages — список (chat_id, caption): по сообщению в каждый чат совпавших поисков
+    now = datetime.now(timezone.utc)
+    media = json.dumps(media) if media else None
+    with transaction() as cur:
+        cur.execute("""
+            UPDATE listings SET description = %s, img_url = %s, minhash = %s, duplicate_of = %s, lease_until = NULL
+            WHERE id = %s AND lease_owner = %s AND description IS NULL
+        """, (description, img_url, minhash, duplicate_of, listing_id, owner))
+        if cur.rowcount == 0:
+            # Аренда истекла, и объявление уже обработал другой процесс: второе сообщение было бы дублем
+            return False
+        for chat_id, caption in messages:
+            cur.execute("""
+                INSERT INTO outbox (listing_id, chat_id, caption, photo, media, created_dt, listing_created_dt)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (listing_id, chat_id, caption, photo, media, now, listing_created_dt))
+    return True
+
+
+def iter_minhashes(since, batch_size=10000):
+    # (id, подпись) объявлений, встречавшихся с since, — для индекса репостов (bot.dedup); репосты не входят
+    last_id = ""
+    while True:
+        with transaction() as cur:
+            cur.execute("""
+                SELECT id, minhash FROM listings
+                WHERE minhash IS NOT NULL AND duplicate_of IS NULL AND last_seen_dt >= %s AND id > %s
+                ORDER BY id LIMIT %s
+            """, (since, last_id, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def fetch_listing_price(listing_id):
+    # (price, price_uah) объявления или None
+    with transaction() as cur:
+        cur.execute("SELECT price, price_uah FROM listings WHERE id = %s", (listing_id,))
+        return cur.fetchone()
+
+
+def fetch_pending_outbox_ids():
+    # Очередь отправки: сначала сообщения о самых свежих объявлениях
+    with transaction() as cur:
+        cur.execute("""
+            SELECT id FROM outbox
+            WHERE status = 'pending'
+            ORDER BY CASE WHEN listing_created_dt IS NULL THEN 1 ELSE 0 END, listing_created_dt DESC, id
+        """)
+        return [row[0] for row in cur.fetchall()]
+
+
+def fetch_outbox_rows(outbox_ids):
+    # Строки outbox в порядке outbox_ids; уже отправленные другим способом пропускаются
+    outbox_ids = list(outbox_ids)
+    if not outbox_ids:
+        return []
+    with transaction() as cur:
+        cur.execute(f"""
+            SELECT id, listing_id, chat_id, caption, photo, created_dt, listing_created_dt, media
+            FROM outbox
+            WHERE status = 'pending' AND id IN ({placeholders(outbox_ids)})
+        """, outbox_ids)
+        rows = {row[0]: row for row in cur.fetchall()}
+    return [rows[i] for i in outbox_ids if i in rows]
+
+
+def ensure_archive_partitions(cur, months):
+    # Месячные секции listings_archive (только PostgreSQL); months — даты первого числа месяца
+    if is_sqlite():
+        return
+    for month in months:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS listings_archive_{month:%Y_%m} PARTITION OF listings_archive
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')
+        """)
+
+
+def archive_listings(cutoff, batch_size, archive=True):
+    """
+    Переносит в listings_archive (или удаляет, если archive=False) одну пачку объявлений,
+    которые не появлялись в выдаче с cutoff и опубликованы раньше cutoff. Вместе с ними удаляются
+    связи с поисками и отправленные сообщения outbox. Возвращает число перенесённых строк.
+    """
+    now = datetime.now(timezone.utc)
+    with transaction() as cur:
+        cur.execute("""
+            SELECT id, created_at_dt FROM listings
+            WHERE last_seen_dt < %s AND (created_at_dt IS NULL OR created_at_dt < %s)
+            LIMIT %s
+        """, (cutoff, cutoff, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        in_ids = placeholders(ids)
+
+        if archive:
+            months = {dt.astimezone(timezone.utc).date().replace(day=1) for _, dt in rows if dt}
+            ensure_archive_partitions(cur, sorted(months))
+            cur.execute(f"""
+                INSERT INTO listings_archive (
+                    id, name, price, district, img_url, description, last_seen_dt, upload_dt, created_at_dt,
+                    price_uah, location, district_key, filter_status, fingerprint, duplicate_of, area,
+                    archived_dt
+                )
+                SELECT id, name, price, district, img_url, description, last_seen_dt, upload_dt, created_at_dt,
+                       price_uah, location, district_key, filter_status, fingerprint, duplicate_of, area, %s
+                FROM listings WHERE id IN ({in_ids})
+            """, (now, *ids))
+        cur.execute(f"DELETE FROM listing_searches WHERE listing_id IN ({in_ids})", ids)
+        cur.execute(f"DELETE FROM outbox WHERE status = 'sent' AND listing_id IN ({in_ids})", ids)
+        cur.execute(f"DELETE FROM listings WHERE id IN ({in_ids})", ids)
+    return len(ids)
+
+
+def mark_outbox_sent(outbox_ids):
+    outbox_ids = list(outbox_ids)
+    if not outbox_ids:
+        return
+    with transaction() as cur:
+        cur.execute(
+            f"UPDATE outbox SET status = 'sent', sent_dt = %s, photo = NULL WHERE id IN ({placeholders(outbox_ids)})",
+            (datetime.now(timezone.utc), *outbox_ids)
+        )
+
+
+def mark_outbox_failed(outbox_id, error, max_attempts):
+    with transaction() as cur:
+        cur.execute("""
+            UPDATE outbox SET
+                attempts = attempts + 1,
+                last_error = %s,
+                status = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'pending' END
+            WHERE id = %s
+        """, (str(error)[:500], max_attempts, outbox_id))
+
+
+def fetch_telegram_file_ids(keys):
+    # {ключ: file_id} для фото, уже загруженных в Telegram
+    keys = list(keys)
+    if not keys:
+        return {}
+    with transaction() as cur:
+        cur.execute(f"SELECT media_key, file_id FROM telegram_files WHERE media_key IN ({placeholders(keys)})", keys)
+        return dict(cur.fetchall())
+
+
+def save_telegram_file_ids(rows):
+    # rows — список (ключ, file_id)
+    rows = list(rows)
+    if not rows:
+        return
+    now = datetime.now(timezone.utc)
+    with transaction() as cur:
+        insert_many(cur, """
+            INSERT INTO telegram_files (media_key, file_id, created_dt)
+            VALUES %s
+            ON CONFLICT (media_key) DO UPDATE SET file_id = excluded.file_id, created_dt = excluded.created_dt
+        """, [(key, file_id, now) for key, file_id in rows], "(%s, %s, %s)")
+
+
+def forget_telegram_file_ids(keys):
+    # Telegram отклонил file_id — следующая отправка загрузит фото заново
+    keys = list(keys)
+    if not keys:
+        return
+    with transaction() as cur:
+        cur.execute(f"DELETE FROM telegram_files WHERE media_key IN ({placeholders(keys)})", keys)
@@ -0,0 +1,154 @@
+"""
+Поиск повторно опубликованных объявлений (репостов) по почти совпадающему тексту.
+
+Агентства публикуют ту же квартиру под новым id с небольшими правками заголовка и описания.
+Дедупликация по id (bot.bloom, bot.db) такие объявления не ловит, и каждое стоит загрузки
+страницы, шести фото, коллажа и сообщения в Telegram.
+
+- minhash(text):
+    MinHash-подпись (DEDUP_NUM_PERM 32-битных значений) по множеству словесных шинглов
+    нормализованного текста (заголовок + описание). Доля совпавших позиций двух подписей —
+    оценка коэффициента Жаккара их шинглов. Для текста короче DEDUP_MIN_SHINGLES шинглов — None:
+    одинаковые шаблонные заголовки («Здам квартиру») разных квартир иначе совпали бы целиком.
+- pack_signature(signature) / unpack_signature(data):
+    Компактное хранение подписи в listings.minhash (4 байта на позицию).
+- RepostIndex(threshold):
+    LSH-индекс в памяти: подпись режется на DEDUP_BANDS полос, объявления с совпавшей полосой —
+    кандидаты, среди них выбирается самое похожее с оценкой не ниже threshold.
+    query_or_add(listing_id, signature) — атомарно находит оригинал или добавляет объявление в индекс.
+- get_repost_index():
+    Индекс подписей объявлений за DEDUP_WINDOW_DAYS, строится из базы при первом обращении.
+"""
+
+import hashlib
+import logging
+import random
+import re
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+
+from bot.config import (
+    DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD, DEDUP_SHINGLE_SIZE, DEDUP_WINDOW_DAYS, DEDUP_MIN_SHINGLES,
+)
+from bot.db import iter_minhashes
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Параметры перестановок фиксированы: подписи, сохранённые в базе, остаются сравнимыми между запусками
+_rng = random.Random(20240501)
+PERMUTATIONS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(DEDUP_NUM_PERM)
+]
+SIGNATURE_FORMAT = f"<{DEDUP_NUM_PERM}I"
+SIGNATURE_SIZE = struct.calcsize(SIGNATURE_FORMAT)
+
+
+def normalize(text):
+    # Нижний регистр, только буквы и цифры: правки пунктуации, эмодзи и регистра не меняют шинглы
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def shingles(text, size=None):
+    size = size or DEDUP_SHINGLE_SIZE
+    words = normalize(text)
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text):
+    text_shingles = shingles(text)
+    if len(text_shingles) < max(1, DEDUP_MIN_SHINGLES):
+        return None
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little")
+        for shingle in text_shingles
+    ]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) & MAX_HASH for a, b in PERMUTATIONS)
+
+
+def pack_signature(signature):
+    return struct.pack(SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    return struct.unpack(SIGNATURE_FORMAT, bytes(data))
+
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class RepostIndex:
+    def __init__(self, threshold=None, bands=None):
+        self.threshold = DEDUP_THRESHOLD if threshold is None else threshold
+        self.bands = bands or DEDUP_BANDS
+        self.rows = DEDUP_NUM_PERM // self.bands
+        self.signatures = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _find(self, listing_id, signature):
+        candidates = set()
+        for key in self.band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        candidates.discard(listing_id)
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            score = similarity(signature, self.signatures[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return (best, best_score) if best is not None else None
+
+    def _add(self, listing_id, signature):
+        if listing_id in self.signatures:
+            return
+        self.signatures[listing_id] = signature
+        for key in self.band_keys(signature):
+            self.buckets.setdefault(key, []).append(listing_id)
+
+    def add(self, listing_id, signature):
+        with self.lock:
+            self._add(listing_id, signature)
+
+    def query(self, listing_id, signature):
+        # (id оригинала, оценка сходства) или None
+        with self.lock:
+            return self._find(listing_id, signature)
+
+    def query_or_add(self, listing_id, signature):
+        # Под одной блокировкой: два репоста из одной пачки не пройдут оба как оригиналы
+        with self.lock:
+            found = self._find(listing_id, signature)
+            if found is None:
+                self._add(listing_id, signature)
+            return found
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_repost_index():
+    global _index
+    with _lock:
+        if _index is None:
+            index = RepostIndex()
+            since = datetime.now(timezone.utc) - timedelta(days=DEDUP_WINDOW_DAYS)
+            for listing_id, data in iter_minhashes(since):
+                # Подписи с другим DEDUP_NUM_PERM несравнимы — такие объявления просто не участвуют
+                if len(data) == SIGNATURE_SIZE:
+                    index.add(listing_id, unpack_signature(data))
+            _index = index
+            logger.info(f"Loaded {len(index)} listing signatures into repost index")
+        return _index
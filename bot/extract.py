@@ -0,0 +1,240 @@
+"""
+Модуль для извлечения объявлений из HTML страницы результатов OLX.
+
+OLX отдаёт страницу вместе с предрендеренным состоянием приложения
+(window.__PRERENDERED_STATE__ = "<JSON-строка>"). Из него объявления читаются напрямую,
+без построения DOM-дерева и без привязки к сгенерированным CSS-классам.
+Если состояние не найдено или имеет неожиданный формат, используется старый парсер по CSS-селекторам.
+
+Функции:
+
+- extract_listings(html):
+    Возвращает список Listing со страницы: сначала через JSON-состояние, при неудаче — через DOM.
+- parse_state_listings(html):
+    Извлекает объявления из JSON-состояния. Возвращает None, если состояния на странице нет.
+- parse_dom_listings(html) / parse_card(card):
+    Резервный парсер: BeautifulSoup + CSS-селекторы карточек.
+- is_inactive(soup) / parse_description(soup) / get_all_slider_images(soup):
+    Разбор страницы объявления: снято ли с публикации, описание и фото из слайдера.
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from bot import metrics
+from bot.utils import parse_ukr_date, parse_price, split_location, normalize_district, resize_image_url
+
+logger = logging.getLogger(__name__)
+
+STATE_MARKER = "window.__PRERENDERED_STATE__"
+PHOTO_SIZE = "600x300"
+DESCRIPTION_NOT_FOUND = "Опис не знайдено"
+
+
+@dataclass
+class Listing:
+    id: str
+    name: str
+    price: str
+    district: str
+    img_url: str = None
+    created_at_dt: datetime = None
+    price_value: int = None
+    area: float = None
+    url: str = None
+    filter_status: str = None  # 'pass' или имя правила bot.filters, отклонившего объявление
+
+    @property
+    def location(self):
+        return split_location(self.district)[0]
+
+    @property
+    def district_key(self):
+        return normalize_district(self.location)
+
+    @property
+    def fingerprint(self):
+        # Короткий отпечаток полей карточки: по нему при повторном обходе видно, изменилось ли объявление.
+        # Строку района целиком не берём — в DOM-карточках в ней дата «Оновлено», меняющаяся без изменений
+        fields = "\x1f".join(str(v) for v in (self.name, self.price, self.price_value, self.location))
+        return hashlib.blake2b(fields.encode(), digest_size=8).hexdigest()
+
+
+def extract_listings(html):
+    listings = parse_state_listings(html)
+    if listings is None:
+        logger.warning("Prerendered state not found, falling back to CSS selectors")
+        listings = parse_dom_listings(html)
+    return listings
+
+
+def load_state(html):
+    # Ищем присваивание состояния и декодируем строковый литерал, затем сам JSON внутри него
+    pos = html.find(STATE_MARKER)
+    if pos == -1:
+        return None
+    start = html.find('"', pos + len(STATE_MARKER))
+    if start == -1:
+        return None
+    try:
+        raw, _ = json.JSONDecoder().raw_decode(html, start)
+        return json.loads(raw)
+    except ValueError as e:
+        logger.warning(f"Cannot decode prerendered state: {e}")
+        return None
+
+
+def parse_state_listings(html):
+    state = load_state(html)
+    if state is None:
+        return None
+    try:
+        ads = state["listing"]["listing"]["ads"]
+    except (KeyError, TypeError):
+        return None
+
+    listings = []
+    for ad in ads:
+        try:
+            listings.append(listing_from_ad(ad))
+        except Exception as e:
+            logger.error(f"Error parsing ad from state: {e}")
+    return listings
+
+
+def listing_from_ad(ad):
+    price = ad.get("price") or {}
+    regular = price.get("regularPrice") or {}
+    location = ad.get("location") or {}
+
+    # Дата обновления совпадает с датой, которую OLX показывает в карточке
+    posted = ad.get("lastRefreshTime") or ad.get("createdTime")
+    created_at_dt = (
+        datetime.fromisoformat(posted).astimezone(timezone.utc) if posted else datetime.now(timezone.utc)
+    )
+
+    # Формат как в карточке: "Київ, Печерський - <дата>"
+    place = ", ".join(p for p in (location.get("cityName"), location.get("districtName")) if p)
+    district = f"{place} - {created_at_dt:%d.%m.%Y %H:%M}"
+
+    photos = ad.get("photos") or []
+    img_url = photos[0].replace("{width}x{height}", PHOTO_SIZE) if photos else None
+
+    area = None
+    for param in ad.get("params") or []:
+        if param.get("key") == "total_area":
+            try:
+                area = float(param.get("normalizedValue"))
+            except (TypeError, ValueError):
+                pass
+
+    price_value = regular.get("value")
+    return Listing(
+        id=str(ad["id"]),
+        name=ad.get("title") or "",
+        price=price.get("displayValue") or "",
+        district=district,
+        img_url=img_url,
+        created_at_dt=created_at_dt,
+        price_value=int(price_value) if price_value is not None else None,
+        area=area,
+        url=ad.get("url"),
+    )
+
+
+def parse_dom_listings(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    cards = soup.select("div[data-cy='l-card']")
+    listings = []
+    for card in cards:
+        with metrics.span("parse_card"):
+            listing = parse_card(card)
+        if listing:
+            listings.append(listing)
+    return listings
+
+
+def parse_card(card):
+    try:
+        listing_id = card.get("id")
+        # Пропускаем карточки без ID
+        if not listing_id:
+            return None
+
+        # Получаем название объявления
+        title_tag = card.select_one("a.css-1tqlkj0 h4")
+        title = title_tag.get_text(strip=True) if title_tag else ""
+
+        # Получаем цену объявления
+        price_tag = card.select_one('[data-testid="ad-price"]')
+        price = price_tag.get_text(strip=True) if price_tag else ""
+
+        # Получаем информацию о районе и дате публикации
+        district_tag = card.select_one('[data-testid="location-date"]')
+        district = district_tag.get_text(strip=True) if district_tag else ""
+
+        # Получаем URL изображения
+        img_tag = card.select_one("img.css-8wsg1m")
+        img_url = img_tag.get("src") if img_tag else None
+
+        created_at_dt = datetime.now(timezone.utc)  # По умолчанию текущая дата
+
+        if district and " - " in district:
+            # Разделяем район и дату, парсим дату из строки
+            _, date_part = district.split(" - ", 1)
+            parsed_date = parse_ukr_date(date_part)
+            if parsed_date:
+                created_at_dt = parsed_date  # Используем распарсенную дату
+
+        try:
+            price_value = parse_price(price)
+        except ValueError:
+            price_value = None
+
+        return Listing(
+            id=listing_id,
+            name=title,
+            price=price,
+            district=district,
+            img_url=img_url,
+            created_at_dt=created_at_dt,
+            price_value=price_value,
+        )
+    except Exception as e:
+        logger.error(f"Error parsing card: {e}")
+        return None
+
+
+def is_inactive(soup):
+    inactive_div = soup.select_one('div[data-testid="ad-inactive-msg"]')
+    return bool(inactive_div and "Це оголошення більше не доступне" in inactive_div.text)
+
+
+def get_all_slider_images(soup):
+    img_elements = soup.select('div.swiper-zoom-container img')
+    img_urls = []
+    for img in img_elements:
+        src = img.get('src')
+        if src:
+            # Меняем URL изображения на нужный размер
+            src_resized = resize_image_url(src)
+            # Добавляем только уникальные URL
+            if src_resized not in img_urls:
+                img_urls.append(src_resized)
+    logger.debug(f"Found {len(img_urls)} image URLs in slider")
+    return img_urls
+
+
+def parse_description(soup):
+    desc_container = soup.select_one('div[data-testid="ad_description"]')
+    if desc_container:
+        desc_elem = desc_container.select_one('div.css-19duwlz')
+        if desc_elem:
+            # Возвращаем текст описания с пробелами между элементами
+            return desc_elem.get_text(separator=' ', strip=True)
+    return DESCRIPTION_NOT_FOUND  # Если описание не найдено
@@ -0,0 +1,158 @@
+"""
+Модуль фильтрации объявлений по правилам из файла конфигурации (filters.json).
+
+Правила:
+- district — белый список нормализованных районов (bot.utils.normalize_district);
+- price    — ценовой диапазон в гривнах (min / max);
+- area     — минимальная площадь, м²;
+- keywords — запрещённые слова в названии и/или описании.
+Правило можно отключить полем "enabled": false без правки кода и SQL.
+
+Все ключевые слова всех правил компилируются в один автомат Ахо — Корасик, поэтому текст
+просматривается за один проход независимо от числа слов. Перед поиском текст и слова приводятся
+к общему виду (fold): нижний регистр, украинские и русские буквы сводятся друг к другу (і/ы → и, є/э/ё → е,
+ї → и, ґ → г), апострофы удаляются — одно слово в конфиге покрывает оба языка.
+
+Класс:
+
+- FilterEngine(rules) / FilterEngine.from_file(path):
+    check_card(listing) — проверяет карточку (район, цена, площадь, слова в названии);
+    check_description(text) — проверяет описание (слова в описании).
+    Оба метода возвращают имя отклонившего правила или None, и считают срабатывания каждого правила.
+    log_stats(reset=True) — пишет в лог число срабатываний по правилам за запуск.
+"""
+
+import json
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+FOLD_TABLE = str.maketrans({
+    "і": "и", "ы": "и", "ї": "и",
+    "є": "е", "э": "е", "ё": "е",
+    "ґ": "г",
+    "'": None, "’": None, "ʼ": None, "`": None,
+})
+
+
+def fold(text):
+    return (text or "").casefold().translate(FOLD_TABLE)
+
+
+class AhoCorasick:
+    """Автомат для поиска множества подстрок за один проход по тексту."""
+
+    def __init__(self, patterns):
+        # patterns — список (строка, значение); значение возвращается при совпадении
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, value in patterns:
+            self.add(pattern, value)
+        self.build()
+
+    def add(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append(value)
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text):
+        # Возвращает множество значений всех найденных шаблонов
+        found = set()
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class FilterEngine:
+    def __init__(self, rules):
+        self.rules = [r for r in rules if r.get("enabled", True)]
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+        patterns = []
+        for idx, rule in enumerate(self.rules):
+            if rule["type"] == "keywords":
+                patterns.extend((fold(word), idx) for word in rule.get("exclude", []))
+        self.matcher = AhoCorasick(patterns) if patterns else None
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        engine = cls(config.get("rules", []))
+        logger.info(f"Loaded {len(engine.rules)} filter rules from {path}")
+        return engine
+
+    def reject(self, rule):
+        with self.lock:
+            self.stats[rule["name"]] += 1
+        return rule["name"]
+
+    def keyword_rules(self, text, field):
+        # Индексы keyword-правил, чьи слова нашлись в тексте данного поля
+        if not self.matcher or not text:
+            return set()
+        return {idx for idx in self.matcher.search(fold(text)) if field in self.rules[idx].get("fields", ["title"])}
+
+    def check_card(self, listing):
+        title_hits = self.keyword_rules(listing.name, "title")
+        for idx, rule in enumerate(self.rules):
+            kind = rule["type"]
+            if kind == "district" and listing.district_key not in rule["allow"]:
+                return self.reject(rule)
+            if kind == "price" and listing.price_value is not None:
+                if listing.price_value < rule.get("min", 0) or listing.price_value > rule.get("max", float("inf")):
+                    return self.reject(rule)
+            if kind == "area" and listing.area is not None and listing.area < rule.get("min", 0):
+                return self.reject(rule)
+            if kind == "keywords" and idx in title_hits:
+                return self.reject(rule)
+        with self.lock:
+            self.stats["passed"] += 1
+        return None
+
+    def check_description(self, text):
+        hits = self.keyword_rules(text, "description")
+        for idx in sorted(hits):
+            return self.reject(self.rules[idx])
+        return None
+
+    def log_stats(self, reset=True):
+        with self.lock:
+            stats = dict(self.stats)
+            if reset:
+                self.stats.clear()
+        if stats:
+            summary = ", ".join(f"{name}={count}" for name, count in sorted(stats.items()))
+            logger.info(f"Filter matches: {summary}")
+        return stats
+
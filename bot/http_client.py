@@ -0,0 +1,199 @@
+"""
+Общий HTTP-клиент для всех исходящих запросов бота (страницы OLX и CDN изображений).
+
+- Отдельный пул keep-alive соединений на каждый хост: TCP- и TLS-соединения к olx.ua и к CDN
+  переиспользуются между запросами, потоками и циклами демона.
+- HTTP/2 через httpx, если установлены httpx и h2 (HTTP2_ENABLED=0 отключает); иначе requests/urllib3.
+- Сжатие ответов: gzip/deflate всегда, brotli — если установлен пакет brotli.
+- Повторы только временных ошибок (обрыв соединения, таймаут, 429, 5xx) с экспоненциальной
+  задержкой и полным джиттером (HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_CAP);
+  заголовок Retry-After учитывается. Перед каждой попыткой соблюдается лимит частоты хоста (HostRateLimiter).
+- Счётчики по хостам: число запросов, повторов, ошибок, средняя и максимальная задержка (stats(), log_stats()).
+
+Использование:
+    from bot.http_client import get_client
+    response = get_client().get(url)
+    response.raise_for_status()
+"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bot.config import (
+    OLX_REQUESTS_PER_SEC, HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_CAP, HTTP_POOL_SIZE, HTTP2_ENABLED,
+)
+from bot.ratelimit import HostRateLimiter
+
+try:
+    import httpx
+    import h2  # noqa: F401 — без h2 httpx не умеет HTTP/2
+except ImportError:
+    httpx = None
+
+try:
+    import brotli  # noqa: F401 — urllib3 и httpx распаковывают br, если пакет установлен
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/115.0.0.0 Safari/537.36"
+)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout) + ((httpx.TransportError,) if httpx else ())
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    retries: int = 0
+    errors: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "latency_avg": self.latency_total / self.requests if self.requests else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+
+class HttpClient:
+    def __init__(self, limiter=None, max_retries=None, backoff_base=None, backoff_cap=None,
+                 pool_size=None, timeout=10, http2=None):
+        self.limiter = limiter
+        self.max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = HTTP_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_cap = HTTP_BACKOFF_CAP if backoff_cap is None else backoff_cap
+        self.pool_size = pool_size or HTTP_POOL_SIZE
+        self.timeout = timeout
+        self.http2 = (HTTP2_ENABLED if http2 is None else http2) and httpx is not None
+        self.headers = {"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+        self.clients = {}
+        self.host_stats = {}
+        self.lock = threading.Lock()
+
+    def client_for(self, host):
+        # Один клиент (и пул соединений) на хост
+        with self.lock:
+            client = self.clients.get(host)
+            if client is None:
+                client = self.clients[host] = self.make_client()
+            return client
+
+    def make_client(self):
+        if self.http2:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            return httpx.Client(http2=True, headers=self.headers, limits=limits, follow_redirects=True)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def stats_for(self, host):
+        with self.lock:
+            return self.host_stats.setdefault(host, HostStats())
+
+    def backoff(self, attempt, retry_after=None):
+        # Полный джиттер: случайная пауза от 0 до base * 2^attempt (не больше cap)
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_cap, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def get(self, url, timeout=None, headers=None):
+        """
+        GET с повторами временных ошибок. Возвращает ответ (в том числе с кодом 4xx, а также
+        последний ответ с кодом из RETRY_STATUSES, если попытки кончились); статус проверяет вызывающий.
+        Сетевые ошибки после последней попытки пробрасываются.
+        """
+        host = urlsplit(url).hostname
+        client = self.client_for(host)
+        stats = self.stats_for(host)
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                self.limiter.wait(url)
+            started = time.monotonic()
+            try:
+                response = client.get(url, timeout=timeout or self.timeout, headers=headers)
+                error = None
+            except TRANSIENT_ERRORS as e:
+                response, error = None, e
+            elapsed = time.monotonic() - started
+
+            retryable = error is not None or response.status_code in RETRY_STATUSES
+            with self.lock:
+                stats.requests += 1
+                stats.latency_total += elapsed
+                stats.latency_max = max(stats.latency_max, elapsed)
+                if retryable or response.status_code >= 400:
+                    stats.errors += 1
+
+            if not retryable or attempt == self.max_retries:
+                break
+
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            delay = self.backoff(attempt, retry_after)
+            reason = error or f"HTTP {response.status_code}"
+            logger.warning(f"GET {url} failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+            with self.lock:
+                stats.retries += 1
+            time.sleep(delay)
+
+        if error is not None:
+            raise error
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {host: s.as_dict() for host, s in self.host_stats.items()}
+
+    def log_stats(self):
+        for host, s in sorted(self.stats().items()):
+            logger.info(
+                f"HTTP {host}: {s['requests']} requests, {s['retries']} retries, {s['errors']} errors, "
+                f"latency avg {s['latency_avg'] * 1000:.0f} ms, max {s['latency_max'] * 1000:.0f} ms"
+            )
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Один клиент на процесс; общий лимит частоты запросов к olx.ua для всех потоков
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(limiter=HostRateLimiter({"www.olx.ua": OLX_REQUESTS_PER_SEC}))
+        return _client
+
+
+def log_stats():
+    if _client is not None:
+        _client.log_stats()
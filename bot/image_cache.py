@@ -0,0 +1,302 @@
+"""
+Локальный кеш изображений объявлений: миниатюры, готовые коллажи и перцептивные хеши фото.
+
+Репосты и повторные попытки загрузки описаний раньше заново скачивали и декодировали те же фото с CDN.
+Кеш хранит в IMAGE_CACHE_DIR:
+- миниатюры (уже уменьшенные, в JPEG) по нормализованному URL (resize_image_url, без query)
+  и размеру миниатюры, вместе с перцептивным хешем (dHash, 64 бита) изображения;
+- готовые JPEG коллажей по хешу набора фото (перцептивные хеши по порядку + параметры коллажа);
+- связи «объявление — хеши его фото» для поиска дубликатов фото между разными id (bot.scraper, bot.dedup).
+Миниатюры и коллажи вытесняются по LRU, когда общий размер файлов превышает IMAGE_CACHE_MAX_MB.
+
+Индекс — отдельный файл SQLite (index.db) в каталоге кеша, не основная база.
+
+Функции:
+
+- perceptual_hash(img): dHash миниатюры (16 шестнадцатеричных символов).
+- normalize_url(url): ключ URL для кеша.
+- get_thumbnail(url, thumb_size) / put_thumbnail(url, thumb_size, img, phash):
+    Миниатюра из кеша (PIL.Image, phash) или None; сохранение миниатюры.
+- lookup_hashes(urls, thumb_size): перцептивные хеши всех URL, если все они есть в кеше, иначе None.
+- collage_key(phashes, *params) / get_collage(key) / put_collage(key, data): кеш готовых коллажей.
+- record_listing_photos(listing_id, phashes) / find_listing_by_photos(listing_id, phashes, min_shared):
+    Запоминает фото объявления и находит другое объявление, у которого не меньше min_shared похожих фото
+    (id и число общих фото). Фото похожи, если их хеши отличаются не больше чем в PHASH_MAX_DISTANCE битах
+    (пережатое, обрезанное или подписанное заново фото); кандидаты ищутся по полосам хеша, как в LSH:
+    хеш делится на PHASH_MAX_DISTANCE + 1 полос, и у похожих фото хотя бы одна полоса совпадает точно.
+При IMAGE_CACHE_ENABLED=0 все функции ничего не находят и ничего не сохраняют.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from urllib.parse import urlsplit, urlunsplit
+
+from PIL import Image
+
+from bot.config import IMAGE_CACHE_DIR, IMAGE_CACHE_ENABLED, IMAGE_CACHE_MAX_MB
+from bot.utils import resize_image_url
+
+logger = logging.getLogger(__name__)
+
+# После вытеснения в кеше остаётся не больше этой доли лимита, чтобы не вытеснять на каждой записи
+EVICT_TARGET = 0.9
+THUMB_QUALITY = 90
+# Хеш однотонного изображения (заглушки, пустые фото) совпадает у разных объявлений и дубликатом не считается
+BLANK_HASH = "0" * 16
+# Похожие фото: расстояние Хэмминга между dHash не больше PHASH_MAX_DISTANCE из 64 бит
+PHASH_BITS = 64
+PHASH_MAX_DISTANCE = 4
+PHASH_BANDS = PHASH_MAX_DISTANCE + 1
+
+_index = None
+_total_size = 0
+_lock = threading.Lock()
+
+
+def get_index():
+    global _index, _total_size
+    with _lock:
+        if _index is None:
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            _index = sqlite3.connect(
+                os.path.join(IMAGE_CACHE_DIR, "index.db"), check_same_thread=False, isolation_level=None
+            )
+            _index.execute("PRAGMA journal_mode=WAL")
+            _index.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    phash TEXT,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_last_used_idx ON entries (last_used);
+                CREATE TABLE IF NOT EXISTS listing_photos (
+                    listing_id TEXT NOT NULL,
+                    phash TEXT NOT NULL,
+                    PRIMARY KEY (listing_id, phash)
+                );
+                CREATE INDEX IF NOT EXISTS listing_photos_phash_idx ON listing_photos (phash);
+                CREATE TABLE IF NOT EXISTS listing_photo_bands (
+                    band INTEGER NOT NULL,
+                    value INTEGER NOT NULL,
+                    listing_id TEXT NOT NULL,
+                    phash TEXT NOT NULL,
+                    PRIMARY KEY (band, value, listing_id, phash)
+                ) WITHOUT ROWID;
+            """)
+            # Фото, записанные до появления полос, индексируются один раз при открытии кеша
+            if _index.execute("SELECT NOT EXISTS (SELECT 1 FROM listing_photo_bands)").fetchone()[0]:
+                _index.executemany(
+                    "INSERT OR IGNORE INTO listing_photo_bands (band, value, listing_id, phash) VALUES (?, ?, ?, ?)",
+                    [
+                        (band, value, listing_id, phash)
+                        for listing_id, phash in _index.execute("SELECT listing_id, phash FROM listing_photos")
+                        for band, value in photo_bands(phash)
+                    ]
+                )
+            _total_size = _index.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return _index
+
+
+def perceptual_hash(img):
+    # dHash: 9x8 в оттенках серого, бит — светлее ли пиксель соседа справа; устойчив к пережатию и масштабу
+    pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def photo_bands(phash):
+    # (номер полосы, её биты): PHASH_BANDS почти равных кусков хеша
+    bits = int(phash, 16)
+    bands = []
+    for band in range(PHASH_BANDS):
+        start = band * PHASH_BITS // PHASH_BANDS
+        end = (band + 1) * PHASH_BITS // PHASH_BANDS
+        bands.append((band, (bits >> start) & ((1 << (end - start)) - 1)))
+    return bands
+
+
+def hamming_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def normalize_url(url):
+    # Один и тот же файл CDN с разным размером в ;s=..., query или регистром хоста — один ключ
+    parts = urlsplit(resize_image_url(url))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, "", ""))
+
+
+def thumb_key(url, thumb_size):
+    return hashlib.sha256(f"{normalize_url(url)}|{thumb_size[0]}x{thumb_size[1]}".encode()).hexdigest()
+
+
+def entry_path(key):
+    return os.path.join(IMAGE_CACHE_DIR, key[:2], f"{key}.jpg")
+
+
+def _read(key, kind):
+    index = get_index()
+    with _lock:
+        row = index.execute("SELECT phash FROM entries WHERE key = ? AND kind = ?", (key, kind)).fetchone()
+    if row is None:
+        return None
+    try:
+        with open(entry_path(key), "rb") as f:
+            data = f.read()
+    except OSError:
+        # Файл удалён вручную или другим процессом — забываем запись
+        with _lock:
+            index.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return None
+    with _lock:
+        index.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+    return data, row[0]
+
+
+def _write(key, kind, data, phash=None):
+    global _total_size
+    index = get_index()
+    path = entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    with _lock:
+        old = index.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        index.execute(
+            "INSERT OR REPLACE INTO entries (key, kind, phash, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, kind, phash, len(data), time.time())
+        )
+        _total_size += len(data) - (old[0] if old else 0)
+        if _total_size > IMAGE_CACHE_MAX_MB * 1024 * 1024:
+            _evict(index)
+
+
+def _evict(index):
+    # Вызывается под _lock: удаляем давно не использованные записи, пока не уложимся в EVICT_TARGET лимита
+    global _total_size
+    target = IMAGE_CACHE_MAX_MB * 1024 * 1024 * EVICT_TARGET
+    evicted = 0
+    for key, size in index.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+        if _total_size <= target:
+            break
+        try:
+            os.remove(entry_path(key))
+        except OSError:
+            pass
+        index.execute("DELETE FROM entries WHERE key = ?", (key,))
+        _total_size -= size
+        evicted += 1
+    logger.info(f"Evicted {evicted} entries from image cache ({_total_size // (1024 * 1024)} MiB left)")
+
+
+def get_thumbnail(url, thumb_size):
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    found = _read(thumb_key(url, thumb_size), "thumb")
+    if found is None:
+        return None
+    data, phash = found
+    img = Image.open(BytesIO(data))
+    img.load()
+    return img, phash
+
+
+def put_thumbnail(url, thumb_size, img, phash):
+    if not IMAGE_CACHE_ENABLED:
+        return
+    try:
+        bio = BytesIO()
+        img.save(bio, "JPEG", quality=THUMB_QUALITY)
+        _write(thumb_key(url, thumb_size), "thumb", bio.getvalue(), phash)
+    except Exception as e:
+        logger.warning(f"Cannot cache thumbnail {url}: {e}")
+
+
+def lookup_hashes(urls, thumb_size):
+    # Хеши без чтения файлов: если все фото уже в кеше, коллаж можно найти сразу по набору хешей
+    if not IMAGE_CACHE_ENABLED or not urls:
+        return None
+    keys = [thumb_key(url, thumb_size) for url in urls]
+    index = get_index()
+    with _lock:
+        rows = dict(index.execute(
+            f"SELECT key, phash FROM entries WHERE kind = 'thumb' AND key IN ({', '.join('?' * len(keys))})", keys
+        ).fetchall())
+    if len(rows) < len(set(keys)):
+        return None
+    return [rows[key] for key in keys]
+
+
+def collage_key(phashes, *params):
+    return hashlib.sha256("|".join([*phashes, *map(str, params)]).encode()).hexdigest()
+
+
+def get_collage(key):
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    found = _read(key, "collage")
+    return found[0] if found else None
+
+
+def put_collage(key, data):
+    if not IMAGE_CACHE_ENABLED:
+        return
+    try:
+        _write(key, "collage", bytes(data))
+    except Exception as e:
+        logger.warning(f"Cannot cache collage: {e}")
+
+
+def record_listing_photos(listing_id, phashes):
+    if not IMAGE_CACHE_ENABLED or not phashes:
+        return
+    phashes = set(phashes) - {BLANK_HASH}
+    index = get_index()
+    with _lock:
+        index.executemany(
+            "INSERT OR IGNORE INTO listing_photos (listing_id, phash) VALUES (?, ?)",
+            [(str(listing_id), phash) for phash in phashes]
+        )
+        index.executemany(
+            "INSERT OR IGNORE INTO listing_photo_bands (band, value, listing_id, phash) VALUES (?, ?, ?, ?)",
+            [(band, value, str(listing_id), phash) for phash in phashes for band, value in photo_bands(phash)]
+        )
+
+
+def find_listing_by_photos(listing_id, phashes, min_shared):
+    # (id другого объявления, число общих фото) при не меньше min_shared похожих фото (по перцептивному хешу) или None
+    phashes = sorted(set(phashes) - {BLANK_HASH})
+    if not IMAGE_CACHE_ENABLED or not min_shared or len(phashes) < min_shared:
+        return None
+    bands = sorted({band for phash in phashes for band in photo_bands(phash)})
+    index = get_index()
+    with _lock:
+        # Кандидаты — фото с хотя бы одной точно совпавшей полосой; расстояние проверяется ниже
+        rows = index.execute(f"""
+            SELECT DISTINCT listing_id, phash FROM listing_photo_bands
+            WHERE ({' OR '.join(['(band = ? AND value = ?)'] * len(bands))}) AND listing_id != ?
+        """, (*(v for band in bands for v in band), str(listing_id))).fetchall()
+
+    candidates = {}
+    for other_id, other_phash in rows:
+        candidates.setdefault(other_id, []).append(other_phash)
+    best = None
+    for other_id, other_phashes in candidates.items():
+        # Общих фото — столько, сколько фото объявления имеют похожее фото у другого объявления
+        shared = sum(
+            any(hamming_distance(phash, other) <= PHASH_MAX_DISTANCE for other in other_phashes) for phash in phashes
+        )
+        if shared >= min_shared and (best is None or (-shared, other_id) < (-best[1], best[0])):
+            best = (other_id, shared)
+    return best
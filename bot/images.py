@@ -0,0 +1,190 @@
+"""
+Модуль для загрузки изображений объявлений и сборки коллажа.
+
+Функции:
+
+- download_thumbnails(img_urls, timeout=10, max_images=7, thumb_size=(300, 400)):
+    Параллельно загружает изображения через общий HTTP-клиент (bot.http_client: пул соединений, повторы)
+    и декодирует их сразу в размере миниатюры: для JPEG используется draft-режим Pillow,
+    который уменьшает изображение ещё при декодировании (в 2/4/8 раз), не разворачивая его целиком в памяти.
+    Масштаб выбирается по итоговому размеру миниатюры с учётом пропорций: фото OLX 600x300 в рамке
+    300x400 становится 300x150, и декодер сразу берёт половинный масштаб.
+    Миниатюры берутся из кеша на диске (bot.image_cache), если уже загружались, и сохраняются в него.
+    Возвращает список (миниатюра, перцептивный хеш) в порядке URL.
+- download_images(...): то же, только миниатюры.
+
+- build_collage(img_urls, max_images=6, thumb_size=(300, 400)):
+    Коллаж в JPEG (BytesIO) и перцептивные хеши его фото. Готовый коллаж ищется в кеше по набору хешей:
+    если все фото и коллаж уже в кеше, ничего не загружается и не декодируется.
+
+- create_collage(images, cols=3, margin=5):
+    Собирает миниатюры в коллаж на чёрном фоне. Возвращает PIL.Image или None.
+
+- encode_collage(collage_img, quality=COLLAGE_QUALITY, max_bytes=TG_PHOTO_MAX_BYTES):
+    Кодирует коллаж один раз в прогрессивный JPEG (оптимизированные таблицы Хаффмана, цветность 4:2:0)
+    прямо в BytesIO, который затем хранится в outbox и передаётся в Telegram без копирования.
+    Если результат больше max_bytes, бинарным поиском подбирается наибольшее качество, укладывающееся
+    в бюджет (не ниже COLLAGE_MIN_QUALITY): Telegram всё равно пережимает фото, а меньший файл быстрее загружается.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from bot import image_cache, metrics
+from bot.config import IMAGE_WORKERS, TG_PHOTO_MAX_BYTES, COLLAGE_QUALITY, COLLAGE_MIN_QUALITY
+from bot.http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    # Один пул потоков на процесс, общий для всех объявлений
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="images")
+        return _executor
+
+
+def load_thumbnail(data, thumb_size):
+    img = Image.open(BytesIO(data))
+    # Для JPEG декодер сразу уменьшает изображение до ближайшего масштаба не меньше итоговой миниатюры.
+    # Просить нужно размер после вписывания в thumb_size: для 600x300 в рамке 300x400 draft с самой рамкой
+    # не уменьшил бы ничего (высота 300 < 400), а с 300x150 декодирует вдвое меньшую картинку
+    width, height = img.size
+    scale = min(thumb_size[0] / width, thumb_size[1] / height)
+    if scale < 1:
+        img.draft('RGB', (max(1, round(width * scale)), max(1, round(height * scale))))
+    img = img.convert('RGB')
+    img.thumbnail(thumb_size)
+    return img
+
+
+def fetch_thumbnail(url, timeout, thumb_size):
+    try:
+        cached = image_cache.get_thumbnail(url, thumb_size)
+        if cached is not None:
+            metrics.incr("image_cache_hits")
+            return cached
+        with metrics.timer("image_download"):
+            response = get_client().get(url, timeout=timeout)
+        response.raise_for_status()
+        with metrics.timer("image_decode"):
+            img = load_thumbnail(response.content, thumb_size)
+            phash = image_cache.perceptual_hash(img)
+        image_cache.put_thumbnail(url, thumb_size, img, phash)
+        logger.debug(f"Downloaded and resized image: {url}")
+        return img, phash
+    except Exception as e:
+        logger.warning(f"Error downloading {url}: {e}")
+        metrics.incr("image_errors")
+        return None
+
+
+def download_thumbnails(img_urls, timeout=10, max_images=7, thumb_size=(300, 400)):
+    urls = img_urls[:max_images]
+    executor = get_executor()
+    futures = [executor.submit(fetch_thumbnail, url, timeout, thumb_size) for url in urls]
+    thumbs = [thumb for thumb in (f.result() for f in futures) if thumb is not None]
+    logger.debug(f"Downloaded {len(thumbs)} images out of {len(img_urls)} URLs")
+    return thumbs
+
+
+def download_images(img_urls, timeout=10, max_images=7, thumb_size=(300, 400)):
+    return [img for img, _ in download_thumbnails(img_urls, timeout, max_images, thumb_size)]
+
+
+def build_collage(img_urls, max_images=6, thumb_size=(300, 400)):
+    urls = img_urls[:max_images]
+    # Все фото уже в кеше — проверяем готовый коллаж, не читая миниатюры
+    phashes = image_cache.lookup_hashes(urls, thumb_size)
+    if phashes is not None:
+        data = image_cache.get_collage(image_cache.collage_key(phashes, thumb_size, COLLAGE_QUALITY, TG_PHOTO_MAX_BYTES))
+        if data is not None:
+            metrics.incr("collage_cache_hits")
+            return as_jpeg_buffer(data), phashes
+
+    thumbs = download_thumbnails(urls, max_images=max_images, thumb_size=thumb_size)
+    if not thumbs:
+        return None, []
+    phashes = [phash for _, phash in thumbs]
+    key = image_cache.collage_key(phashes, thumb_size, COLLAGE_QUALITY, TG_PHOTO_MAX_BYTES)
+    data = image_cache.get_collage(key)
+    if data is not None:
+        # Те же фото под другими URL (репост): коллаж уже собран
+        for img, _ in thumbs:
+            img.close()
+        metrics.incr("collage_cache_hits")
+        return as_jpeg_buffer(data), phashes
+
+    with metrics.timer("collage"):
+        collage = encode_collage(create_collage([img for img, _ in thumbs]))
+    image_cache.put_collage(key, collage.getbuffer())
+    return collage, phashes
+
+
+def as_jpeg_buffer(data):
+    bio = BytesIO(data)
+    bio.name = 'collage.jpg'
+    return bio
+
+
+def create_collage(images, cols=3, margin=5):
+    if not images:
+        logger.warning("No images to create collage")
+        return None  # Нет изображений — коллаж не создаём
+
+    thumb_width, thumb_height = images[0].size
+    # Вычисляем количество рядов с учётом количества колонок
+    rows = (len(images) + cols - 1) // cols
+
+    # Рассчитываем размеры итогового изображения с учётом отступов
+    collage_width = cols * thumb_width + (cols + 1) * margin
+    collage_height = rows * thumb_height + (rows + 1) * margin
+    # Создаём пустое изображение с чёрным фоном
+    collage_img = Image.new('RGB', (collage_width, collage_height), (0, 0, 0))
+
+    # Вставляем каждое изображение в коллаж по координатам с учётом отступов
+    for idx, img in enumerate(images):
+        x = margin + (idx % cols) * (thumb_width + margin)
+        y = margin + (idx // cols) * (thumb_height + margin)
+        collage_img.paste(img, (x, y))
+        img.close()  # миниатюра больше не нужна — сразу освобождаем буфер
+
+    logger.debug(f"Created collage image with size: {collage_img.size}")
+    return collage_img
+
+
+def jpeg_bytes(img, quality):
+    bio = BytesIO()
+    # Прогрессивный JPEG с оптимизированными таблицами меньше базового на 5–10% при том же качестве
+    img.save(bio, 'JPEG', quality=quality, optimize=True, progressive=True, subsampling='4:2:0')
+    return bio.getvalue()
+
+
+def encode_collage(collage_img, quality=None, max_bytes=None):
+    quality = quality or COLLAGE_QUALITY
+    max_bytes = TG_PHOTO_MAX_BYTES if max_bytes is None else max_bytes
+    data = jpeg_bytes(collage_img, quality)
+    if max_bytes and len(data) > max_bytes:
+        # Наибольшее качество, при котором коллаж укладывается в бюджет; если не укладывается и минимальное — берём его
+        low, high = COLLAGE_MIN_QUALITY, quality - 1
+        fitting = smallest = None
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = jpeg_bytes(collage_img, mid)
+            if len(candidate) <= max_bytes:
+                fitting, low = candidate, mid + 1
+            else:
+                smallest, high = candidate, mid - 1
+        data = fitting or smallest or data
+        metrics.incr("collage_requantized")
+        logger.debug(f"Collage re-encoded to {len(data)} bytes to fit {max_bytes}")
+    return as_jpeg_buffer(data)
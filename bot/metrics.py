@@ -0,0 +1,209 @@
+"""
+Метрики и трассировка конвейера обход → загрузка описаний → уведомления.
+
+- Таймеры этапов (timer(stage) / observe(stage, seconds)): число, сумма, максимум и гистограмма
+  длительностей. Этапы: page_fetch, html_parse, db, detail_fetch, image_download, image_decode,
+  collage, telegram_send.
+- Счётчики (incr(name, n)): карточки, новые объявления, отправленные сообщения, повторы и т.п.
+- Вывод: render_prometheus() — текстовый формат Prometheus (накопительно с запуска процесса),
+  summary() — JSON-сводка за последний запуск/цикл. log_summary() пишет сводку в лог и, если задан
+  METRICS_FILE, сохраняет метрики Prometheus в файл (textfile collector node_exporter).
+  Демон может отдавать метрики по HTTP (METRICS_PORT): /metrics и /metrics.json.
+- Трассировка (span(name, **attrs)): при TRACING_ENABLED=1 — спаны OpenTelemetry, если пакет
+  opentelemetry установлен, иначе вложенные спаны пишутся в лог на уровне DEBUG.
+  При выключенной трассировке span() ничего не делает.
+
+Все функции безопасны для вызова из нескольких потоков.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from bot.config import METRICS_FILE, TRACING_ENABLED
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        # За текущий запуск/цикл (сбрасывается в summary(reset=True))
+        self.window_count = 0
+        self.window_total = 0.0
+        self.window_max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.window_count += 1
+        self.window_total += seconds
+        self.window_max = max(self.window_max, seconds)
+
+
+_stages = {}
+_counters = {}
+_window_counters = {}
+_lock = threading.Lock()
+
+
+def observe(stage, seconds):
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats()
+        stats.observe(seconds)
+
+
+@contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def incr(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+        _window_counters[name] = _window_counters.get(name, 0) + n
+
+
+def summary(reset=False):
+    # Сводка за окно (с прошлого сброса): для каждого этапа — число, сумма и максимум в миллисекундах
+    with _lock:
+        result = {
+            "stages": {
+                stage: {
+                    "count": s.window_count,
+                    "total_ms": round(s.window_total * 1000, 1),
+                    "avg_ms": round(s.window_total / s.window_count * 1000, 1) if s.window_count else 0.0,
+                    "max_ms": round(s.window_max * 1000, 1),
+                }
+                for stage, s in sorted(_stages.items()) if s.window_count
+            },
+            "counters": dict(sorted(_window_counters.items())),
+        }
+        if reset:
+            for s in _stages.values():
+                s.window_count, s.window_total, s.window_max = 0, 0.0, 0.0
+            _window_counters.clear()
+    return result
+
+
+def render_prometheus():
+    lines = [
+        "# HELP olx_stage_seconds Duration of pipeline stages",
+        "# TYPE olx_stage_seconds histogram",
+    ]
+    with _lock:
+        for stage, s in sorted(_stages.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s.buckets):
+                cumulative += n
+                lines.append(f'olx_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'olx_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {s.count}')
+            lines.append(f'olx_stage_seconds_sum{{stage="{stage}"}} {s.total:.6f}')
+            lines.append(f'olx_stage_seconds_count{{stage="{stage}"}} {s.count}')
+        lines.append("# HELP olx_stage_seconds_max Longest observed duration of pipeline stages")
+        lines.append("# TYPE olx_stage_seconds_max gauge")
+        for stage, s in sorted(_stages.items()):
+            lines.append(f'olx_stage_seconds_max{{stage="{stage}"}} {s.max:.6f}')
+        for name, value in sorted(_counters.items()):
+            lines.append(f"# TYPE olx_{name}_total counter")
+            lines.append(f"olx_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+def log_summary():
+    # В конце каждого запуска (bot.run) или цикла демона
+    logger.info(f"Metrics: {json.dumps(summary(reset=True), ensure_ascii=False)}")
+    if METRICS_FILE:
+        # Пишем во временный файл и переименовываем, чтобы сборщик не прочитал половину
+        tmp_path = METRICS_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, METRICS_FILE)
+
+
+def render_json():
+    with _lock:
+        return {
+            "stages": {
+                stage: {"count": s.count, "total_s": s.total, "max_s": s.max}
+                for stage, s in sorted(_stages.items())
+            },
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def serve(port):
+    # HTTP-эндпоинт для демона: /metrics (Prometheus) и /metrics.json (накопительная сводка)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics.json":
+                body, content_type = json.dumps(render_json()).encode(), "application/json"
+            elif self.path == "/metrics":
+                body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
+
+
+_trace_local = threading.local()
+
+
+@contextmanager
+def _log_span(name, attrs):
+    depth = getattr(_trace_local, "depth", 0)
+    _trace_local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _trace_local.depth = depth
+        elapsed = (time.perf_counter() - started) * 1000
+        details = " ".join(f"{k}={v}" for k, v in attrs.items())
+        logger.debug(f"span {'  ' * depth}{name} {elapsed:.1f}ms {details}".rstrip())
+
+
+def span(name, **attrs):
+    if not TRACING_ENABLED:
+        return nullcontext()
+    if otel_trace is not None:
+        return otel_trace.get_tracer("olx-bot").start_as_current_span(name, attributes=attrs)
+    return _log_span(name, attrs)
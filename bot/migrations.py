@@ -0,0 +1,305 @@
+"""
+Версионированные миграции схемы базы данных.
+
+Каждая миграция — функция, получающая курсор; список MIGRATIONS упорядочен по версии.
+Применённые версии хранятся в таблице schema_migrations. migrate() применяет недостающие
+миграции по одной, каждую в своей транзакции; в PostgreSQL параллельные запуски
+сериализуются advisory-блокировкой.
+
+Миграции:
+
+1. Исходная схема: listings, crawl_state, outbox.
+2. Типизированные колонки listings: price_uah (цена числом), location (место без даты),
+   district_key (нормализованный район); заполнение существующих строк;
+   частичный индекс для выборки объявлений без описания и индекс по району.
+3. Колонка filter_status: 'pass' или имя правила bot.filters, отклонившего объявление;
+   частичный индекс под выборку прошедших фильтр объявлений без описания.
+4. Таблица listing_searches: какие поиски нашли объявление и результат их фильтров.
+5. Аренда объявлений для загрузки описаний несколькими процессами: lease_owner, lease_until.
+6. Отпечаток карточки (fingerprint) и таблица listing_history с изменениями цены и заголовка.
+7. Дата публикации объявления в outbox (listing_created_dt): отправка от свежих к старым и замер срока уведомления.
+8. Архив listings_archive для задачи хранения (bot.retention): в PostgreSQL секционирован по месяцам
+   created_at_dt (секции создаются по мере архивации), в SQLite — обычная таблица; индекс по upload_dt
+   для догрузки фильтра Блума.
+9. MinHash-подпись текста объявления (minhash) и ссылка на оригинал для репостов (duplicate_of), bot.dedup.
+10. Площадь квартиры (area) и таблица price_stats — скетчи цен и цен за м² по районам (bot.analytics),
+    заполняется по существующим объявлениям.
+11. Альбом вместо коллажа в outbox (media — ссылки на фото) и таблица telegram_files: file_id загруженных
+    в Telegram фото для повторной отправки без загрузки.
+"""
+
+import logging
+import math
+from collections import Counter
+from datetime import datetime, timezone
+
+from bot import db
+from bot.config import STATS_RELATIVE_ACCURACY
+from bot.utils import parse_price, split_location, normalize_district
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_KEY = 7_260_001
+BACKFILL_BATCH_SIZE = 1000
+
+
+def initial_schema(cur):
+    serial = "INTEGER PRIMARY KEY AUTOINCREMENT" if db.is_sqlite() else "BIGSERIAL PRIMARY KEY"
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS listings (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        price TEXT,
+        district TEXT,
+        img_url TEXT,
+        description TEXT,
+        last_seen_dt TIMESTAMPTZ,
+        upload_dt TIMESTAMPTZ,
+        created_at_dt TIMESTAMPTZ
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS crawl_state (
+        search_key TEXT PRIMARY KEY,
+        high_water_dt TIMESTAMPTZ,
+        updated_dt TIMESTAMPTZ
+    )
+    """)
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id {serial},
+        listing_id TEXT,
+        chat_id TEXT,
+        caption TEXT,
+        photo BYTEA,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_dt TIMESTAMPTZ,
+        sent_dt TIMESTAMPTZ
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS outbox_pending_idx ON outbox (id) WHERE status = 'pending'")
+
+
+def typed_listing_columns(cur):
+    cur.execute("ALTER TABLE listings ADD COLUMN price_uah INTEGER")
+    cur.execute("ALTER TABLE listings ADD COLUMN location TEXT")
+    cur.execute("ALTER TABLE listings ADD COLUMN district_key TEXT")
+
+    # Пустое описание раньше тоже считалось «без описания»; приводим к NULL, чтобы хватало частичного индекса
+    cur.execute("UPDATE listings SET description = NULL WHERE description = ''")
+
+    # Заполняем новые колонки для существующих строк пачками по id
+    last_id = ""
+    while True:
+        cur.execute(
+            "SELECT id, price, district FROM listings WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, BACKFILL_BATCH_SIZE)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        db.update_many(cur, """
+            UPDATE listings SET price_uah = %s, location = %s, district_key = %s WHERE id = %s
+        """, [(*typed_fields(price, district), listing_id) for listing_id, price, district in rows])
+        logger.info(f"Backfilled typed columns up to listing {last_id}")
+
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS listings_enrich_idx ON listings (created_at_dt) WHERE description IS NULL"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS listings_district_key_idx ON listings (district_key)")
+
+
+def typed_fields(price, district):
+    # (price_uah, location, district_key) из строковых полей карточки
+    location, _ = split_location(district)
+    try:
+        price_uah = parse_price(price)
+    except ValueError:
+        price_uah = None
+    return price_uah, location, normalize_district(location)
+
+
+def listing_filter_status(cur):
+    # Строки до миграции остаются с NULL и не загружаются — фильтры к ним не применялись
+    cur.execute("ALTER TABLE listings ADD COLUMN filter_status TEXT")
+    cur.execute("DROP INDEX IF EXISTS listings_enrich_idx")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS listings_enrich_pass_idx ON listings (created_at_dt)
+        WHERE description IS NULL AND filter_status = 'pass'
+    """)
+
+
+def listing_searches(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS listing_searches (
+        listing_id TEXT NOT NULL,
+        search_name TEXT NOT NULL,
+        filter_status TEXT,
+        linked_dt TIMESTAMPTZ,
+        PRIMARY KEY (listing_id, search_name)
+    )
+    """)
+
+
+def listing_leases(cur):
+    cur.execute("ALTER TABLE listings ADD COLUMN lease_owner TEXT")
+    cur.execute("ALTER TABLE listings ADD COLUMN lease_until TIMESTAMPTZ")
+
+
+def listing_history(cur):
+    serial = "INTEGER PRIMARY KEY AUTOINCREMENT" if db.is_sqlite() else "BIGSERIAL PRIMARY KEY"
+    # У существующих строк отпечаток пустой и заполнится при следующем появлении карточки
+    cur.execute("ALTER TABLE listings ADD COLUMN fingerprint TEXT")
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS listing_history (
+        id {serial},
+        listing_id TEXT NOT NULL,
+        changed_dt TIMESTAMPTZ,
+        old_name TEXT,
+        new_name TEXT,
+        old_price TEXT,
+        new_price TEXT,
+        old_price_uah INTEGER,
+        new_price_uah INTEGER
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS listing_history_listing_idx ON listing_history (listing_id, changed_dt)")
+
+
+def outbox_priority(cur):
+    cur.execute("ALTER TABLE outbox ADD COLUMN listing_created_dt TIMESTAMPTZ")
+    cur.execute("""
+        UPDATE outbox SET listing_created_dt = (SELECT created_at_dt FROM listings WHERE listings.id = outbox.listing_id)
+        WHERE status = 'pending'
+    """)
+
+
+def listings_archive(cur):
+    # Те же колонки, что у listings, без аренды, плюс дата архивации
+    columns = """
+        id TEXT NOT NULL,
+        name TEXT,
+        price TEXT,
+        district TEXT,
+        img_url TEXT,
+        description TEXT,
+        last_seen_dt TIMESTAMPTZ,
+        upload_dt TIMESTAMPTZ,
+        created_at_dt TIMESTAMPTZ,
+        price_uah INTEGER,
+        location TEXT,
+        district_key TEXT,
+        filter_status TEXT,
+        fingerprint TEXT,
+        archived_dt TIMESTAMPTZ
+    """
+    if db.is_sqlite():
+        cur.execute(f"CREATE TABLE IF NOT EXISTS listings_archive ({columns})")
+    else:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS listings_archive ({columns}) PARTITION BY RANGE (created_at_dt)")
+        # Строки без даты публикации (и вне созданных секций) попадают в секцию по умолчанию
+        cur.execute("CREATE TABLE IF NOT EXISTS listings_archive_default PARTITION OF listings_archive DEFAULT")
+    cur.execute("CREATE INDEX IF NOT EXISTS listings_archive_id_idx ON listings_archive (id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS listings_upload_dt_idx ON listings (upload_dt)")
+
+
+def listing_reposts(cur):
+    cur.execute("ALTER TABLE listings ADD COLUMN minhash BYTEA")
+    cur.execute("ALTER TABLE listings ADD COLUMN duplicate_of TEXT")
+    cur.execute("ALTER TABLE listings_archive ADD COLUMN duplicate_of TEXT")
+
+
+def price_stats(cur):
+    cur.execute("ALTER TABLE listings ADD COLUMN area REAL")
+    cur.execute("ALTER TABLE listings_archive ADD COLUMN area REAL")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS price_stats (
+        district_key TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (district_key, metric, period, bucket)
+    )
+    """)
+    # Площади у существующих строк нет, поэтому заполняются только скетчи цены. Корзины считаются здесь,
+    # а не через bot.analytics: миграция должна давать тот же результат при любых будущих изменениях модуля
+    log_gamma = math.log((1 + STATS_RELATIVE_ACCURACY) / (1 - STATS_RELATIVE_ACCURACY))
+    cur.execute("""
+        SELECT district_key, price_uah, upload_dt FROM listings
+        WHERE district_key IS NOT NULL AND price_uah > 0 AND upload_dt IS NOT NULL
+    """)
+    buckets = Counter(
+        (district_key, "price", f"{upload_dt:%Y-%m}", math.ceil(math.log(price_uah) / log_gamma))
+        for district_key, price_uah, upload_dt in cur.fetchall()
+    )
+    counts = [(*key, count) for key, count in buckets.items()]
+    if counts:
+        db.insert_many(cur, """
+            INSERT INTO price_stats (district_key, metric, period, bucket, count) VALUES %s
+        """, counts, "(%s, %s, %s, %s, %s)")
+
+
+def telegram_media(cur):
+    cur.execute("ALTER TABLE outbox ADD COLUMN media TEXT")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS telegram_files (
+        media_key TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        created_dt TIMESTAMPTZ
+    )
+    """)
+
+
+MIGRATIONS = [
+    (1, "initial schema", initial_schema),
+    (2, "typed listing columns and enrichment indexes", typed_listing_columns),
+    (3, "filter status column", listing_filter_status),
+    (4, "listing to search links", listing_searches),
+    (5, "enrichment leases", listing_leases),
+    (6, "card fingerprints and price/title history", listing_history),
+    (7, "outbox listing publication date", outbox_priority),
+    (8, "listings archive and upload date index", listings_archive),
+    (9, "listing text signatures and repost links", listing_reposts),
+    (10, "listing area and district price stats", price_stats),
+    (11, "outbox albums and telegram file ids", telegram_media),
+]
+
+
+def current_version(cur):
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def migrate():
+    with db.transaction() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_dt TIMESTAMPTZ
+        )
+        """)
+
+    applied = 0
+    for version, name, apply in MIGRATIONS:
+        with db.transaction() as cur:
+            if not db.is_sqlite():
+                # Блокировка держится до конца транзакции — вторая копия бота дождётся и пропустит миграцию
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            if current_version(cur) >= version:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            apply(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, applied_dt) VALUES (%s, %s, %s)",
+                (version, name, datetime.now(timezone.utc))
+            )
+            applied += 1
+
+    if applied:
+        logger.info(f"Applied {applied} migrations")
+    return applied
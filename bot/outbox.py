@@ -0,0 +1,133 @@
+"""
+Модуль для отправки сообщений из таблицы outbox в Telegram.
+
+Сообщения (HTML-подпись, чат и закодированный коллаж) попадают в outbox вместе с описанием
+объявления, поэтому сбой отправки не теряет уведомление: строка остаётся в статусе pending
+и будет отправлена при следующем запуске без повторного парсинга и загрузки изображений.
+
+Функция:
+
+- drain_outbox(batch_size=OUTBOX_BATCH_SIZE, max_attempts=OUTBOX_MAX_ATTEMPTS):
+    Пачками выбирает pending-сообщения (сначала о самых свежих объявлениях), ставит их в очередь
+    отправки Telegram, дожидается результатов и обновляет статусы. После max_attempts неудач сообщение
+    помечается как failed. Возвращает (отправлено, ошибок), логирует задержку от постановки в outbox
+    до отправки и перцентили срока уведомления (от публикации на OLX до отправки, bot.scheduler).
+    При нескольких процессах outbox отправляет только тот, кто получил advisory-блокировку.
+
+Фото загружается в Telegram один раз: file_id из ответа на первую отправку сохраняется (db.telegram_files)
+по хешу коллажа или по ссылке на фото альбома, и следующие сообщения с тем же фото (другие чаты,
+повторная попытка) ссылаются на него. Сообщения пачки с фото, которое как раз загружается,
+отправляются после остальных — уже с полученным file_id.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+
+from bot.config import OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS
+from bot.db import (
+    fetch_pending_outbox_ids, fetch_outbox_rows, mark_outbox_sent, mark_outbox_failed, advisory_lock,
+    fetch_telegram_file_ids, save_telegram_file_ids, forget_telegram_file_ids,
+)
+from bot.scheduler import log_ttn_summary
+from bot.telegram_bot import send_rendered, sent_file_ids
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def drain_outbox(batch_size=None, max_attempts=None):
+    # Outbox отправляет только один процесс, иначе сообщения ушли бы дважды
+    with advisory_lock("olx_outbox") as leader:
+        if not leader:
+            logger.info("Another worker is draining the outbox, skipping")
+            return 0, 0
+        return _drain(batch_size, max_attempts)
+
+
+def media_keys(row):
+    # Ключи фото сообщения: хеш коллажа или ссылки на фото альбома
+    photo, media = row[4], row[7]
+    if media:
+        return json.loads(media)
+    if photo is not None:
+        return [hashlib.sha256(photo).hexdigest()]
+    return []
+
+
+def send_row(row, keys, file_ids):
+    _, _, chat_id, caption, photo, _, _, media = row
+    if media:
+        return send_rendered(chat_id, caption, media=[file_ids.get(key, key) for key in keys])
+    if photo is not None:
+        photo = file_ids.get(keys[0]) or bytes(photo)
+    return send_rendered(chat_id, caption, photo)
+
+
+def _drain(batch_size, max_attempts):
+    batch_size = batch_size or OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or OUTBOX_MAX_ATTEMPTS
+    sent_total = 0
+    failed_total = 0
+    delays = []
+    ttns = []
+
+    # Очередь фиксируется в начале прохода (от свежих объявлений к старым): неудачные сообщения
+    # остаются pending, но за один проход каждое пробуем один раз
+    queue = fetch_pending_outbox_ids()
+    for start in range(0, len(queue), batch_size):
+        rows = fetch_outbox_rows(queue[start:start + batch_size])
+        keys = {row[0]: media_keys(row) for row in rows}
+        file_ids = fetch_telegram_file_ids({key for row_keys in keys.values() for key in row_keys})
+
+        # Фото, которого ещё нет в Telegram, загружает только первое сообщение с ним
+        first, deferred, uploading = [], [], set()
+        for row in rows:
+            missing = {key for key in keys[row[0]] if key not in file_ids}
+            (deferred if missing & uploading else first).append(row)
+            uploading |= missing
+
+        sent_ids = []
+        for group in (first, deferred):
+            futures = [(row, send_row(row, keys[row[0]], file_ids)) for row in group]
+            uploaded = []
+            for (outbox_id, listing_id, _, _, _, created_dt, listing_created_dt, _), future in futures:
+                row_keys = keys[outbox_id]
+                error = future.exception()
+                if error is None:
+                    sent_ids.append(outbox_id)
+                    now = datetime.now(timezone.utc)
+                    if created_dt:
+                        delays.append((now - created_dt).total_seconds())
+                    if listing_created_dt:
+                        ttns.append((now - listing_created_dt).total_seconds())
+                    reused = sum(1 for key in row_keys if key in file_ids)
+                    if reused:
+                        metrics.incr("telegram_file_id_reused", reused)
+                    for key, file_id in zip(row_keys, sent_file_ids(future.result())):
+                        if file_id and key not in file_ids:
+                            file_ids[key] = file_id
+                            uploaded.append((key, file_id))
+                    logger.info(f"Sent Telegram message for listing {listing_id}")
+                else:
+                    failed_total += 1
+                    logger.error(f"Error sending Telegram message for listing {listing_id}: {error}")
+                    if getattr(error, "error_code", None) == 400:
+                        # Возможно, устаревший file_id: следующая попытка загрузит фото заново
+                        stale = [key for key in row_keys if key in file_ids]
+                        forget_telegram_file_ids(stale)
+                        for key in stale:
+                            del file_ids[key]
+                    mark_outbox_failed(outbox_id, error, max_attempts)
+            save_telegram_file_ids(uploaded)
+
+        mark_outbox_sent(sent_ids)
+        sent_total += len(sent_ids)
+
+    if delays:
+        logger.info(f"Outbox: sent {sent_total}, failed {failed_total}, avg outbox delay {sum(delays) / len(delays):.1f}s")
+    else:
+        logger.info(f"Outbox: sent {sent_total}, failed {failed_total}")
+    log_ttn_summary(ttns)
+    return sent_total, failed_total
@@ -0,0 +1,57 @@
+"""
+Модуль для ограничения частоты запросов к внешним хостам.
+
+Класс:
+
+- HostRateLimiter(rates):
+    Хранит для каждого хоста минимальный интервал между запросами (rates: {host: запросов в секунду}).
+    Метод wait(url) блокирует вызывающий поток, пока для хоста из url не наступит очередь.
+    Безопасен для использования из нескольких потоков одновременно.
+    Хосты, которых нет в rates, не ограничиваются.
+
+- RequestBudget(limit):
+    Общий для всех поисков бюджет запросов на один цикл; acquire() возвращает False, когда бюджет исчерпан.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class HostRateLimiter:
+    def __init__(self, rates):
+        # минимальный интервал между запросами для каждого хоста
+        self.intervals = {host: 1.0 / rate for host, rate in rates.items() if rate and rate > 0}
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).hostname
+        interval = self.intervals.get(host)
+        if interval is None:
+            return
+
+        # резервируем ближайший свободный слот под замком, а спим уже без него
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RequestBudget:
+    """Общий на все потоки лимит числа запросов за цикл."""
+
+    def __init__(self, limit):
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
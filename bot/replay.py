@@ -0,0 +1,114 @@
+"""
+Повторный разбор архива страниц (bot.archive) после исправления селекторов в bot.extract.
+
+Когда OLX меняет разметку, парсеры молча возвращают пустые поля. Исходные страницы лежат в архиве,
+поэтому после исправления селектора поля пересобираются локально, без новых запросов к OLX:
+страницы распаковываются и разбираются в пуле процессов (REPLAY_WORKERS), для каждого объявления
+берётся результат самой свежей страницы, и исправления пишутся в базу пачками.
+
+- Страницы результатов: поля карточек (db.replay_card_fields); пустые значения не затирают сохранённые.
+- Страницы объявлений: описание и первое фото (db.replay_detail_fields) — только там, где описание
+  не было найдено; объявления, снятые с публикации, пропускаются.
+
+Запуск:
+    python -m bot.replay                              # все страницы архива
+    python -m bot.replay --kind detail --since 2024-05-01 --workers 8
+    python -m bot.replay --dry-run                    # только разобрать и посчитать
+"""
+
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from bs4 import BeautifulSoup
+
+from bot import archive, db
+from bot.config import REPLAY_WORKERS
+from bot.extract import (
+    extract_listings, is_inactive, parse_description, get_all_slider_images, DESCRIPTION_NOT_FOUND,
+)
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 500
+
+
+def replay_page(kind, digest, codec, listing_ids):
+    # Выполняется в дочернем процессе: распаковка и разбор одной страницы
+    try:
+        html = archive.load_page(digest, codec).decode("utf-8", errors="replace")
+    except OSError as e:
+        logger.warning(f"Archived page {digest} is missing: {e}")
+        return []
+    if kind == "results":
+        return extract_listings(html)
+
+    soup = BeautifulSoup(html, "html.parser")
+    if is_inactive(soup):
+        return []
+    description = parse_description(soup)
+    if description == DESCRIPTION_NOT_FOUND:
+        return []
+    img_urls = get_all_slider_images(soup)
+    return [(listing_id, description, img_urls[0] if img_urls else None) for listing_id in listing_ids]
+
+
+def replay(kind, since=None, workers=None, dry_run=False):
+    """
+    Разбирает страницы архива вида kind ("results" или "detail"), начиная с since.
+    Возвращает (число страниц, число объявлений с исправлениями).
+    """
+    pages = list(archive.iter_pages(kind, since))
+    latest = {}
+    with ProcessPoolExecutor(max_workers=workers or REPLAY_WORKERS) as pool:
+        # map сохраняет порядок страниц (по fetched_dt), так что побеждает самая свежая версия
+        results = pool.map(
+            replay_page,
+            [kind] * len(pages),
+            [page[2] for page in pages],
+            [page[3] for page in pages],
+            [page[5] for page in pages],
+            chunksize=16,
+        )
+        for extracted in results:
+            for item in extracted:
+                latest[item.id if kind == "results" else item[0]] = item
+
+    logger.info(f"Replayed {len(pages)} {kind} pages, {len(latest)} listings extracted")
+    if dry_run:
+        return len(pages), len(latest)
+
+    rows = list(latest.values())
+    for i in range(0, len(rows), WRITE_BATCH_SIZE):
+        batch = rows[i:i + WRITE_BATCH_SIZE]
+        if kind == "results":
+            db.replay_card_fields(batch)
+        else:
+            db.replay_detail_fields(batch, DESCRIPTION_NOT_FOUND)
+    return len(pages), len(latest)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--kind", choices=("results", "detail", "all"), default="all")
+    arg_parser.add_argument("--since", type=datetime.fromisoformat, help="дата загрузки страниц (ISO 8601)")
+    arg_parser.add_argument("--workers", type=int, default=REPLAY_WORKERS)
+    arg_parser.add_argument("--dry-run", action="store_true", help="не писать в базу")
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
+    )
+
+    since = args.since
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    db.init_schema()
+    for kind in (("results", "detail") if args.kind == "all" else (args.kind,)):
+        replay(kind, since, args.workers, args.dry_run)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Задача хранения: не даёт таблице listings расти бесконечно.
+
+Объявления, которые не встречались в выдаче дольше RETENTION_DAYS и опубликованы раньше этого срока,
+переносятся пачками в listings_archive (в PostgreSQL — секции по месяцам created_at_dt)
+или удаляются, если RETENTION_ARCHIVE=0. Рабочая таблица остаётся маленькой: поиск по ключу,
+частичные индексы и VACUUM не дорожают со временем. Объявления, которые всё ещё видны на OLX,
+не трогаются, поэтому повторно как новые не приходят. Заодно из архива страниц (bot.archive)
+удаляются страницы старше ARCHIVE_MAX_AGE_DAYS (в каждом процессе — архив у каждого свой).
+
+Функция:
+
+- run_retention(days=RETENTION_DAYS, archive=RETENTION_ARCHIVE, batch_size=RETENTION_BATCH_SIZE):
+    Выполняется одним процессом (advisory-блокировка), возвращает число перенесённых объявлений.
+    Демон вызывает её раз в RETENTION_INTERVAL_HOURS; вручную: python -m bot.retention
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from bot import archive as page_archive, db
+from bot.config import RETENTION_DAYS, RETENTION_ARCHIVE, RETENTION_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def run_retention(days=None, archive=None, batch_size=None):
+    days = days or RETENTION_DAYS
+    archive = RETENTION_ARCHIVE if archive is None else archive
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    # Архив страниц лежит на диске каждого процесса, поэтому чистится без блокировки ведущего
+    page_archive.prune()
+
+    with db.advisory_lock("olx_retention") as leader:
+        if not leader:
+            logger.info("Another worker is running retention, skipping")
+            return 0
+
+        total = 0
+        # Короткие транзакции по пачке, чтобы не держать блокировки на всю таблицу
+        while True:
+            moved = db.archive_listings(cutoff, batch_size, archive)
+            if not moved:
+                break
+            total += moved
+
+    action = "Archived" if archive else "Pruned"
+    logger.info(f"{action} {total} listings not seen since {cutoff:%Y-%m-%d}")
+    return total
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
+    )
+    db.init_schema()
+    run_retention()
+    db.close()
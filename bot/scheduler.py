@@ -0,0 +1,67 @@
+"""
+Приоритеты и срок уведомления (time-to-notify, TTN) для загрузки описаний и отправки в Telegram.
+
+Объявления обрабатываются от самых свежих к старым (created_at_dt DESC): после накопившейся
+очереди первыми уходят те, на которые ещё успевают откликнуться. Срок каждого объявления —
+created_at_dt + TTN_BUDGET_SECONDS. Если до срока осталось меньше, чем в среднем занимают загрузка
+изображений и сборка коллажа, объявление понижается: сообщение уходит без коллажа, только текстом.
+
+- TimeToNotify(budget_seconds):
+    deadline(created_at_dt), should_downgrade(created_at_dt) и observe_collage(seconds) —
+    экспоненциально сглаженная оценка времени на коллаж. Безопасен для нескольких потоков.
+- percentile(values, q) / log_ttn_summary(values, budget_seconds):
+    Перцентили TTN за запуск (p50/p90/p99) и число объявлений, не уложившихся в срок.
+"""
+
+import logging
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+
+from bot.config import TTN_BUDGET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TimeToNotify:
+    def __init__(self, budget_seconds=None, collage_estimate=5.0, alpha=0.2):
+        self.budget = timedelta(seconds=budget_seconds or TTN_BUDGET_SECONDS)
+        self.collage_estimate = collage_estimate  # секунд на загрузку изображений и коллаж
+        self.alpha = alpha
+        self.lock = threading.Lock()
+
+    def deadline(self, created_at_dt):
+        return created_at_dt + self.budget if created_at_dt else None
+
+    def observe_collage(self, seconds):
+        with self.lock:
+            self.collage_estimate += self.alpha * (seconds - self.collage_estimate)
+
+    def should_downgrade(self, created_at_dt, now=None):
+        # Без даты публикации срок неизвестен — не понижаем
+        deadline = self.deadline(created_at_dt)
+        if deadline is None:
+            return False
+        now = now or datetime.now(timezone.utc)
+        return (deadline - now).total_seconds() < self.collage_estimate
+
+
+def percentile(values, q):
+    # Перцентиль по ближайшему рангу; values должны быть отсортированы
+    if not values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def log_ttn_summary(values, budget_seconds=None):
+    budget = budget_seconds or TTN_BUDGET_SECONDS
+    if not values:
+        return
+    values = sorted(values)
+    missed = sum(1 for v in values if v > budget)
+    logger.info(
+        f"Time to notify: p50 {percentile(values, 50):.0f}s, p90 {percentile(values, 90):.0f}s, "
+        f"p99 {percentile(values, 99):.0f}s, max {values[-1]:.0f}s; "
+        f"{missed} of {len(values)} over the {budget:.0f}s budget"
+    )
@@ -3,326 +3,534 @@
 
 Функционал:
 - Формирует URL для запросов с параметрами.
-- Получает карточки объявлений со страниц и парсит ключевые данные.
-- Сохраняет/обновляет объявления в базе PostgreSQL.
+- Получает карточки объявлений со страниц и парсит ключевые данные (через bot.extract).
+- Инкрементально обходит страницы результатов, пока не дойдёт до уже известных объявлений.
+- Обходит все сохранённые поиски (bot.searches) параллельно в пределах общего бюджета запросов к OLX.
+- Отсеивает заведомо новые карточки фильтром Блума в памяти (bot.bloom) без запроса к базе.
+- Сохраняет/обновляет объявления в базе (bot.db) пачками: пишутся только новые карточки и карточки
+  с изменившимся отпечатком (история цен и заголовков — в listing_history), last_seen_dt остальных
+  обновляется одним запросом за обход поиска.
 - Парсит подробное описание и изображения из страницы объявления.
-- Загружает и обрабатывает изображения, создавая коллаж.
-- Обновляет объявления без описания и изображений, фильтруя по районам и исключая определённые ключевые слова.
-- Отправляет обновлённые данные и коллажи в Telegram через бота.
+- Сохраняет исходные страницы результатов и объявлений в сжатый архив (bot.archive), чтобы после
+  исправления селекторов поля можно было пересобрать без новых запросов к OLX (bot.replay).
+- Узнаёт повторно опубликованные объявления по MinHash-подписи текста (bot.dedup): для них не загружаются
+  изображения, а вместо полного сообщения отправляется короткое «опубліковано повторно» (или ничего, DEDUP_MODE).
+  Репостом считается и объявление с теми же фото (перцептивные хеши из bot.image_cache).
+- Загружает и обрабатывает изображения, создавая коллаж (через bot.images; миниатюры и готовые коллажи
+  кешируются на диске), или, в зависимости от TG_MEDIA_MODE, отправляет альбом из ссылок на фото OLX.
+- Ведёт скетчи цен по районам при вставке новых объявлений и добавляет в подпись сообщения
+  сравнение с медианой района (bot.analytics).
+- Фильтрует объявления правилами из filters.json (bot.filters) ещё при разборе карточек и описаний.
+- Обновляет объявления без описания и изображений, прошедшие фильтры, от самых свежих к старым (bot.scheduler:
+  не успевающие в срок уведомления уходят без коллажа — без фото или альбомом); объявления берутся из базы в аренду
+  (FOR UPDATE SKIP LOCKED), так что загрузку можно делить между несколькими процессами.
+- Обход страниц результатов выполняет только ведущий процесс (advisory-блокировка PostgreSQL).
+- Сохраняет готовые сообщения с коллажами в таблицу outbox; отправкой в Telegram занимается bot.outbox.
 - Логирует ключевые события и ошибки.
-- Использует сборку мусора и задержки для экономии ресурсов и корректной работы с сетью.
+- Загружает страницы объявлений и изображения параллельно (ENRICH_WORKERS потоков) через общий HTTP-клиент
+  (bot.http_client: пул соединений на хост, повторы с джиттером, ограничение частоты запросов к olx.ua),
+  при этом запись в базу и отправка в Telegram идут в исходном порядке.
+- Не превышает нагрузку на OLX: частоту запросов к olx.ua ограничивает HostRateLimiter (OLX_REQUESTS_PER_SEC),
+  число страниц результатов за цикл — общий для всех поисков RequestBudget (OLX_PAGE_BUDGET), bot.ratelimit.
 """
 
-import os
-import sys
+import time
+import gc
+import logging
+from datetime import datetime, timedelta, timezone
+from bot.db import (
+    fetch_card_state, update_changed_listings, touch_listings, insert_new_listings, link_listing_searches, fetch_listing_searches,
+    get_high_water_mark, set_high_water_mark, claim_listings_to_enrich, release_listing_lease, advisory_lock,
+    mark_listing_unavailable, mark_listing_filtered, save_details_with_outbox, fetch_listing_price,
+)
+from bot.extract import (
+    extract_listings, get_all_slider_images, parse_description, is_inactive, DESCRIPTION_NOT_FOUND,
+)
+from bot.searches import get_searches, default_search
+from bot.telegram_bot import build_caption, build_repost_caption
+from bot.config import (
+    OLX_ORIGIN, ENRICH_WORKERS, CRAWL_MAX_PAGES, CRAWL_CONCURRENCY, SEARCH_CONCURRENCY, OLX_PAGE_BUDGET,
+    ENRICH_LEASE_SECONDS, ENRICH_CLAIM_BATCH, WORKER_ID, DEDUP_MODE, DEDUP_MIN_SHARED_PHOTOS,
+    TG_MEDIA_MODE, TG_ALBUM_SIZE,
+)
+from bot.ratelimit import RequestBudget
+from bot.http_client import get_client
+from bot.scheduler import TimeToNotify
+from bot.bloom import get_seen_filter, refresh_seen_filter
+from bot.dedup import get_repost_index, minhash, pack_signature
+from bot.analytics import price_stat_counts, price_badge
+from bot.utils import split_location
+from bot import metrics
+from bot import archive
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Срок уведомления: объявления, не успевающие в TTN_BUDGET_SECONDS, отправляются без коллажа
+ttn = TimeToNotify()
+
+
+def build_url(params, base_url=None):
+    from urllib.parse import urlencode
+    # Формируем URL с параметрами для запроса к OLX
+    return (base_url or default_search().url) + "?" + urlencode(params)
+
+
+def search_key(search):
+    # Стабильный ключ поиска для хранения отметки последнего просмотренного объявления
+    return build_url(sorted(search.params.items()), search.url)
+
+
+def store_cards(records, search=None, seen=None):
+    """
+    Сохраняет карточки одной страницы пачкой: карточки, которых точно нет в базе (фильтр Блума),
+    сразу считаются новыми, для остальных один SELECT читает отпечатки, затем пишутся только новые карточки и карточки с изменившимся отпечатком
+    (изменения цены и заголовка — в listing_history), ещё два запроса связывают карточки с поиском.
+    last_seen_dt неизменившихся карточек обновляется одним запросом: сразу, либо, если передано
+    множество seen, id добавляются в него и обновляются вызывающим раз за обход (touch_listings).
+    Таблица listings общая для всех поисков.
+    Возвращает (число запросов к базе, число запросов при старом покарточном способе,
+    объявления, которые этот поиск видит впервые).
+    """
+    search = search or default_search()
+    # Убираем повторы внутри страницы (продвигаемые объявления встречаются дважды)
+    unique = {}
+    for record in records:
+        unique.setdefault(record.id, record)
+    if not unique:
+        return 0, 0, []
+
+    now = datetime.now(timezone.utc)
+    seen_filter = get_seen_filter()
+    maybe_known = [listing_id for listing_id in unique if listing_id in seen_filter]
+    known = fetch_card_state(maybe_known)
+    new_rows = [r for listing_id, r in unique.items() if listing_id not in known]
+    insert_new_listings(new_rows, now, price_stat_counts(new_rows, now))
+    seen_filter.update(r.id for r in new_rows)
+    metrics.incr("listings_new", len(new_rows))
+
+    for r in new_rows:
+        logger.info(f"Processed: {r.id} - {r.name}")
+
+    changed = [(r, known[r.id]) for r in unique.values() if r.id in known and known[r.id][0] != r.fingerprint]
+    update_changed_listings(changed, now)
+    metrics.incr("listings_changed", len(changed))
+
+    changed_ids = {r.id for r, _ in changed}
+    unchanged = [listing_id for listing_id in known if listing_id not in changed_ids]
+    if seen is not None:
+        seen.update(unchanged)
+    elif unchanged:
+        touch_listings(unchanged, now)
+
+    new_to_search = link_listing_searches(search.name, list(unique.values()), now)
+
+    round_trips = (
+        (1 if maybe_known else 0) + (1 if new_rows else 0) + (1 if changed else 0) + (1 if unchanged and seen is None else 0)
+        + 1 + (1 if new_to_search else 0)
+    )
+    # Раньше: SELECT + INSERT/UPDATE на каждую карточку и ещё UPSERT на каждую новую
+    legacy_round_trips = 2 * len(unique) + len(new_rows)
+    return round_trips, legacy_round_trips, [r for r in unique.values() if r.id in new_to_search]
+
+
+def fetch_page(client, page_num, search=None, budget=None):
+    # Загружает одну страницу результатов поиска и возвращает список объявлений
+    search = search or default_search()
+    if budget is not None and not budget.acquire():
+        raise RuntimeError("OLX page budget for this cycle is exhausted")
+    url = build_url({**search.params, "page": page_num}, search.url)
+    logger.info(f"Loading URL: {url}")
+    with metrics.timer("page_fetch"):
+        resp = client.get(url, timeout=15)
+    resp.raise_for_status()
+    # Извлекаем объявления из JSON-состояния страницы (или по CSS-селекторам как запасной вариант)
+    with metrics.timer("html_parse"):
+        records = extract_listings(resp.text)
+    metrics.incr("cards_parsed", len(records))
+    archive.store_page("results", url, resp.content, [record.id for record in records])
+    logger.info(f"Found {len(records)} cards on page {page_num}")
+
+    # Фильтры поиска применяются сразу к карточкам: отклонённые сохраняются (для дедупликации),
+    # но никогда не попадают в загрузку страниц и изображений
+    engine = search.engine
+    for record in records:
+        record.filter_status = engine.check_card(record) or "pass"
+    return records
+
+
+def get_links(pages):
+    client = get_client()
+    total_round_trips = 0
+    total_legacy_round_trips = 0
+
+    for page_num in range(1, pages + 1):
+        logger.info(f"Fetching page {page_num}")
+        try:
+            records = fetch_page(client, page_num)
 
-LOCK_FILE = "/tmp/olx_scraper.lock"
+            # Сохраняем все карточки страницы одной пачкой
+            round_trips, legacy_round_trips, _ = store_cards(records)
+            total_round_trips += round_trips
+            total_legacy_round_trips += legacy_round_trips
 
-if os.path.exists(LOCK_FILE):
-    print("Another instance is running. Exiting.")
-    sys.exit()
+            gc.collect()  # Явный вызов сборщика мусора
+        except Exception as e:
+            logger.error(f"Error on page {page_num}: {e}")
+            break  # При ошибке прекращаем парсинг дальше
+
+    logger.info(
+        f"DB round trips: {total_round_trips} "
+        f"(per-card path: {total_legacy_round_trips}, saved {total_legacy_round_trips - total_round_trips})"
+    )
+    return total_legacy_round_trips - total_round_trips
+
+
+def crawl_incremental(search=None, max_pages=None, concurrency=None, budget=None):
+    """
+    Инкрементальный обход: страницы загружаются пачками по concurrency штук параллельно
+    и обрабатываются по порядку, пока не встретится страница, целиком состоящая из уже
+    известных поиску объявлений (или объявлений не новее отметки прошлого запуска).
+    Отметка (дата самого свежего объявления) хранится в базе отдельно для каждого поиска.
+    budget — общий для всех поисков лимит страниц OLX на цикл (RequestBudget).
+    Возвращает (число новых для поиска объявлений, запросов к базе, запросов при старом покарточном способе).
+    """
+    search = search or default_search()
+    max_pages = max_pages or CRAWL_MAX_PAGES
+    concurrency = concurrency or CRAWL_CONCURRENCY
+    key = search_key(search)
+    high_water = get_high_water_mark(key)
+    client = get_client()
+
+    new_total = 0
+    round_trips = legacy_round_trips = 0
+    newest = high_water
+    page_num = 1
+    done = False
+    seen = set()  # неизменившиеся карточки: last_seen_dt обновляется одним запросом в конце обхода
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawl") as executor:
+        while not done and page_num <= max_pages:
+            batch = range(page_num, min(page_num + concurrency, max_pages + 1))
+            futures = [executor.submit(fetch_page, client, n, search, budget) for n in batch]
+
+            for n, future in zip(batch, futures):
+                if done:
+                    future.cancel()
+                    continue
+                try:
+                    records = future.result()
+                except Exception as e:
+                    logger.error(f"Error on page {n}: {e}")
+                    done = True
+                    continue
+
+                page_round_trips, page_legacy_round_trips, new_rows = store_cards(records, search, seen)
+                round_trips += page_round_trips
+                legacy_round_trips += page_legacy_round_trips
+                new_total += len(new_rows)
+                for r in new_rows:
+                    if r.created_at_dt and (newest is None or r.created_at_dt > newest):
+                        newest = r.created_at_dt
+
+                # Страница без новых объявлений или целиком старше отметки — дальше только известные
+                fresh = [r for r in records if high_water is None or r.created_at_dt > high_water]
+                if not records or not new_rows or not fresh:
+                    logger.info(f"Page {n} has no new listings, stopping crawl")
+                    done = True
+
+            page_num += len(batch)
+
+    if seen:
+        touch_listings(seen, datetime.now(timezone.utc))
+        round_trips += 1
+    if newest is not None and newest != high_water:
+        set_high_water_mark(key, newest)
+    logger.info(f"Incremental crawl [{search.name}]: {new_total} new listings in {page_num - 1} pages")
+    return new_total, round_trips, legacy_round_trips
+
+
+def crawl_all(searches=None, page_budget=None):
+    """
+    Обходит все поиски из реестра параллельно (SEARCH_CONCURRENCY) в пределах общего бюджета
+    страниц OLX (OLX_PAGE_BUDGET) и общего лимита частоты запросов к olx.ua.
+    Логирует, сколько запросов к базе сэкономлено по сравнению с покарточной записью.
+    Возвращает суммарное число новых для поисков объявлений.
+    """
+    searches = searches or get_searches()
+    budget = RequestBudget(page_budget or OLX_PAGE_BUDGET)
+
+    # Страницы результатов обходит только один процесс — ведущий (advisory-блокировка в базе)
+    with advisory_lock("olx_crawl") as leader:
+        if not leader:
+            logger.info("Another worker is crawling results pages, skipping crawl")
+            return 0
+
+        # Пока ведущим был другой процесс, он мог добавить объявления, которых нет в нашем фильтре
+        refresh_seen_filter()
+
+        with ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix="search") as executor:
+            futures = [(s, executor.submit(crawl_incremental, s, budget=budget)) for s in searches]
+            new_total = round_trips = legacy_round_trips = 0
+            for search, future in futures:
+                try:
+                    new_count, search_round_trips, search_legacy_round_trips = future.result()
+                except Exception as e:
+                    logger.error(f"Search {search.name} failed: {e}")
+                    continue
+                new_total += new_count
+                round_trips += search_round_trips
+                legacy_round_trips += search_legacy_round_trips
+
+    logger.info(
+        f"DB round trips: {round_trips} "
+        f"(per-card path: {legacy_round_trips}, saved {legacy_round_trips - round_trips})"
+    )
+
+    for engine in {id(s.engine): s.engine for s in searches}.values():
+        engine.log_stats()
+    return new_total
+
+
+def fetch_listing_details(listing_id, searches, created_at_dt=None, name=None):
+    """
+    Загружает страницу объявления, парсит описание и изображения, собирает коллаж.
+    Выполняется в рабочем потоке, поэтому не обращается к базе данных и Telegram.
+    searches — поиски, чьи фильтры пропустили карточку; описание проверяется фильтрами каждого.
+    Если объявление с датой created_at_dt уже не успевает в срок уведомления, коллаж не собирается.
+    Возвращает словарь с результатом; статус "inactive" — объявление снято с публикации,
+    "repost" — текст (заголовок name и описание) почти совпадает с уже обработанным объявлением.
+    """
+    # BeautifulSoup и Pillow нужны только для загрузки описаний: обход страниц результатов без них стартует быстрее
+    from bs4 import BeautifulSoup
+    from bot.images import build_collage
+    from bot.image_cache import find_listing_by_photos, record_listing_photos
 
-with open(LOCK_FILE, "w") as f:
-    f.write(str(os.getpid()))
+    with metrics.span("enrich_listing", listing_id=listing_id):
+        url = f"{OLX_ORIGIN}/{listing_id}"
 
-try:
-    import time
-    import gc
-    import logging
-    import requests
-    from bs4 import BeautifulSoup
-    from datetime import datetime, timezone
-    from bot.db import conn, cursor, is_new_listing  # <- добавлен импорт conn
-    from bot.utils import parse_ukr_date, resize_image_url
-    from bot.telegram_bot import send_message
-    from bot.config import OLX_BASE_URL
-    from PIL import Image
-    from io import BytesIO
-
-    logger = logging.getLogger(__name__)
-
-    def build_url(params):
-        from urllib.parse import urlencode
-        # Формируем URL с параметрами для запроса к OLX
-        return OLX_BASE_URL + "?" + urlencode(params)
-
-    def parse_card(card):
         try:
-            listing_id = card.get("id")
-            # Проверяем наличие ID и является ли объявление новым
-            if not listing_id or not is_new_listing(listing_id):
-                return  # Пропускаем уже обработанные или без ID
-
-            # Получаем название объявления
-            title_tag = card.select_one("a.css-1tqlkj0 h4")
-            title = title_tag.get_text(strip=True) if title_tag else ""
-
-            # Получаем цену объявления
-            price_tag = card.select_one('[data-testid="ad-price"]')
-            price = price_tag.get_text(strip=True) if price_tag else ""
-
-            # Получаем информацию о районе и дате публикации
-            district_tag = card.select_one('[data-testid="location-date"]')
-            district = district_tag.get_text(strip=True) if district_tag else ""
-
-            # Получаем URL изображения
-            img_tag = card.select_one("img.css-8wsg1m")
-            img_url = img_tag.get("src") if img_tag else None
-
-            now = datetime.now(timezone.utc)
-            created_at_dt = now  # По умолчанию текущая дата
-
-            if district and " - " in district:
-                # Разделяем район и дату, парсим дату из строки
-                _, date_part = district.split(" - ", 1)
-                parsed_date = parse_ukr_date(date_part)
-                if parsed_date:
-                    created_at_dt = parsed_date  # Используем распарсенную дату
-
-            # Вставляем или обновляем объявление в базе с помощью UPSERT
-            cursor.execute("""
-                INSERT INTO listings (id, name, price, district, img_url, description, last_seen_dt, upload_dt, created_at_dt)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO UPDATE SET
-                    last_seen_dt = EXCLUDED.last_seen_dt,
-                    price = EXCLUDED.price,
-                    name = EXCLUDED.name,
-                    district = EXCLUDED.district,
-                    img_url = EXCLUDED.img_url,
-                    upload_dt = EXCLUDED.upload_dt,
-                    created_at_dt = EXCLUDED.created_at_dt
-            """, (
-                listing_id,
-                title,
-                price,
-                district,
-                img_url,
-                None,
-                now,
-                now,
-                created_at_dt
-            ))
-            logger.info(f"Processed: {listing_id} - {title}")
-        except Exception as e:
-            logger.error(f"Error parsing card: {e}")
-
-    def get_links(pages):
-        session = requests.Session()
-        # Обновляем заголовок User-Agent для эмуляции браузера
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0 Safari/537.36"
-        })
-
-        for page_num in range(1, pages + 1):
-            logger.info(f"Fetching page {page_num}")
-            PARAMS = {
-                "currency": "UAH",
-                "search[order]": "created_at:desc",
-                "search[filter_float_price:from]": "5000", # 12
-                "search[filter_float_price:to]": "25000", # 25
-                "search[filter_float_total_area:from]": "28",
-                "page": page_num
+            # Повторы временных ошибок и лимит частоты запросов к olx.ua — внутри общего HTTP-клиента
+            with metrics.timer("detail_fetch"):
+                response = get_client().get(url)
+            response.raise_for_status()
+            archive.store_page("detail", url, response.content, [listing_id])
+            with metrics.timer("html_parse"):
+                soup = BeautifulSoup(response.text, "html.parser")
+
+            # Проверяем, доступно ли объявление (не снято ли с публикации)
+            if is_inactive(soup):
+                return {"status": "inactive", "url": url}
+
+            # Парсим описание; если его отклоняют фильтры всех поисков, изображения не загружаем
+            description_text = parse_description(soup)
+            rules = [s.engine.check_description(description_text) for s in searches]
+            passing = [s for s, rule in zip(searches, rules) if not rule]
+            if not passing:
+                return {"status": "filtered", "url": url, "description": description_text, "rule": rules[0]}
+
+            # Получаем URL изображений
+            img_urls = get_all_slider_images(soup)
+            del soup
+            logger.debug(f"Found {len(img_urls)} images for listing {listing_id}")
+
+            # Описание не найдено (сломался селектор) — по одному заголовку репост не определить
+            signature = None
+            if DEDUP_MODE != "off" and description_text != DESCRIPTION_NOT_FOUND:
+                signature = minhash(f"{name or ''} {description_text}")
+            if signature is not None:
+                # Репост уже отправленного объявления: без изображений и коллажа
+                found = get_repost_index().query_or_add(listing_id, signature)
+                if found is not None:
+                    metrics.incr("reposts")
+                    return {
+                        "status": "repost",
+                        "url": url,
+                        "description": description_text,
+                        "first_img_url": img_urls[0] if img_urls else None,
+                        "original": found[0],
+                        "similarity": found[1],
+                        "signature": signature,
+                        "searches": passing,
+                    }
+
+            collage = media = None
+            if TG_MEDIA_MODE == "album":
+                # Альбом из ссылок: фото загружает сам Telegram, бот их не скачивает
+                media = img_urls[:TG_ALBUM_SIZE]
+            elif ttn.should_downgrade(created_at_dt):
+                # Не успеваем в срок уведомления — только текст или (auto) альбом без сборки коллажа
+                logger.info(f"Listing {listing_id} is behind its time-to-notify deadline, sending without collage")
+                metrics.incr("ttn_downgraded")
+                if TG_MEDIA_MODE == "auto":
+                    media = img_urls[:TG_ALBUM_SIZE]
+            else:
+                # Загружаем изображения (или берём из кеша), создаём коллаж и сразу кодируем его в JPEG
+                started = time.monotonic()
+                collage, phashes = build_collage(img_urls, max_images=6)
+                ttn.observe_collage(time.monotonic() - started)
+
+                found = None
+                if DEDUP_MODE != "off":
+                    found = find_listing_by_photos(listing_id, phashes, DEDUP_MIN_SHARED_PHOTOS)
+                record_listing_photos(listing_id, phashes)
+                if found is not None:
+                    # Текст переписан, но фото те же — тоже репост
+                    metrics.incr("reposts")
+                    return {
+                        "status": "repost",
+                        "url": url,
+                        "description": description_text,
+                        "first_img_url": img_urls[0] if img_urls else None,
+                        "original": found[0],
+                        "similarity": found[1] / len(set(phashes)),
+                        "signature": signature,
+                        "searches": passing,
+                    }
+
+            return {
+                "status": "ok",
+                "url": url,
+                "description": description_text,
+                "first_img_url": img_urls[0] if img_urls else None,
+                "collage": collage,
+                "media": media,
+                "signature": signature,
+                "searches": passing,
             }
-            url = build_url(PARAMS)
-            logger.info(f"Loading URL: {url}")
-
-            try:
-                # Отправляем GET-запрос на страницу
-                resp = session.get(url, timeout=15)
-                resp.raise_for_status()
-                soup = BeautifulSoup(resp.text, "html.parser")
-
-                # Извлекаем карточки объявлений
-                cards = soup.select("div[data-cy='l-card']")
-                logger.info(f"Found {len(cards)} cards on page {page_num}")
-
-                # Парсим каждую карточку
-                for card in cards:
-                    parse_card(card)
-
-                gc.collect()  # Явный вызов сборщика мусора
-                time.sleep(2)  # Задержка между запросами для снижения нагрузки
-            except Exception as e:
-                logger.error(f"Error on page {page_num}: {e}")
-                break  # При ошибке прекращаем парсинг дальше
-
-    def get_all_slider_images(soup):
-        img_elements = soup.select('div.swiper-zoom-container img')
-        img_urls = []
-        for img in img_elements:
-            src = img.get('src')
-            if src:
-                # Меняем URL изображения на нужный размер
-                src_resized = resize_image_url(src)
-                # Добавляем только уникальные URL
-                if src_resized not in img_urls:
-                    img_urls.append(src_resized)
-        logger.info(f"Found {len(img_urls)} image URLs in slider")
-        return img_urls
-
-    def parse_description(soup):
-        desc_container = soup.select_one('div[data-testid="ad_description"]')
-        if desc_container:
-            desc_elem = desc_container.select_one('div.css-19duwlz')
-            if desc_elem:
-                # Возвращаем текст описания с пробелами между элементами
-                return desc_elem.get_text(separator=' ', strip=True)
-        return "Опис не знайдено"  # Если описание не найдено
-
-    def download_images(img_urls, timeout=10, max_images=7, thumb_size=(300, 400)):
-        images = []
-        for url in img_urls[:max_images]:
-            try:
-                logger.info(f"Downloading image: {url}")
-                # Загружаем изображение с таймаутом
-                response = requests.get(url, timeout=timeout)
-                response.raise_for_status()
-                # Открываем изображение и конвертируем в RGB
-                img = Image.open(BytesIO(response.content)).convert('RGB')
-                # Создаем уменьшенную копию изображения (thumbnail)
-                img.thumbnail(thumb_size)
-                images.append(img)
-                logger.info(f"Downloaded and resized image: {url}")
-            except Exception as e:
-                logger.warning(f"Error downloading {url}: {e}")
-        logger.info(f"Downloaded {len(images)} images out of {len(img_urls)} URLs")
-        return images
-
-    def create_collage(images, cols=3, margin=5):
-        if not images:
-            logger.warning("No images to create collage")
-            return None  # Нет изображений — коллаж не создаём
-
-        thumb_width, thumb_height = images[0].size
-        # Вычисляем количество рядов с учётом количества колонок
-        rows = (len(images) + cols - 1) // cols
-
-        # Рассчитываем размеры итогового изображения с учётом отступов
-        collage_width = cols * thumb_width + (cols + 1) * margin
-        collage_height = rows * thumb_height + (rows + 1) * margin
-        # Создаём пустое изображение с чёрным фоном
-        collage_img = Image.new('RGB', (collage_width, collage_height), (0, 0, 0))
-
-        # Вставляем каждое изображение в коллаж по координатам с учётом отступов
-        for idx, img in enumerate(images):
-            x = margin + (idx % cols) * (thumb_width + margin)
-            y = margin + (idx // cols) * (thumb_height + margin)
-            collage_img.paste(img, (x, y))
-
-        # Очищаем список изображений и вызываем сборщик мусора
-        del images
-        gc.collect()
-
-        logger.info(f"Created collage image with size: {collage_img.size}")
-        return collage_img
-
-    def update_missing_descriptions_and_images():
-        # Выбираем объявления без описания, которые созданы за последние сутки,
-        # с районами из заданного списка и исключаем по ключевым словам
-        cursor.execute("""
-        SELECT id, name, district, price
-        FROM listings 
-        WHERE (description IS NULL OR description = '')
-          AND created_at_dt >= NOW() - INTERVAL '1 days'
-          AND (
-            district ILIKE '%Оболонський%' OR district ILIKE '%Оболонский%' OR
-            --district ILIKE '%Подільський%' OR district ILIKE '%Подольский%' OR
-            district ILIKE '%Шевченківський%' OR district ILIKE '%Шевченковский%' OR
-            district ILIKE '%Печерський%' OR district ILIKE '%Печерский%' OR
-            district ILIKE '%Солом''янський%' OR district ILIKE '%Соломенский%' OR
-            district ILIKE '%Голосіївський%' OR district ILIKE '%Голосеевский%'
-          )
-          --AND lower(name) NOT LIKE '%ракетна%'
-          --AND lower(name) NOT LIKE '%світлопарк%'
-          --AND lower(name) NOT LIKE '%svitlopark%'
-          --AND lower(name) NOT LIKE '%навігатор%'
-          --AND lower(name) NOT LIKE '%навигатор%'
-          --AND lower(name) NOT LIKE '%паркове місто%'
-          --AND lower(name) NOT LIKE '%медовий%'
-          --AND lower(name) NOT LIKE '%новомост%'
-          --AND lower(name) NOT LIKE '%варшавс%'
-          --AND lower(name) NOT LIKE '%англія%'
-          --AND lower(name) NOT LIKE '%англия%'
-          --AND lower(name) NOT LIKE '%караває%'
-          --AND lower(name) NOT LIKE '%каравае%'
-          --AND lower(name) NOT LIKE '%британс%'
-          --AND lower(name) NOT LIKE '%orange%'
-          --AND lower(name) NOT LIKE '%нау%'
-          --AND lower(name) NOT LIKE '%швидкісни%'
-          --AND lower(name) NOT LIKE '%виноградар%'
-        ORDER BY upload_dt;
-        """)
-        rows = cursor.fetchall()
-        logger.info(f"Found {len(rows)} listings missing description/images")
-
-        headers = {
-            # Заголовок для имитации браузера при запросах
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+        except Exception as e:
+            logger.error(f"Failed to update listing ID {listing_id}: {e}")
+            return {"status": "failed", "url": url}
+
+
+def store_listing_details(
+    listing_id, name, district, price, price_uah, details, created_at_dt=None, district_key=None, area=None
+):
+    # Сохраняем результат в базе и отправляем сообщение (выполняется в основном потоке)
+    if details["status"] == "inactive":
+        logger.warning(f"Listing ID {listing_id} no longer available")
+        mark_listing_unavailable(listing_id, WORKER_ID)
+        return
+
+    if details["status"] == "filtered":
+        logger.info(f"Listing ID {listing_id} rejected by filter '{details['rule']}'")
+        mark_listing_filtered(listing_id, details["description"], details["rule"], WORKER_ID)
+        return
+
+    if details["status"] not in ("ok", "repost"):
+        # Аренда остаётся за нами: объявление вернётся в очередь, когда она истечёт
+        return
+
+    # Сообщения кладутся в outbox вместе с описанием — по одному на каждый чат совпавших поисков;
+    # отправка идёт отдельным шагом (bot.outbox.drain_outbox)
+    chats = []
+    for search in details["searches"]:
+        chat_id = search.route(price_uah)
+        if chat_id and chat_id not in chats:
+            chats.append(chat_id)
+    signature = pack_signature(details["signature"]) if details["signature"] is not None else None
+
+    if details["status"] == "repost":
+        original_id = details["original"]
+        logger.info(f"Listing ID {listing_id} is a repost of {original_id} (similarity {details['similarity']:.2f})")
+        messages = []
+        if DEDUP_MODE == "notify":
+            original = fetch_listing_price(original_id)
+            caption = build_repost_caption(
+                name, price, original[0] if original else None, details["url"], f"{OLX_ORIGIN}/{original_id}"
+            )
+            messages = [(chat_id, caption) for chat_id in chats]
+        if not save_details_with_outbox(
+            listing_id, WORKER_ID, details["description"], details["first_img_url"], messages, None,
+            created_at_dt, signature, original_id
+        ):
+            logger.warning(f"Lease on listing ID {listing_id} expired, another worker already stored it")
+        return
+
+    # Бейдж «на N% дешевле/дороже медианы района» по скетчам цен (bot.analytics)
+    district_name = split_location(district)[0].split(",")[-1].strip()
+    badge = price_badge(district_key, district_name, price_uah, area)
+    caption = build_caption(name, district, price, details["description"], details["url"], badge)
+    collage = details["collage"]
+    if not save_details_with_outbox(
+        listing_id, WORKER_ID, details["description"], details["first_img_url"],
+        [(chat_id, caption) for chat_id in chats], collage.getbuffer() if collage is not None else None,
+        created_at_dt, signature, media=details["media"]
+    ):
+        logger.warning(f"Lease on listing ID {listing_id} expired, another worker already stored it")
+        return
+    logger.info(f"Updated description and queued message for ID {listing_id}")
+
+
+def update_missing_descriptions_and_images(workers=None):
+    """
+    Загружает описания и изображения для объявлений за последние сутки, прошедших фильтры.
+    Объявления забираются из базы в аренду пачками (ENRICH_CLAIM_BATCH), начиная с самых свежих,
+    поэтому несколько процессов или контейнеров могут работать одновременно, не обрабатывая
+    одно объявление дважды, а после накопившейся очереди первыми уходят новые объявления.
+    Вызов проходит очередь один раз: объявления, загрузка которых не удалась, остаются в аренде и
+    повторяются при следующем запуске, а не в этом же цикле (иначе при недоступном OLX цикл не кончился бы).
+    """
+    by_name = {s.name: s for s in get_searches()}
+    fallback = [by_name.get("kyiv_flats") or default_search()]
+    started = datetime.now(timezone.utc)
+    since = started - timedelta(days=1)
+    total = 0
+    if DEDUP_MODE != "off":
+        get_repost_index()  # Строим индекс репостов здесь, а не в первом рабочем потоке
+
+    while True:
+        rows = claim_listings_to_enrich(since, WORKER_ID, ENRICH_LEASE_SECONDS, ENRICH_CLAIM_BATCH, started)
+        if not rows:
+            break
+        total += len(rows)
+        logger.info(f"Claimed {len(rows)} listings missing description/images")
+
+        # Поиски, чьи фильтры пропустили объявление; записи без связей относятся к поиску по умолчанию
+        links = fetch_listing_searches(row[0] for row in rows)
+        listing_searches = {
+            listing_id: [by_name[n] for n in names if n in by_name] or fallback
+            for listing_id, names in links.items()
         }
+        try:
+            enrich_batch(rows, listing_searches, workers or ENRICH_WORKERS)
+        except BaseException:
+            # Прерваны посреди пачки — сразу отдаём необработанные объявления другим процессам
+            for row in rows:
+                release_listing_lease(row[0], WORKER_ID)
+            raise
+
+    logger.info(f"Processed {total} listings missing description/images")
+    for engine in {id(s.engine): s.engine for s in by_name.values()}.values():
+        engine.log_stats()
+
+
+def enrich_batch(rows, listing_searches, workers):
+    # Загрузка страниц и изображений идёт в пуле потоков, а запись в базу и отправка
+    # в Telegram — в основном потоке строго в порядке выборки. Окно ограничивает число
+    # объявлений, обрабатываемых впереди текущего, чтобы не держать в памяти много коллажей.
+    window = workers * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as executor:
+        for row in rows:
+            future = executor.submit(fetch_listing_details, row[0], listing_searches[row[0]], row[5], row[1])
+            pending.append((row, future))
+            if len(pending) >= window:
+                finish_listing(*pending.popleft())
+
+        while pending:
+            finish_listing(*pending.popleft())
+
+
+def finish_listing(row, future):
+    listing_id, name, district, price, price_uah, created_at_dt, district_key, area = row
+    try:
+        logger.debug(f"Processing listing ID {listing_id}")
+        store_listing_details(
+            listing_id, name, district, price, price_uah, future.result(), created_at_dt, district_key, area
+        )
+    except Exception as e:
+        logger.error(f"General error processing ID {listing_id}: {e}")
 
-        for listing_id, name, district, price in rows:
-            try:
-                logger.info(f"Processing listing ID {listing_id}")
-                url = f"https://www.olx.ua/{listing_id}"
-
-                for attempt in range(2):
-                    try:
-                        # Запрашиваем страницу объявления
-                        response = requests.get(url, headers=headers, timeout=10)
-                        response.raise_for_status()
-                        soup = BeautifulSoup(response.text, "html.parser")
-
-                        # Проверяем, доступно ли объявление (не снято ли с публикации)
-                        inactive_div = soup.select_one('div[data-testid="ad-inactive-msg"]')
-                        if inactive_div and "Це оголошення більше не доступне" in inactive_div.text:
-                            logger.warning(f"Listing ID {listing_id} no longer available")
-                            cursor.execute(
-                                "UPDATE listings SET description = 'NOT AVAILABLE', img_url = NULL WHERE id = %s",
-                                (listing_id,)
-                            )
-                            conn.commit()
-                            break  # Прекращаем попытки, объявление недоступно
-
-                        # Парсим описание и получаем URL изображений
-                        description_text = parse_description(soup)
-                        img_urls = get_all_slider_images(soup)
-                        logger.info(f"Found {len(img_urls)} images for listing {listing_id}")
-
-                        # Загружаем изображения и создаём коллаж
-                        images = download_images(img_urls, max_images=6)
-                        collage_img = create_collage(images) if images else None
-
-                        # Чистим память
-                        del soup
-                        del images
-                        gc.collect()
-
-                        first_img_url = img_urls[0] if img_urls else None
-                        # Обновляем описание и URL первого изображения в базе
-                        cursor.execute(
-                            "UPDATE listings SET description = %s, img_url = %s WHERE id = %s",
-                            (description_text, first_img_url, listing_id)
-                        )
-                        conn.commit()
-
-                        logger.info(f"Updated description and images for ID {listing_id}")
-
-                        # Отправляем сообщение с данными и коллажем в Telegram
-                        send_message(name, district, price, description_text, url, collage_img)
-                        break  # Успешно обработали — выходим из цикла попыток
-                    except Exception as e:
-                        logger.error(f"Attempt {attempt+1} failed for ID {listing_id}: {e}")
-                        if attempt == 0:
-                            # При первой ошибке даём время на восстановление соединения
-                            time.sleep(3)
-                        else:
-                            logger.error(f"Failed to update listing ID {listing_id} after 2 attempts")
-            except Exception as e:
-                logger.error(f"General error processing ID {listing_id}: {e}")
-
-            # Освобождаем память после каждой итерации
-            gc.collect()
-
-finally:
-    if os.path.exists(LOCK_FILE):
-        os.remove(LOCK_FILE)
@@ -0,0 +1,143 @@
+"""
+Реестр сохранённых поисков OLX (searches.json).
+
+Каждый поиск описывает:
+- name    — уникальное имя (по нему хранится отметка инкрементального обхода и связь с объявлениями);
+- url     — страница результатов OLX (город / категория): путь от OLX_ORIGIN ("/uk/..."), чтобы обход
+            можно было направить на зеркало или локальный сервер; полный адрес тоже принимается,
+            без url — OLX_BASE_URL;
+- params  — параметры запроса (цена, площадь, сортировка created_at:desc);
+- filters — файл правил bot.filters (по умолчанию FILTERS_PATH) или список правил прямо в поиске;
+- chats   — маршрутизация по цене: routes [{"min", "max", "chat"}] и default.
+  Значение чата вида "$CHAT_ID" берётся из переменной окружения.
+
+Все поиски пишут в одну таблицу listings, поэтому объявление, найденное несколькими поисками,
+хранится и загружается один раз, а сообщение уходит в чаты каждого совпавшего поиска.
+
+Функции:
+
+- load_searches(path=SEARCHES_PATH):
+    Загружает реестр; если файла нет — возвращает один поиск по умолчанию (Киев, квартиры).
+- get_searches():
+    Реестр, загруженный один раз на процесс.
+- default_search():
+    Поиск по умолчанию (OLX_BASE_URL, исходные параметры и маршрутизация по CHAT_ID*).
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+from bot.config import OLX_ORIGIN, OLX_BASE_URL, FILTERS_PATH, SEARCHES_PATH, CHAT_ID, CHAT_ID_15_20K, CHAT_ID_20_25K
+from bot.filters import FilterEngine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARAMS = {
+    "currency": "UAH",
+    "search[order]": "created_at:desc",
+    "search[filter_float_price:from]": "5000", # 12
+    "search[filter_float_price:to]": "25000", # 25
+    "search[filter_float_total_area:from]": "28",
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def engine_for(filters):
+    # Файлы правил разделяются между поисками: один движок на файл
+    if isinstance(filters, list):
+        return FilterEngine(filters)
+    path = filters or FILTERS_PATH
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(SEARCHES_PATH), path)
+    with _engines_lock:
+        if path not in _engines:
+            _engines[path] = FilterEngine.from_file(path)
+        return _engines[path]
+
+
+def resolve_chat(value):
+    if isinstance(value, str) and value.startswith("$"):
+        return os.getenv(value[1:])
+    return value
+
+
+@dataclass
+class Search:
+    name: str
+    url: str
+    params: dict
+    engine: FilterEngine
+    routes: list = field(default_factory=list)
+    default_chat: str = None
+
+    def route(self, price_value):
+        # Чат по цене: первый подходящий диапазон, иначе чат по умолчанию
+        if price_value is not None:
+            for route in self.routes:
+                if route.get("min", 0) <= price_value <= route.get("max", float("inf")):
+                    return resolve_chat(route["chat"])
+        return resolve_chat(self.default_chat)
+
+
+def default_search():
+    return Search(
+        name="kyiv_flats",
+        url=OLX_BASE_URL,
+        params=dict(DEFAULT_PARAMS),
+        engine=engine_for(None),
+        routes=[
+            {"max": 14999, "chat": CHAT_ID},
+            {"min": 15000, "max": 20000, "chat": CHAT_ID_15_20K},
+            {"min": 20001, "max": 25000, "chat": CHAT_ID_20_25K},
+        ],
+        default_chat=CHAT_ID,
+    )
+
+
+def resolve_url(url):
+    if not url:
+        return OLX_BASE_URL
+    return OLX_ORIGIN + url if url.startswith("/") else url
+
+
+def load_searches(path=None):
+    path = path or SEARCHES_PATH
+    if not os.path.exists(path):
+        logger.info(f"{path} not found, using default search")
+        return [default_search()]
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    searches = []
+    for item in config.get("searches", []):
+        if not item.get("enabled", True):
+            continue
+        chats = item.get("chats") or {}
+        searches.append(Search(
+            name=item["name"],
+            url=resolve_url(item.get("url")),
+            params=item.get("params", dict(DEFAULT_PARAMS)),
+            engine=engine_for(item.get("filters")),
+            routes=chats.get("routes", []),
+            default_chat=chats.get("default", CHAT_ID),
+        ))
+    logger.info(f"Loaded {len(searches)} searches from {path}")
+    return searches
+
+
+_searches = None
+_searches_lock = threading.Lock()
+
+
+def get_searches():
+    global _searches
+    with _searches_lock:
+        if _searches is None:
+            _searches = load_searches()
+        return _searches
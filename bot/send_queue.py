@@ -0,0 +1,125 @@
+"""
+Очередь отправки сообщений в Telegram с собственным рабочим потоком.
+
+Класс:
+
+- SendQueue(bot):
+    submit(chat_id, text=..., photo=..., caption=...) ставит сообщение в очередь и сразу
+    возвращает Future, не блокируя парсинг. photo — файл или строка (file_id либо ссылка);
+    media=[...] — альбом (send_media_group) из file_id или ссылок, подпись — у первого фото. Рабочий поток отправляет сообщения по порядку и
+    соблюдает ограничения Telegram: не больше TG_GLOBAL_RATE сообщений в секунду на бота и
+    не чаще одного сообщения в TG_CHAT_INTERVAL секунд в один чат.
+    Ответ 429 (Too Many Requests) обрабатывается по полю retry_after: чат (и бот целиком)
+    ждут указанное время, после чего сообщение отправляется повторно.
+    Прочие временные ошибки повторяются с экспоненциальной задержкой до TG_MAX_RETRIES раз.
+    flush(timeout) ждёт, пока очередь не опустеет.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InputMediaPhoto
+
+from bot import metrics
+from bot.config import TG_GLOBAL_RATE, TG_CHAT_INTERVAL, TG_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    def __init__(self, bot, global_rate=None, chat_interval=None, max_retries=None):
+        self.bot = bot
+        self.global_interval = 1.0 / (global_rate or TG_GLOBAL_RATE)
+        self.chat_interval = chat_interval if chat_interval is not None else TG_CHAT_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else TG_MAX_RETRIES
+        self.jobs = queue.Queue()
+        self.next_global = 0.0
+        self.next_chat = {}
+        self.worker = threading.Thread(target=self.run, name="telegram-send", daemon=True)
+        self.worker.start()
+
+    def submit(self, chat_id, text=None, photo=None, caption=None, media=None, **kwargs):
+        future = Future()
+        if media is not None and len(media) == 1:
+            photo, media = media[0], None  # альбом из одного фото — обычное фото
+        self.jobs.put((chat_id, text, photo, caption, media, kwargs, future))
+        return future
+
+    def flush(self, timeout=None):
+        # queue.join() не принимает таймаут, поэтому ждём через отдельный поток
+        waiter = threading.Thread(target=self.jobs.join, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        return not waiter.is_alive()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.process(*job)
+            finally:
+                self.jobs.task_done()
+
+    def wait_turn(self, chat_id):
+        now = time.monotonic()
+        ready = max(self.next_global, self.next_chat.get(chat_id, 0.0))
+        if ready > now:
+            time.sleep(ready - now)
+        now = time.monotonic()
+        self.next_global = now + self.global_interval
+        self.next_chat[chat_id] = now + self.chat_interval
+
+    def process(self, chat_id, text, photo, caption, media, kwargs, future):
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            self.wait_turn(chat_id)
+            try:
+                with metrics.timer("telegram_send"):
+                    if media is not None:
+                        # Разметка подписи альбома задаётся у первого элемента; результат — список сообщений
+                        album = [
+                            InputMediaPhoto(item, caption=caption, parse_mode=kwargs.get("parse_mode"))
+                            if i == 0 else InputMediaPhoto(item)
+                            for i, item in enumerate(media)
+                        ]
+                        result = self.bot.send_media_group(chat_id, album)
+                    elif photo is not None:
+                        if hasattr(photo, "seek"):
+                            photo.seek(0)  # при повторной попытке отправляем буфер с начала
+                        result = self.bot.send_photo(chat_id, photo=photo, caption=caption, **kwargs)
+                    else:
+                        result = self.bot.send_message(chat_id, text, **kwargs)
+                metrics.incr("telegram_sent")
+                future.set_result(result)
+                return
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json.get("parameters") or {}).get("retry_after", delay)
+                    logger.warning(f"Telegram rate limit for chat {chat_id}, retry after {retry_after}s")
+                    # Лимит может быть как на чат, так и на бота — откладываем всё
+                    resume = time.monotonic() + retry_after
+                    self.next_global = max(self.next_global, resume)
+                    self.next_chat[chat_id] = max(self.next_chat.get(chat_id, 0.0), resume)
+                    error = e
+                    continue
+                if 400 <= e.error_code < 500:
+                    # Ошибки запроса (неверный чат, разметка и т.п.) повторять бессмысленно
+                    logger.error(f"Telegram rejected message for chat {chat_id}: {e}")
+                    future.set_exception(e)
+                    return
+                error = e
+            except Exception as e:
+                error = e
+
+            logger.warning(f"Attempt {attempt+1} to send to chat {chat_id} failed: {error}")
+            metrics.incr("telegram_retries")
+            if attempt < self.max_retries:
+                time.sleep(delay)
+                delay *= 2
+
+        logger.error(f"Giving up sending to chat {chat_id} after {self.max_retries + 1} attempts")
+        future.set_exception(error)
@@ -1,19 +1,45 @@
 """
 Модуль для отправки сообщений и изображений в Telegram чат с использованием Telebot.
 
-Функция:
+Функции:
+
+- build_message(name, district, price, description, link, price_value=None):
+    Сообщение для поиска по умолчанию: чат выбирает bot.searches.default_search().route по цене
+    (price_value — число из колонки price_uah; если не передано, цена разбирается из строки),
+    текст — build_caption. Возвращает (chat_id, message).
+
+- build_caption(name, district, price, description, link, badge=None):
+    Формирует HTML-подпись сообщения без выбора чата (чаты выбирают поиски из bot.searches).
+    В качестве тега для района автоматически создаётся хештег. badge — строка сравнения цены
+    с медианой района (bot.analytics.price_badge), выводится под ценой.
+
+- build_repost_caption(name, price, old_price, link, original_link):
+    Короткое сообщение о повторной публикации уже отправленного объявления (bot.dedup):
+    текущая цена, прежняя цена (если изменилась) и ссылки на новое и исходное объявление.
 
 - send_message(name, district, price, description, link, collage_img=None):
-    Формирует и отправляет сообщение о недвижимости с такими данными, как название, район, цена, описание и ссылка.
-    В качестве тега для района автоматически создаётся хештег.
-    Если передано изображение (collage_img), отправляет его как фотографию с подписью.
-    Если изображения нет — отправляет обычное текстовое сообщение.
-    Использует HTML-разметку для форматирования сообщения.
-    Логирует процесс отправки и ошибки.
+    Ручная отправка одного объявления (test.py): build_message и send_rendered, не дожидаясь
+    ответа Telegram. Возвращает Future. collage_img — PIL.Image или уже закодированный JPEG
+    (BytesIO или bytes); без изображения уходит текстовое сообщение. Обход и outbox эту функцию
+    не используют: чаты выбирают поиски из bot.searches.
+
+- send_rendered(chat_id, message, photo=None, media=None):
+    Ставит в очередь уже сформированное сообщение (используется при отправке из outbox).
+    photo — закодированный JPEG или file_id уже загруженного фото; media — список ссылок или file_id
+    для альбома, message становится его подписью.
+
+- sent_file_ids(result):
+    file_id фото из ответа Telegram (сообщение или альбом) — для повторной отправки без загрузки.
+
+- get_bot():
+    Объект telebot.TeleBot; создаётся (и telebot импортируется) при первом обращении.
+
+- flush(timeout=None):
+    Ждёт, пока все сообщения из очереди будут отправлены (вызывается в конце запуска).
 """
 
 
-import telebot
+import threading
 from io import BytesIO
 import re
 from html import escape as hesc  # импорт функции экранирования HTML
@@ -21,51 +47,51 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from bot.config import BOT_TOKEN, CHAT_ID, CHAT_ID_15_20K, CHAT_ID_20_25K  # импорт токена и ID чата из конфигурации
+from bot.config import BOT_TOKEN  # импорт токена из конфигурации
+from bot.searches import default_search
+from bot.utils import parse_price
 
-bot = telebot.TeleBot(BOT_TOKEN)  # создаём объект бота с токеном
+_bot = None
+_queue = None
+_queue_lock = threading.Lock()
 
 
-def parse_price(price_str):
-    """
-    Достаёт цену из строки вида:
-    '15 000 грн.Договірна'
-    '9 000 грн.'
-    '9000грн'
-    """
+def get_bot():
+    # telebot (и requests внутри него) импортируется только при первой отправке:
+    # подкоманды без Telegram (bot.cli scrape/replay) стартуют быстрее
+    global _bot
+    with _queue_lock:
+        if _bot is None:
+            import telebot
+            _bot = telebot.TeleBot(BOT_TOKEN)  # создаём объект бота с токеном
+        return _bot
 
-    if not price_str:
-        return None
 
-    # ищем первое число с пробелами или без
-    match = re.search(r"(\d[\d\s]*)", price_str)
+def get_queue():
+    # Очередь отправки с рабочим потоком создаётся при первом сообщении
+    global _queue
+    bot = get_bot()
+    with _queue_lock:
+        if _queue is None:
+            from bot.send_queue import SendQueue
+            _queue = SendQueue(bot)
+        return _queue
 
-    if not match:
-        return None
 
-    # убираем пробелы внутри числа
-    number = match.group(1).replace(" ", "")
+def flush(timeout=None):
+    if _queue is None:
+        return True
+    return _queue.flush(timeout)
 
-    return int(number)
 
+def build_message(name, district, price, description, link, price_value=None):
+    # Маршрутизация по цене — та же, что у поиска по умолчанию (bot.searches), своей таблицы чатов здесь нет
+    if price_value is None:
+        price_value = parse_price(price)
+    return default_search().route(price_value), build_caption(name, district, price, description, link)
 
-def send_message(name, district, price, description, link, collage_img=None):
-    # определяем куда отправлять: либо CHAT_ID, либо публичный канал по умолчанию
-    price_value = parse_price(price)
-
-    if price_value is not None:
-        if price_value < 15000:
-            DEST_CHAT = CHAT_ID
-        elif 15000 <= price_value <= 20000:
-            DEST_CHAT = CHAT_ID_15_20K
-        elif 20000 < price_value <= 25000:
-            DEST_CHAT = CHAT_ID_20_25K
-        else:
-            DEST_CHAT = CHAT_ID  # можно позже сделать отдельный чат 25k+
-    else:
-        DEST_CHAT = CHAT_ID
-        logger.info(f"Price not parsed for listing '{name}': {price}")
 
+def build_caption(name, district, price, description, link, badge=None):
     # берём первую часть района (до " - ") и обрезаем пробелы
     loc_text = district.split(" - ", 1)[0].strip()
     # формируем тег, заменяя все не буквы и цифры на подчеркивания
@@ -81,28 +107,73 @@ def send_message(name, district, price, description, link, collage_img=None):
     price_html = hesc(price)
     desc_html = hesc((description or "")[:500])  # обрезаем описание до 500 символов
     link_html = hesc(link)
+    badge_html = f"{hesc(badge)}\n" if badge else ""
 
     # формируем HTML-сообщение с нужными данными
     message = (
         f"🏠 <b>{name_html}</b>\n"
         f"📍 <b>Район</b>: {hashtag}\n\n"
         f"💰 <b>Ціна</b>: {price_html}\n"
+        f"{badge_html}"
         f"📝 <b>Опис</b>: {desc_html}\n"
         f"🔗 <a href=\"{link_html}\">Посилання</a>"
     )
+    return message
+
+
+def build_repost_caption(name, price, old_price, link, original_link):
+    price_line = f"💰 <b>Ціна зараз</b>: {hesc(price)}"
+    if old_price and old_price != price:
+        price_line += f" (було {hesc(old_price)})"
+    return (
+        f"♻️ <b>Опубліковано повторно</b>: {hesc(name)}\n"
+        f"{price_line}\n"
+        f"🔗 <a href=\"{hesc(link)}\">Посилання</a> · <a href=\"{hesc(original_link)}\">попереднє</a>"
+    )
+
+
+def log_result(name, future):
+    error = future.exception()
+    if error:
+        logger.error(f"Error sending Telegram message: {error}")  # логируем ошибку при отправке
+    else:
+        logger.info(f"Sent Telegram message for: {name}")  # подтверждаем успешную отправку
+
+
+def send_rendered(chat_id, message, photo=None, media=None):
+    # Ставит уже сформированное сообщение в очередь; photo — JPEG (bytes или BytesIO) или file_id
+    if media:
+        return get_queue().submit(chat_id, media=media, caption=message, parse_mode='HTML')  # альбом с подписью
+    if photo is not None:
+        if isinstance(photo, (bytes, bytearray, memoryview)):
+            photo = BytesIO(photo)  # уже закодированный JPEG
+            photo.name = 'collage.jpg'
+        return get_queue().submit(chat_id, photo=photo, caption=message, parse_mode='HTML')  # фото с подписью
+    return get_queue().submit(chat_id, text=message, parse_mode='HTML', disable_web_page_preview=False)  # текстовое сообщение
+
+
+def sent_file_ids(result):
+    # Самый крупный вариант каждого фото; для сообщений без фото — None
+    messages = result if isinstance(result, list) else [result]
+    return [m.photo[-1].file_id if getattr(m, "photo", None) else None for m in messages]
+
+
+def send_message(name, district, price, description, link, collage_img=None):
+    DEST_CHAT, message = build_message(name, district, price, description, link)
 
     try:
-        if collage_img:
+        if collage_img is not None:
             logger.info(f"Sending photo with collage for listing '{name}'")  # логируем отправку фото
-            bio = BytesIO()  # создаём байтовый поток для хранения картинки в памяти
-            bio.name = 'collage.jpg'  # указываем имя для корректной обработки API
-            collage_img.save(bio, 'JPEG')  # сохраняем изображение в байтовый поток
-            bio.seek(0)  # сбрасываем курсор в начало потока
-            bot.send_photo(DEST_CHAT, photo=bio, caption=message, parse_mode='HTML')  # отправляем фото с подписью
-            bio.close()  # закрываем поток для освобождения ресурсов
+            if not isinstance(collage_img, (bytes, bytearray, BytesIO)):
+                bio = BytesIO()  # создаём байтовый поток для хранения картинки в памяти
+                bio.name = 'collage.jpg'  # указываем имя для корректной обработки API
+                collage_img.save(bio, 'JPEG')  # сохраняем изображение в байтовый поток
+                collage_img = bio
         else:
             logger.info(f"Sending message without photo for listing '{name}'")  # логируем отправку текста
-            bot.send_message(DEST_CHAT, message, parse_mode='HTML', disable_web_page_preview=False)  # отправляем текстовое сообщение
-        logger.info(f"Sent Telegram message for: {name}")  # подтверждаем успешную отправку
+        future = send_rendered(DEST_CHAT, message, collage_img)
+        future.add_done_callback(lambda f: log_result(name, f))
+        return future
     except Exception as e:
         logger.error(f"Error sending Telegram message: {e}")  # логируем ошибку при отправке
+        return None
@@ -12,6 +12,15 @@
 - resize_image_url(url, new_size="600x300"):
     Принимает URL изображения и меняет параметр размера (например, "s=800x600") на новый размер.
     Если параметр размера отсутствует — возвращает URL без изменений.
+
+- parse_price(price_str):
+    Достаёт цену в гривнах из строки вида "15 000 грн.Договірна". Возвращает int или None.
+
+- split_location(district):
+    Делит строку карточки "Київ, Печерський - Сьогодні о 12:00" на место и дату.
+
+- normalize_district(location):
+    Возвращает нормализованный ключ района Киева ("pecherskyi") по украинскому или русскому названию, либо None.
 """
 
 
@@ -35,9 +44,9 @@ def parse_ukr_date(date_str):
         "июля": "07", "августа": "08", "сентября": "09", "октября": "10", "ноября": "11", "декабря": "12"
     }
 
-    logger.info(f"Вхідний рядок дати: {date_str}")
+    logger.debug(f"Вхідний рядок дати: {date_str}")
     date_str = date_str.replace("р.", "").strip()
-    logger.info(f"Рядок після очищення: {date_str}")
+    logger.debug(f"Рядок після очищення: {date_str}")
 
     if date_str.startswith("Сьогодні") or date_str.startswith("Сегодня"):
         time_match = re.search(r'(\d{1,2}:\d{2})', date_str)
@@ -48,7 +57,7 @@ def parse_ukr_date(date_str):
     
         dt_local = datetime.strptime(f"{datetime.now().strftime('%Y-%m-%d')} {time_part}", "%Y-%m-%d %H:%M")
         dt_utc = dt_local.astimezone(timezone.utc)
-        logger.info(f"Повертаю datetime у UTC: {dt_utc}")
+        logger.debug(f"Повертаю datetime у UTC: {dt_utc}")
         return dt_utc
 
     parts = date_str.split()
@@ -60,7 +69,7 @@ def parse_ukr_date(date_str):
         if month:
             dt = datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
             dt_utc = dt.replace(tzinfo=timezone.utc)
-            logger.info(f"Повертаю datetime у UTC: {dt_utc}")
+            logger.debug(f"Повертаю datetime у UTC: {dt_utc}")
             return dt_utc
 
     logger.warning("Не вдалося розпізнати дату, повертаю None")
@@ -72,3 +81,56 @@ def resize_image_url(url, new_size="600x300"):
     if re.search(pattern, url):
         return re.sub(pattern, f"s={new_size}", url)
     return url
+
+
+def parse_price(price_str):
+    """
+    Достаёт цену из строки вида:
+    '15 000 грн.Договірна'
+    '9 000 грн.'
+    '9000грн'
+    """
+
+    if not price_str:
+        return None
+
+    # ищем первое число с пробелами или без
+    match = re.search(r"(\d[\d\s]*)", price_str)
+
+    if not match:
+        return None
+
+    # убираем пробелы внутри числа
+    number = re.sub(r"\s", "", match.group(1))
+
+    return int(number)
+
+
+def split_location(district):
+    if not district:
+        return "", ""
+    location, _, date_part = district.partition(" - ")
+    return location.strip(), date_part.strip()
+
+
+# Ключи районов Киева и основы их названий на украинском и русском
+DISTRICT_KEYS = {
+    "holosiivskyi": ("голосіїв", "голосеев"),
+    "darnytskyi": ("дарниц",),
+    "desnianskyi": ("деснян",),
+    "dniprovskyi": ("дніпровськ", "днепровск"),
+    "obolonskyi": ("оболон",),
+    "pecherskyi": ("печерськ", "печерск"),
+    "podilskyi": ("подільськ", "подольск"),
+    "sviatoshynskyi": ("святошин",),
+    "solomianskyi": ("солом'ян", "соломʼян", "соломенск"),
+    "shevchenkivskyi": ("шевченків", "шевченков"),
+}
+
+
+def normalize_district(location):
+    text = (location or "").lower().replace("’", "'")
+    for key, stems in DISTRICT_KEYS.items():
+        if any(stem in text for stem in stems):
+            return key
+    return None